@@ -1,24 +1,28 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
-from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
-from datetime import datetime, time
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from typing import Optional, List, Dict, Any, Tuple, Literal
+from datetime import datetime, date, timedelta
+from time import perf_counter
+import asyncio
 import json
 import os
-import re
 import xml.sax.saxutils as saxutils
 
 import sys
 sys.path.append('..')
 from models.usuario import Usuario
 from models.mensaje import Mensaje
-from models.conocimiento import (
-    BaseConocimiento, Horario, Evento, Carrera, DiaSemana, Servicio, Suspension
-)
+from models.conocimiento import AlmacenConocimiento
 from services.procesador_lenguaje import ProcesadorLenguajeNatural
 from services.gestor_respuestas import GestorRespuestas
-from services.base_datos import BaseDatos
+from services.base_datos import BaseDatos, crear_base_datos
+from services.base_datos_fragmentada import BaseDatosFragmentada
+from services.escritor_asincrono import EscritorAsincrono
+from services.cargador_conocimiento import CargadorConocimiento
+from services.resumenes import GRANULARIDADES
+from services.actualizador_conocimiento import ActualizadorConocimiento, PESTANAS, leer_intervalos
 
 try:
     from services.google_sheets_reader import GoogleSheetsReader
@@ -41,9 +45,42 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-base_datos = BaseDatos()
-base_conocimiento = BaseConocimiento()
-gestor_respuestas = GestorRespuestas(base_conocimiento)
+base_datos = crear_base_datos()
+
+
+def crear_escritor(bd) -> EscritorAsincrono:
+    return EscritorAsincrono(
+        bd,
+        intervalo_flush=float(os.getenv("CHATBOT_LOTE_INTERVALO_MS", "50")) / 1000,
+        tamano_lote=int(os.getenv("CHATBOT_LOTE_TAMANO", "256")),
+        durabilidad=os.getenv("CHATBOT_DURABILIDAD", "normal")
+    )
+
+
+# Con CHATBOT_FRAGMENTOS cada fragmento tiene su propio escritor y cola
+if isinstance(base_datos, BaseDatosFragmentada):
+    escritores = {nombre: crear_escritor(bd) for nombre, bd in base_datos.fragmentos.items()}
+else:
+    escritores = {None: crear_escritor(base_datos)}
+
+
+def escritor_para(telefono: str) -> EscritorAsincrono:
+    """Escritor del fragmento dueño del teléfono"""
+    if isinstance(base_datos, BaseDatosFragmentada):
+        return escritores[base_datos.anillo.nodo(telefono)]
+    return escritores[None]
+
+
+# Cada recarga publica una instantánea nueva; los handlers toman `actual` una sola vez
+almacen_conocimiento = AlmacenConocimiento()
+gestor_respuestas = GestorRespuestas(almacen_conocimiento)
+# La última versión cargada se guarda en disco y se restaura al arrancar, así que se puede
+# responder antes de la primera lectura de Sheets o si Google no está disponible
+cargador_conocimiento = CargadorConocimiento(
+    almacen_conocimiento,
+    ruta_instantanea=os.getenv("CHATBOT_CONOCIMIENTO_INSTANTANEA", os.path.join("datos", "conocimiento.pkl"))
+)
+cargador_conocimiento.cargar_instantanea()
 
 import os
 
@@ -74,7 +111,9 @@ if GOOGLE_SHEETS_AVAILABLE:
         
         if os.path.exists(CREDENTIALS_FILE):
             SHEET_ID = os.getenv("GOOGLE_SHEETS_ID", "1nEuZLDuowW5d9Li-91fO3DObAXTsuPYtTZM5vGpn_qo")
-            google_sheets_reader = GoogleSheetsReader(CREDENTIALS_FILE, SHEET_ID)
+            # GOOGLE_SHEETS_PESTANAS: pestañas a leer separadas por comas (por defecto las que se usan)
+            pestanas_hoja = [p.strip() for p in os.getenv("GOOGLE_SHEETS_PESTANAS", "").split(',') if p.strip()]
+            google_sheets_reader = GoogleSheetsReader(CREDENTIALS_FILE, SHEET_ID, tabs=pestanas_hoja or None)
             print("✅ Google Sheets Reader inicializado")
         else:
             print("⚠️ No credentials found")
@@ -84,226 +123,168 @@ if GOOGLE_SHEETS_AVAILABLE:
         print(f"❌ Error: {e}")
         google_sheets_reader = None
 
+
+def leer_pestanas(pestanas: List[str]) -> Dict[str, List[Dict]]:
+    """Lee las pestañas vencidas con una sola llamada a la API de Sheets"""
+    leidas = google_sheets_reader.batch_read([PESTANAS[pestana] for pestana in pestanas])
+    return {pestana: leidas[PESTANAS[pestana]] for pestana in pestanas}
+
+
+# Con Google Sheets disponible, la base de conocimiento se refresca en segundo plano:
+# CHATBOT_CONOCIMIENTO_TTL segundos por defecto, o por pestaña con
+# CHATBOT_CONOCIMIENTO_TTL_PESTANAS ('eventos=60,suspensiones=60')
+actualizador_conocimiento = None
+if google_sheets_reader:
+    actualizador_conocimiento = ActualizadorConocimiento(
+        leer_pestanas,
+        lambda datos: cargador_conocimiento.cargar(**datos),
+        ttl=float(os.getenv("CHATBOT_CONOCIMIENTO_TTL", "300")),
+        intervalos=leer_intervalos(os.getenv("CHATBOT_CONOCIMIENTO_TTL_PESTANAS", "")),
+        pestanas=[pestana for pestana, hoja in PESTANAS.items() if hoja in google_sheets_reader.tabs]
+    )
+
+class DeltaPestana(BaseModel):
+    agregar: List[Dict[str, Any]] = []
+    eliminar: List[Dict[str, Any]] = []
+
+FilasPestana = Optional[List[Dict[str, Any]]]
+DeltasPestanas = Optional[Dict[Literal['horarios', 'eventos', 'carreras', 'servicios', 'suspensiones'], DeltaPestana]]
+
 class MensajeEntrada(BaseModel):
     telefono: str
     contenido: str
     nombre: Optional[str] = None
-    horarios_sheets: Optional[List[Dict[str, Any]]] = None
-    eventos_sheets: Optional[List[Dict[str, Any]]] = None
-    carreras_sheets: Optional[List[Dict[str, Any]]] = None
-    servicios_sheets: Optional[List[Dict[str, Any]]] = None
-    suspensiones_sheets: Optional[List[Dict[str, Any]]] = None
+    horarios_sheets: FilasPestana = None
+    eventos_sheets: FilasPestana = None
+    carreras_sheets: FilasPestana = None
+    servicios_sheets: FilasPestana = None
+    suspensiones_sheets: FilasPestana = None
+    # hash_conocimiento de la última respuesta; con él basta mandar los deltas o nada
+    version_conocimiento: Optional[str] = None
+    deltas_sheets: DeltasPestanas = None
 
 class RespuestaAPI(BaseModel):
     success: bool
     respuesta: str
     usuario: Optional[dict] = None
     tipo_mensaje: Optional[str] = None
+    version_conocimiento: Optional[int] = None
+    hash_conocimiento: Optional[str] = None
+    # True si n8n debe mandar las pestañas completas en el siguiente mensaje
+    enviar_pestanas: bool = False
 
 
-def parse_fecha_google_sheets(fecha_str: str) -> Optional[datetime]:
-    if not fecha_str or str(fecha_str).strip() == '':
-        return None
-    
-    fecha_str = str(fecha_str).strip()
-    
-    meses_es = {
-        'enero': 1, 'febrero': 2, 'marzo': 3, 'abril': 4,
-        'mayo': 5, 'junio': 6, 'julio': 7, 'agosto': 8,
-        'septiembre': 9, 'octubre': 10, 'noviembre': 11, 'diciembre': 12
-    }
-    
-    try:
-        if ' de ' in fecha_str:
-            match = re.search(r'(\d+)\s+de\s+(\w+)', fecha_str)
-            if match:
-                dia = int(match.group(1))
-                mes_nombre = match.group(2).lower()
-                mes = meses_es.get(mes_nombre, 1)
-                
-                año = datetime.now().year
-                
-                if datetime.now().month > mes or (datetime.now().month == mes and datetime.now().day > dia):
-                    año += 1
-                
-                return datetime(año, mes, dia)
-        
-        elif '/' in fecha_str:
-            partes = fecha_str.split('/')
-            dia = int(partes[0])
-            mes = int(partes[1])
-            año = int(partes[2]) if len(partes) > 2 else datetime.now().year
-            return datetime(año, mes, dia)
-        
-        elif '-' in fecha_str and len(fecha_str) >= 10:
-            return datetime.fromisoformat(fecha_str.split(' ')[0])
-        
-    except Exception as e:
-        print(f"   ⚠️  Error parseando fecha '{fecha_str}': {e}")
-        return None
-    
-    return None
+# /webhook-raw no pasa por el modelo: sus pestañas y deltas se validan con estos
+_validar_filas = TypeAdapter(FilasPestana)
+_validar_deltas = TypeAdapter(DeltasPestanas)
 
 
-def cargar_datos_desde_sheets(horarios: List[Dict], eventos: List[Dict], carreras: List[Dict], servicios: List[Dict], suspensiones: List[Dict]):
-    
-    print("\n" + "="*60)
-    print("📊 CARGANDO DATOS DESDE GOOGLE SHEETS")
-    print("="*60)
-    
-    base_conocimiento.horarios.clear()
-    base_conocimiento.eventos.clear()
-    base_conocimiento.carreras.clear()
-    base_conocimiento.servicios.clear()
-    base_conocimiento.suspensiones.clear()
-    
-    if horarios:
-        print(f"\n📅 Procesando {len(horarios)} horarios...")
-        for h in horarios:
-            try:
-                dias_str = str(h.get('Dias', '')).lower()
-                dias_lista = []
-                
-                if 'lunes' in dias_str and 'viernes' in dias_str:
-                    dias_lista = [DiaSemana.LUNES, DiaSemana.MARTES, DiaSemana.MIERCOLES, 
-                                 DiaSemana.JUEVES, DiaSemana.VIERNES]
-                else:
-                    if 'lunes' in dias_str: dias_lista.append(DiaSemana.LUNES)
-                    if 'martes' in dias_str: dias_lista.append(DiaSemana.MARTES)
-                    if 'miercoles' in dias_str or 'miércoles' in dias_str: dias_lista.append(DiaSemana.MIERCOLES)
-                    if 'jueves' in dias_str: dias_lista.append(DiaSemana.JUEVES)
-                    if 'viernes' in dias_str: dias_lista.append(DiaSemana.VIERNES)
-                    if 'sabado' in dias_str or 'sábado' in dias_str: dias_lista.append(DiaSemana.SABADO)
-                    if 'domingo' in dias_str: dias_lista.append(DiaSemana.DOMINGO)
-                
-                if not dias_lista:
-                    dias_lista = [DiaSemana.LUNES]
-                
-                hora_inicio_str = str(h.get('Hora_Inicio', '08:00'))
-                hora_fin_str = str(h.get('Hora_Fin', '20:00'))
-                
-                h_inicio_parts = hora_inicio_str.split(':')
-                h_fin_parts = hora_fin_str.split(':')
-                
-                h_inicio = time(int(h_inicio_parts[0]), int(h_inicio_parts[1]) if len(h_inicio_parts) > 1 else 0)
-                h_fin = time(int(h_fin_parts[0]), int(h_fin_parts[1]) if len(h_fin_parts) > 1 else 0)
-                
-                horario = Horario(
-                    servicio=str(h.get('Servicio', 'Servicio')),
-                    dias=dias_lista,
-                    hora_inicio=h_inicio,
-                    hora_fin=h_fin,
-                    notas=str(h.get('Notas', ''))
-                )
-                base_conocimiento.agregar_horario(horario)
-                print(f"   ✅ {horario.servicio}")
-                
-            except Exception as e:
-                print(f"   ❌ Error procesando horario: {e}")
-    
-    if eventos:
-        print(f"\n🎉 Procesando {len(eventos)} eventos...")
-        for e in eventos:
-            try:
-                fecha_inicio_str = str(e.get('Fecha_Inicio', ''))
-                fecha_fin_str = str(e.get('Fecha_Fin', ''))
-                
-                fecha_inicio = parse_fecha_google_sheets(fecha_inicio_str)
-                fecha_fin = parse_fecha_google_sheets(fecha_fin_str) if fecha_fin_str else fecha_inicio
-                
-                if fecha_inicio:
-                    evento = Evento(
-                        nombre=str(e.get('Nombre', 'Evento')),
-                        descripcion=str(e.get('Descripcion', '')),
-                        fecha_inicio=fecha_inicio,
-                        fecha_fin=fecha_fin or fecha_inicio,
-                        lugar=str(e.get('Lugar', '')),
-                        categoria=str(e.get('Categoria', 'General'))
-                    )
-                    base_conocimiento.agregar_evento(evento)
-                    print(f"   ✅ {evento.nombre} ({fecha_inicio.strftime('%d/%m/%Y')})")
-                else:
-                    print(f"   ⚠️  No se pudo parsear fecha para: {e.get('Nombre', 'Evento')}")
-                        
-            except Exception as err:
-                print(f"   ❌ Error procesando evento: {err}")
+def _ms_desde(inicio: float) -> float:
+    return round((perf_counter() - inicio) * 1000, 3)
+
+
+def sincronizar_conocimiento(pestanas: Dict[str, Optional[List[Dict]]], token: Optional[str],
+                             deltas: Optional[Dict[str, Dict[str, List[Dict]]]]) -> bool:
+    """Aplica lo que n8n mandó de Sheets y devuelve si debe mandar las pestañas completas.
+
+    - Pestañas completas: se cargan (si no son las mismas de la última vez); las que no
+      llegaron (None) se dejan como están.
+    - Deltas: se aplican solo si `token` es el hash del contenido vigente.
+    - Solo el token (o nada): no se carga nada; si no coincide con el hash vigente, se
+      piden las pestañas completas para el siguiente mensaje.
+
+    Con el actualizador en segundo plano la fuente es Sheets, así que nunca se piden.
+    """
+    if any(pestanas.values()):
+        cargador_conocimiento.cargar_payload(*(pestanas.get(p) for p in PESTANAS))
+        return False
+    if token is not None:
+        if deltas:
+            if cargador_conocimiento.aplicar_deltas(token, deltas) is not None:
+                return False
+        elif token == almacen_conocimiento.actual.hash_contenido:
+            return False
+    return actualizador_conocimiento is None
+
+
+async def atender_mensaje(telefono: str, contenido: str, nombre: Optional[str],
+                          tiempos: Dict[str, float]) -> Tuple[Usuario, Mensaje, str]:
+    """Clasifica, guarda y responde un mensaje entrante midiendo cada etapa.
+
+    El mensaje del usuario se guarda con su tipo y entidades. Ambos mensajes llevan en
+    `tiempos` lo que tardó cada etapa (la carga de Sheets la mide quien llama): el del
+    usuario, las anteriores a encolarlo; la respuesta del bot, todas. `encolado_ms` es lo
+    que tomó entregar usuario y mensaje al escritor; la escritura a disco ocurre después,
+    en el lote, y no cabe en los propios registros. Con CHATBOT_DURABILIDAD=fsync no
+    regresa hasta que ambos mensajes están en disco.
+    """
+    escritor = escritor_para(telefono)
+    cargador_conocimiento.renovar_fechas()
+    conocimiento = almacen_conocimiento.actual
     
-    if carreras:
-        print(f"\n🎓 Procesando {len(carreras)} carreras...")
-        
-        for c in carreras:
-            try:
-                duracion = c.get('Duracion_Semestres', 8)
-                if isinstance(duracion, str):
-                    duracion = int(duracion)
-                
-                carrera = Carrera(
-                    nombre=str(c.get('Nombre', 'Carrera')).strip(),
-                    duracion_semestres=duracion,
-                    descripcion=str(c.get('Descripción', '') or c.get('Descripción ', '')).strip(),
-                    coordinador=str(c.get('Coordinador', '')).strip()
-                )
-                base_conocimiento.agregar_carrera(carrera)
-                print(f"   ✅ {carrera.nombre}")
-                
-            except Exception as e:
-                print(f"   ❌ Error procesando carrera: {e}")
+    inicio = perf_counter()
+    mensaje_usuario = Mensaje(telefono=telefono, contenido=contenido, es_bot=False)
+    intenciones = gestor_respuestas.clasificar(mensaje_usuario)
+    tiempos['clasificacion_ms'] = _ms_desde(inicio)
     
-    if servicios:
-        print(f"\n📋 Procesando {len(servicios)} servicios...")
-        for s in servicios:
-            try:
-                nombre = str(s.get('Nombre', 'Servicio')).strip()
-                tipo = str(s.get('Tipo', 'Servicio')).strip().lower()
-                
-                if not nombre or nombre == '':
-                    continue
-                
-                servicio = Servicio(
-                    nombre=nombre,
-                    descripcion=str(s.get('Descripcion', '')).strip(),
-                    pagos=str(s.get('Pagos', '')).strip(),
-                    dias=str(s.get('Dias', '')).strip(),
-                    lugar=str(s.get('Lugar', '')).strip()
-                )
-                base_conocimiento.agregar_servicio(servicio)
-                print(f"   ✅ [{tipo.upper()}] {servicio.nombre}")
-            except Exception as e:
-                print(f"   ❌ Error procesando servicio: {e}")
+    inicio = perf_counter()
+    usuario = escritor.obtener_usuario(telefono)
+    if not usuario:
+        usuario = Usuario(telefono=telefono, nombre=nombre)
+        print(f"✅ Usuario nuevo: {telefono}")
+    else:
+        usuario.actualizar_interaccion()
+    mensaje_usuario.tiempos = dict(tiempos)
+    confirmaciones = [
+        await escritor.guardar_usuario(usuario),
+        await escritor.guardar_mensaje(mensaje_usuario)
+    ]
+    tiempos['encolado_ms'] = _ms_desde(inicio)
     
-    if suspensiones:
-        print(f"\n⏸️ Procesando {len(suspensiones)} suspensiones...")
-        for susp in suspensiones:
-            try:
-                suspension = Suspension(
-                    fecha=str(susp.get('Fecha', '')).strip(),
-                    suspension=str(susp.get('Suspension', '')).strip()
-                )
-                base_conocimiento.agregar_suspension(suspension)
-                print(f"   ✅ {suspension.fecha}: {suspension.suspension}")
-            except Exception as e:
-                print(f"   ❌ Error procesando suspensión: {e}")
+    inicio = perf_counter()
+    respuesta_texto = gestor_respuestas.generar_respuesta(mensaje_usuario, intenciones, conocimiento)
+    tiempos['respuesta_ms'] = _ms_desde(inicio)
     
-    print("\n" + "="*60)
-    print(f"✅ DATOS CARGADOS: {len(base_conocimiento.horarios)} horarios, "
-          f"{len(base_conocimiento.eventos)} eventos, {len(base_conocimiento.carreras)} carreras, "
-          f"{len(base_conocimiento.servicios)} servicios, {len(base_conocimiento.suspensiones)} suspensiones")
-    print("="*60 + "\n")
+    mensaje_bot = Mensaje(telefono=telefono, contenido=respuesta_texto, es_bot=True)
+    mensaje_bot.tipo = mensaje_usuario.tipo
+    mensaje_bot.tiempos = tiempos
+    confirmaciones.append(await escritor.guardar_mensaje(mensaje_bot))
+    # Falla (y el webhook no confirma) si el lote no se pudo escribir
+    await asyncio.gather(*(futuro for futuro in confirmaciones if futuro is not None))
+    return usuario, mensaje_usuario, respuesta_texto
+
+
+@app.on_event("startup")
+async def iniciar_escritor():
+    for escritor in escritores.values():
+        await escritor.iniciar()
+    if actualizador_conocimiento:
+        await actualizador_conocimiento.iniciar()
+
+
+@app.on_event("shutdown")
+async def cerrar_base_datos():
+    if actualizador_conocimiento:
+        await actualizador_conocimiento.detener()
+    for escritor in escritores.values():
+        await escritor.detener()
+    base_datos.cerrar()
 
 
 @app.get("/")
 async def root():
+    conocimiento = almacen_conocimiento.actual
     return {
         "mensaje": "API Chatbot Universitario con Google Sheets",
         "version": "2.2.0",
         "status": "activo",
         "google_sheets_disponible": GOOGLE_SHEETS_AVAILABLE and google_sheets_reader is not None,
         "datos_cargados": {
-            "horarios": len(base_conocimiento.horarios),
-            "eventos": len(base_conocimiento.eventos),
-            "carreras": len(base_conocimiento.carreras),
-            "servicios": len(base_conocimiento.servicios),
-            "suspensiones": len(base_conocimiento.suspensiones)
+            "horarios": len(conocimiento.horarios),
+            "eventos": len(conocimiento.eventos),
+            "carreras": len(conocimiento.carreras),
+            "servicios": len(conocimiento.servicios),
+            "suspensiones": len(conocimiento.suspensiones)
         }
     }
 
@@ -336,40 +317,12 @@ async def webhook_whatsapp_twilio(request: Request):
                 media_type="application/xml"
             )
         
-        if google_sheets_reader:
-            try:
-                print("📊 Leyendo datos de Google Sheets...")
-                all_data = google_sheets_reader.get_all_data()
-                cargar_datos_desde_sheets(
-                    all_data['horarios'],
-                    all_data['eventos'],
-                    all_data['carreras'],
-                    all_data['servicios'],
-                    all_data.get('suspensiones', [])
-                )
-            except Exception as e:
-                print(f"⚠️  Error leyendo Google Sheets: {e}")
-        
-        usuario = base_datos.obtener_usuario(telefono)
-        if not usuario:
-            usuario = Usuario(telefono=telefono, nombre=telefono)
-            base_datos.guardar_usuario(usuario)
-            print(f"✅ Usuario nuevo: {telefono}")
-        else:
-            usuario.actualizar_interaccion()
-            base_datos.guardar_usuario(usuario)
-        
-        mensaje_usuario = Mensaje(telefono=telefono, contenido=message_body, es_bot=False)
-        base_datos.guardar_mensaje(mensaje_usuario)
-        
-        respuesta_texto = gestor_respuestas.generar_respuesta(mensaje_usuario)
+        # La base de conocimiento la mantiene al día el actualizador en segundo plano
+        _, _, respuesta_texto = await atender_mensaje(telefono, message_body, telefono, {})
         print(f"🤖 Respuesta: {respuesta_texto[:100]}...\n")
         
         respuesta_segura = saxutils.escape(respuesta_texto)
         
-        mensaje_bot = Mensaje(telefono=telefono, contenido=respuesta_texto, es_bot=True)
-        base_datos.guardar_mensaje(mensaje_bot)
-        
         xml_response = f"""<?xml version="1.0" encoding="UTF-8"?>
 <Response>
     <Message>{respuesta_segura}</Message>
@@ -395,41 +348,34 @@ async def webhook_whatsapp(datos: MensajeEntrada):
     try:
         print(f"\n📨 Mensaje de {datos.telefono}: {datos.contenido}")
         
-        if datos.horarios_sheets or datos.eventos_sheets or datos.carreras_sheets or datos.servicios_sheets or datos.suspensiones_sheets:
-            cargar_datos_desde_sheets(
-                datos.horarios_sheets or [],
-                datos.eventos_sheets or [],
-                datos.carreras_sheets or [],
-                datos.servicios_sheets or [],
-                datos.suspensiones_sheets or []
-            )
-        
-        telefono = datos.telefono
-        contenido = datos.contenido
-        
-        usuario = base_datos.obtener_usuario(telefono)
-        if not usuario:
-            usuario = Usuario(telefono=telefono, nombre=datos.nombre)
-            base_datos.guardar_usuario(usuario)
-            print(f"✅ Usuario nuevo: {telefono}")
-        else:
-            usuario.actualizar_interaccion()
-            base_datos.guardar_usuario(usuario)
-        
-        mensaje_usuario = Mensaje(telefono=telefono, contenido=contenido, es_bot=False)
-        base_datos.guardar_mensaje(mensaje_usuario)
+        inicio = perf_counter()
+        enviar_pestanas = sincronizar_conocimiento(
+            {
+                'horarios': datos.horarios_sheets,
+                'eventos': datos.eventos_sheets,
+                'carreras': datos.carreras_sheets,
+                'servicios': datos.servicios_sheets,
+                'suspensiones': datos.suspensiones_sheets
+            },
+            datos.version_conocimiento,
+            {pestana: delta.model_dump() for pestana, delta in (datos.deltas_sheets or {}).items()}
+        )
+        tiempos = {'carga_sheets_ms': _ms_desde(inicio)}
         
-        respuesta_texto = gestor_respuestas.generar_respuesta(mensaje_usuario)
+        usuario, mensaje_usuario, respuesta_texto = await atender_mensaje(
+            datos.telefono, datos.contenido, datos.nombre, tiempos
+        )
         print(f"🤖 Respuesta: {respuesta_texto[:80]}...")
-        
-        mensaje_bot = Mensaje(telefono=telefono, contenido=respuesta_texto, es_bot=True)
-        base_datos.guardar_mensaje(mensaje_bot)
+        conocimiento = almacen_conocimiento.actual
         
         return RespuestaAPI(
             success=True,
             respuesta=respuesta_texto,
             usuario=usuario.to_dict(),
-            tipo_mensaje=mensaje_usuario.tipo.value if mensaje_usuario.tipo else None
+            tipo_mensaje=mensaje_usuario.tipo.value if mensaje_usuario.tipo else None,
+            version_conocimiento=conocimiento.version,
+            hash_conocimiento=conocimiento.hash_contenido,
+            enviar_pestanas=enviar_pestanas
         )
         
     except Exception as e:
@@ -443,44 +389,46 @@ async def webhook_raw(request: Request):
     try:
         body = await request.json()
         
-        print(f"\n📨 Datos RAW recibidos:")
-        print(json.dumps(body, indent=2))
-        
         telefono = body.get('telefono', '')
         contenido = body.get('contenido', '')
         nombre = body.get('nombre', '')
         
-        horarios = body.get('horarios_sheets', [])
-        eventos = body.get('eventos_sheets', [])
-        carreras = body.get('carreras_sheets', [])
-        servicios = body.get('servicios_sheets', [])
-        suspensiones = body.get('suspensiones_sheets', [])
-        
-        if horarios or eventos or carreras or servicios or suspensiones:
-            cargar_datos_desde_sheets(horarios, eventos, carreras, servicios, suspensiones)
-        
-        usuario = base_datos.obtener_usuario(telefono)
-        if not usuario:
-            usuario = Usuario(telefono=telefono, nombre=nombre)
-            base_datos.guardar_usuario(usuario)
-        else:
-            usuario.actualizar_interaccion()
-            base_datos.guardar_usuario(usuario)
+        try:
+            horarios, eventos, carreras, servicios, suspensiones = (
+                _validar_filas.validate_python(body.get(f'{pestana}_sheets')) for pestana in PESTANAS
+            )
+            deltas = _validar_deltas.validate_python(body.get('deltas_sheets'))
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
         
-        mensaje_usuario = Mensaje(telefono=telefono, contenido=contenido, es_bot=False)
-        base_datos.guardar_mensaje(mensaje_usuario)
+        print(f"\n📨 Datos RAW de {telefono}: {contenido} ({len(horarios or [])} horarios, {len(eventos or [])} eventos, "
+              f"{len(carreras or [])} carreras, {len(servicios or [])} servicios, {len(suspensiones or [])} suspensiones)")
         
-        respuesta_texto = gestor_respuestas.generar_respuesta(mensaje_usuario)
+        inicio = perf_counter()
+        enviar_pestanas = sincronizar_conocimiento(
+            {
+                'horarios': horarios, 'eventos': eventos, 'carreras': carreras,
+                'servicios': servicios, 'suspensiones': suspensiones
+            },
+            body.get('version_conocimiento'),
+            {pestana: delta.model_dump() for pestana, delta in (deltas or {}).items()}
+        )
+        tiempos = {'carga_sheets_ms': _ms_desde(inicio)}
         
-        mensaje_bot = Mensaje(telefono=telefono, contenido=respuesta_texto, es_bot=True)
-        base_datos.guardar_mensaje(mensaje_bot)
+        usuario, _, respuesta_texto = await atender_mensaje(telefono, contenido, nombre, tiempos)
+        conocimiento = almacen_conocimiento.actual
         
         return {
             "success": True,
             "respuesta": respuesta_texto,
-            "usuario": usuario.to_dict()
+            "usuario": usuario.to_dict(),
+            "version_conocimiento": conocimiento.version,
+            "hash_conocimiento": conocimiento.hash_contenido,
+            "enviar_pestanas": enviar_pestanas
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error: {e}")
         import traceback
@@ -489,27 +437,80 @@ async def webhook_raw(request: Request):
 
 @app.get("/usuarios/{telefono}")
 async def obtener_usuario(telefono: str):
-    usuario = base_datos.obtener_usuario(telefono)
+    usuario = escritor_para(telefono).obtener_usuario(telefono)
     if not usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     return usuario.to_dict()
 
+@app.get("/historial/buscar")
+async def buscar_historial(q: str, telefono: Optional[str] = None, desde: Optional[date] = None,
+                           hasta: Optional[date] = None, limite: int = 20):
+    """Busca en el contenido de los mensajes; declarada antes de /historial/{telefono}"""
+    resultados = base_datos.buscar_mensajes(q, telefono, desde, hasta, limite)
+    return {
+        "consulta": q,
+        "total_resultados": len(resultados),
+        "resultados": [{**m.to_dict(), "puntaje": round(puntaje, 4)} for m, puntaje in resultados]
+    }
+
 @app.get("/historial/{telefono}")
-async def obtener_historial(telefono: str, limite: int = 20):
-    mensajes = base_datos.obtener_mensajes_usuario(telefono, limite)
+async def obtener_historial(telefono: str, limite: int = 20, antes_de: Optional[str] = None,
+                            despues_de: Optional[str] = None):
+    """Historial paginado: usa `anterior`/`siguiente` de la respuesta como antes_de/despues_de"""
+    # Incluye los mensajes que siguen en la cola del escritor
+    await escritor_para(telefono).sincronizar()
+    mensajes = base_datos.obtener_pagina_mensajes(telefono, limite, antes_de, despues_de)
+    if mensajes is None:
+        raise HTTPException(status_code=404, detail="Mensaje de referencia no encontrado")
     return {
         "telefono": telefono,
         "total_mensajes": len(mensajes),
-        "mensajes": [m.to_dict() for m in mensajes]
+        "mensajes": [m.to_dict() for m in mensajes],
+        "anterior": mensajes[0].id if mensajes else None,
+        "siguiente": mensajes[-1].id if mensajes else None
     }
 
+@app.get("/exportar/mensajes")
+async def exportar_mensajes(telefono: Optional[str] = None, fecha: Optional[date] = None):
+    """Exporta como NDJSON (un mensaje por línea) el historial de un usuario o de un día"""
+    if telefono is None and fecha is None:
+        raise HTTPException(status_code=400, detail="Indica telefono, fecha o ambos")
+    if telefono is not None:
+        await escritor_para(telefono).sincronizar()
+    if fecha is None:
+        mensajes = base_datos.iterar_mensajes_usuario(telefono)
+    else:
+        mensajes = base_datos.iterar_mensajes(fecha, fecha, telefono)
+    lineas = (json.dumps(m.to_dict(), ensure_ascii=False) + "\n" for m in mensajes)
+    return StreamingResponse(lineas, media_type="application/x-ndjson")
+
 @app.get("/estadisticas")
-async def obtener_estadisticas():
-    return base_datos.obtener_estadisticas()
+async def obtener_estadisticas(desde: Optional[date] = None, hasta: Optional[date] = None,
+                               granularidad: Optional[str] = None):
+    """Sin parámetros da los totales; con rango o granularidad, la serie por día, semana o mes"""
+    if desde is None and hasta is None and granularidad is None:
+        return base_datos.obtener_estadisticas()
+    granularidad = granularidad or 'dia'
+    if granularidad not in GRANULARIDADES:
+        raise HTTPException(status_code=400, detail=f"granularidad debe ser una de: {', '.join(GRANULARIDADES)}")
+    hasta = hasta or datetime.now().date()
+    desde = desde or hasta - timedelta(days=30)
+    if desde > hasta:
+        raise HTTPException(status_code=400, detail="desde debe ser anterior o igual a hasta")
+    periodos = base_datos.obtener_resumenes(desde, hasta, granularidad)
+    return {
+        "desde": desde.isoformat(),
+        "hasta": hasta.isoformat(),
+        "granularidad": granularidad,
+        "total_mensajes": sum(p['mensajes'] for p in periodos),
+        "periodos": periodos
+    }
 
 @app.get("/eventos")
 async def listar_eventos(proximos_dias: int = 60):
-    eventos = base_conocimiento.obtener_eventos_proximos(proximos_dias)
+    cargador_conocimiento.renovar_fechas()
+    conocimiento = almacen_conocimiento.actual
+    eventos = conocimiento.obtener_eventos_proximos(proximos_dias)
     return {
         "total": len(eventos),
         "eventos": [
@@ -528,6 +529,7 @@ async def listar_eventos(proximos_dias: int = 60):
 
 @app.get("/horarios")
 async def listar_horarios():
+    conocimiento = almacen_conocimiento.actual
     return {
         servicio: {
             "dias": [d.value for d in horario.dias],
@@ -535,22 +537,24 @@ async def listar_horarios():
             "hora_fin": horario.hora_fin.strftime("%H:%M"),
             "notas": horario.notas
         }
-        for servicio, horario in base_conocimiento.horarios.items()
+        for servicio, horario in conocimiento.horarios.items()
     }
 
 @app.get("/carreras")
 async def listar_carreras():
+    conocimiento = almacen_conocimiento.actual
     return {
         nombre: {
             "duracion_semestres": carrera.duracion_semestres,
             "descripcion": carrera.descripcion,
             "coordinador": carrera.coordinador
         }
-        for nombre, carrera in base_conocimiento.carreras.items()
+        for nombre, carrera in conocimiento.carreras.items()
     }
 
 @app.get("/servicios")
 async def listar_servicios():
+    conocimiento = almacen_conocimiento.actual
     return {
         nombre: {
             "descripcion": servicio.descripcion,
@@ -558,35 +562,43 @@ async def listar_servicios():
             "dias": servicio.dias,
             "lugar": servicio.lugar
         }
-        for nombre, servicio in base_conocimiento.servicios.items()
+        for nombre, servicio in conocimiento.servicios.items()
     }
 
 @app.get("/suspensiones")
 async def listar_suspensiones():
+    conocimiento = almacen_conocimiento.actual
     return {
-        "total": len(base_conocimiento.suspensiones),
+        "total": len(conocimiento.suspensiones),
         "suspensiones": [
             {
                 "fecha": s.fecha,
                 "suspension": s.suspension
             }
-            for s in base_conocimiento.suspensiones
+            for s in conocimiento.suspensiones
         ]
     }
 
 @app.get("/health")
 async def health_check():
+    conocimiento = almacen_conocimiento.actual
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "google_sheets_disponible": GOOGLE_SHEETS_AVAILABLE and google_sheets_reader is not None,
+        "conocimiento": cargador_conocimiento.estado(),
+        "escritura": {
+            "pendientes": sum(e.estado()['pendientes'] for e in escritores.values()),
+            "fallos": sum(e.fallos for e in escritores.values())
+        },
         "datos_en_memoria": {
-            "horarios": len(base_conocimiento.horarios),
-            "eventos": len(base_conocimiento.eventos),
-            "carreras": len(base_conocimiento.carreras),
-            "servicios": len(base_conocimiento.servicios),
-            "suspensiones": len(base_conocimiento.suspensiones)
-        }
+            "horarios": len(conocimiento.horarios),
+            "eventos": len(conocimiento.eventos),
+            "carreras": len(conocimiento.carreras),
+            "servicios": len(conocimiento.servicios),
+            "suspensiones": len(conocimiento.suspensiones)
+        },
+        "actualizacion_sheets": actualizador_conocimiento.estado() if actualizador_conocimiento else None
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,197 @@
+"""
+Benchmark de almacenamiento: genera usuarios y mensajes sintéticos y mide las operaciones
+principales de cada backend (ops/s, latencia p50/p99 y memoria pico) en JSON.
+
+Uso:
+    python benchmark_base_datos.py --tamanos 1000,100000,1000000 --salida benchmark.json
+    python benchmark_base_datos.py --tamanos 1000 --backends json --operaciones 200
+
+Cada combinación backend/tamaño corre en un proceso nuevo, así la memoria pico (RSS)
+de una no contamina a la siguiente. El progreso se imprime en stderr; el resultado en
+JSON va a stdout o al archivo de --salida.
+"""
+
+import argparse
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.append('.')
+
+from models.usuario import Usuario
+from models.mensaje import Mensaje
+from services.base_datos import crear_base_datos
+
+PALABRAS = (
+    "hola horario biblioteca credencial tramite carrera ingenieria examen inscripciones "
+    "gracias cuando donde beca servicio social constancia titulo semestre evento clases"
+).split()
+TAMANO_LOTE = 10000
+DIAS_HISTORIAL = 120
+DIAS_RETENCION = 90
+
+
+def progreso(texto: str):
+    print(texto, file=sys.stderr, flush=True)
+
+
+def telefono_sintetico(i: int) -> str:
+    return f"52155{i:08d}"
+
+
+def mensaje_sintetico(azar: random.Random, usuarios: int, ahora: datetime) -> Mensaje:
+    mensaje = Mensaje(
+        telefono=telefono_sintetico(azar.randrange(usuarios)),
+        contenido=' '.join(azar.choices(PALABRAS, k=azar.randint(2, 12))),
+        es_bot=azar.random() < 0.5
+    )
+    mensaje.timestamp = ahora - timedelta(seconds=azar.randrange(DIAS_HISTORIAL * 24 * 60 * 60))
+    return mensaje
+
+
+def poblar(bd, azar: random.Random, usuarios: int, mensajes: int) -> float:
+    """Carga los datos sintéticos con guardar_lote; devuelve los segundos que tomó"""
+    inicio = time.perf_counter()
+    for desde in range(0, usuarios, TAMANO_LOTE):
+        bd.guardar_lote(
+            [Usuario(telefono_sintetico(i), nombre=f"Usuario {i}") for i in range(desde, min(desde + TAMANO_LOTE, usuarios))],
+            []
+        )
+    ahora = Mensaje('0', '').timestamp
+    for desde in range(0, mensajes, TAMANO_LOTE):
+        lote = [mensaje_sintetico(azar, usuarios, ahora) for _ in range(min(TAMANO_LOTE, mensajes - desde))]
+        bd.guardar_lote([], lote)
+    bd.flush()
+    return time.perf_counter() - inicio
+
+
+def medir(funcion, repeticiones: int, pasada_memoria: bool = True) -> dict:
+    """Ejecuta `funcion(i)` varias veces y resume latencias y memoria pico.
+
+    La memoria se mide en una pasada aparte con tracemalloc para no inflar los tiempos;
+    con `pasada_memoria=False` (operaciones que no se pueden repetir) se mide en la misma.
+    """
+    if not pasada_memoria:
+        tracemalloc.start()
+    latencias = []
+    for i in range(repeticiones):
+        inicio = time.perf_counter_ns()
+        funcion(i)
+        latencias.append(time.perf_counter_ns() - inicio)
+
+    if pasada_memoria:
+        tracemalloc.start()
+        for i in range(min(repeticiones, 50)):
+            funcion(repeticiones + i)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencias.sort()
+    total = sum(latencias) / 1e9
+    return {
+        'repeticiones': repeticiones,
+        'ops_por_segundo': round(repeticiones / total, 1) if total else None,
+        'p50_ms': round(latencias[len(latencias) // 2] / 1e6, 4),
+        'p99_ms': round(latencias[int((len(latencias) - 1) * 0.99)] / 1e6, 4),
+        'memoria_pico_kb': round(pico / 1024, 1)
+    }
+
+
+def ejecutar_corrida(backend: str, tamano: int, operaciones: int, semilla: int) -> dict:
+    """Mide un backend con `tamano` mensajes en un directorio temporal"""
+    azar = random.Random(semilla)
+    usuarios = max(tamano // 10, 10)
+    ruta = tempfile.mkdtemp(prefix=f"benchmark_{backend}_")
+    try:
+        bd = crear_base_datos(backend, ruta)
+        progreso(f"   [{backend} {tamano}] cargando {usuarios} usuarios y {tamano} mensajes...")
+        segundos_carga = poblar(bd, azar, usuarios, tamano)
+        ahora = Mensaje('0', '').timestamp
+
+        def guardar_usuario(_):
+            usuario = Usuario(telefono_sintetico(azar.randrange(usuarios)), nombre="Actualizado")
+            bd.guardar_usuario(usuario)
+
+        resultados = {}
+        pruebas = [
+            ('guardar_mensaje', lambda _: bd.guardar_mensaje(mensaje_sintetico(azar, usuarios, ahora))),
+            ('guardar_usuario', guardar_usuario),
+            ('obtener_usuario', lambda _: bd.obtener_usuario(telefono_sintetico(azar.randrange(usuarios)))),
+            ('obtener_mensajes_usuario',
+             lambda _: bd.obtener_mensajes_usuario(telefono_sintetico(azar.randrange(usuarios)), 20)),
+            ('obtener_estadisticas', lambda _: bd.obtener_estadisticas()),
+        ]
+        for nombre, funcion in pruebas:
+            progreso(f"   [{backend} {tamano}] {nombre}")
+            resultados[nombre] = medir(funcion, operaciones)
+
+        # Es destructiva: se mide una sola vez, al final
+        progreso(f"   [{backend} {tamano}] limpiar_mensajes_antiguos")
+        eliminados = []
+        resultados['limpiar_mensajes_antiguos'] = medir(
+            lambda _: eliminados.append(bd.limpiar_mensajes_antiguos(DIAS_RETENCION)), 1, pasada_memoria=False
+        )
+        resultados['limpiar_mensajes_antiguos']['mensajes_eliminados'] = eliminados[0]
+
+        bd.cerrar()
+        return {
+            'backend': backend,
+            'tamano': tamano,
+            'usuarios': usuarios,
+            'carga_segundos': round(segundos_carga, 2),
+            'carga_mensajes_por_segundo': round(tamano / segundos_carga, 1),
+            # ru_maxrss está en KB en Linux y en bytes en macOS
+            'rss_pico_mb': round(
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1
+            ),
+            'operaciones': resultados
+        }
+    finally:
+        shutil.rmtree(ruta, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de los backends de BaseDatos")
+    parser.add_argument('--tamanos', default='1000,100000,1000000',
+                        help="Cantidades de mensajes separadas por comas (usuarios = mensajes / 10)")
+    parser.add_argument('--backends', default='json,sqlite', help="Backends separados por comas")
+    parser.add_argument('--operaciones', type=int, default=1000, help="Repeticiones por operación")
+    parser.add_argument('--semilla', type=int, default=42, help="Semilla de los datos sintéticos")
+    parser.add_argument('--salida', help="Archivo donde guardar el JSON (por defecto stdout)")
+    args = parser.parse_args()
+
+    reporte = {
+        'fecha': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'semilla': args.semilla,
+        'resultados': []
+    }
+    contexto = multiprocessing.get_context('spawn')
+    for tamano in (int(t) for t in args.tamanos.split(',')):
+        for backend in args.backends.split(','):
+            progreso(f"▶️  {backend} con {tamano} mensajes")
+            with contexto.Pool(1) as pool:
+                reporte['resultados'].append(
+                    pool.apply(ejecutar_corrida, (backend.strip(), tamano, args.operaciones, args.semilla))
+                )
+
+    salida = json.dumps(reporte, ensure_ascii=False, indent=2)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            f.write(salida + '\n')
+        progreso(f"✅ Resultados en {args.salida}")
+    else:
+        print(salida)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
 from datetime import datetime, time, timedelta
+from types import MappingProxyType
 from typing import List, Dict, Optional
 from enum import Enum
 import re
+import threading
 
 class DiaSemana(Enum):
     
@@ -164,6 +166,9 @@ class Suspension:
     def obtener_info(self) -> str:
         return f"📅 {self.fecha}\n{self.suspension}"
 
+# Colecciones de una BaseConocimiento que se congelan al derivar una instantánea
+COLECCIONES = ('horarios', 'eventos', 'carreras', 'tramites', 'servicios', 'suspensiones')
+
 class BaseConocimiento:
 
     
@@ -174,6 +179,32 @@ class BaseConocimiento:
         self.tramites: Dict[str, str] = {}
         self.servicios = {}
         self.suspensiones: List[Suspension] = []
+        # Número de instantánea publicada en un AlmacenConocimiento (0 si nunca se publicó)
+        self.version = 0
+        # Hash del contenido de las pestañas de las que se cargó (None si no viene de la hoja)
+        self.hash_contenido: Optional[str] = None
+    
+    def derivar(self, **colecciones) -> 'BaseConocimiento':
+        """Instantánea de solo lectura con las colecciones indicadas reemplazadas.
+        
+        Todas sus colecciones quedan congeladas (los diccionarios como MappingProxyType y
+        las listas como tuplas), así que los agregar_* fallan sobre la instantánea. Las
+        que no se pasan se comparten con esta base si ya estaban congeladas; si no, se
+        copian para que modificar esta base no cambie la instantánea.
+        """
+        desconocidas = set(colecciones) - set(COLECCIONES)
+        if desconocidas:
+            raise ValueError(f"Colección desconocida: {', '.join(sorted(desconocidas))}")
+        nueva = BaseConocimiento.__new__(BaseConocimiento)
+        nueva.__dict__.update(self.__dict__)
+        for nombre in COLECCIONES:
+            coleccion = colecciones.get(nombre, getattr(self, nombre))
+            if isinstance(coleccion, dict):
+                coleccion = MappingProxyType(coleccion if nombre in colecciones else dict(coleccion))
+            elif isinstance(coleccion, list):
+                coleccion = tuple(coleccion)
+            setattr(nueva, nombre, coleccion)
+        return nueva
         
     def agregar_horario(self, horario: Horario):
        
@@ -318,4 +349,31 @@ class BaseConocimiento:
                 dias_hasta = 7
             return self.obtener_suspension(hoy + timedelta(days=dias_hasta))
         
-        return None
\ No newline at end of file
+        return None
+
+
+class AlmacenConocimiento:
+    """Guarda la instantánea vigente de la base de conocimiento.
+    
+    Una recarga arma una BaseConocimiento nueva aparte (ver BaseConocimiento.derivar) y
+    la publica con una sola asignación a `actual`. Quien tomó `actual` al empezar un
+    request la sigue viendo completa aunque mientras tanto se publique otra.
+    """
+    
+    def __init__(self, inicial: Optional[BaseConocimiento] = None):
+        self.actual: BaseConocimiento = inicial if inicial is not None else BaseConocimiento()
+        self._lock = threading.Lock()
+    
+    @property
+    def version(self) -> int:
+        return self.actual.version
+    
+    def publicar(self, nueva: BaseConocimiento, version: Optional[int] = None) -> int:
+        """Publica una instantánea con el siguiente número de versión y lo devuelve.
+        
+        Con `version` se publica con ese número (al restaurar una instantánea guardada).
+        """
+        with self._lock:
+            nueva.version = version if version is not None else self.actual.version + 1
+            self.actual = nueva
+            return nueva.version
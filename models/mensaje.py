@@ -1,7 +1,54 @@
 from enum import Enum
 from datetime import datetime
+from typing import Any, Dict, Optional
+import hashlib
+import os
+import threading
 import pytz
 
+_CROCKFORD = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+_MASCARA_ALEATORIA = (1 << 80) - 1
+_lock_ids = threading.Lock()
+_ultimo_id = [0, 0]
+
+def generar_id(momento: datetime, semilla: Optional[str] = None) -> str:
+    """Genera un id de 26 caracteres ordenable por tiempo (formato ULID).
+
+    Los primeros 48 bits son los milisegundos de `momento` y los 80 restantes son
+    aleatorios; dentro del mismo milisegundo los ids de este proceso son crecientes.
+    Con `semilla` la parte aleatoria se deriva de ella, así el id es reproducible.
+    """
+    ms = int(momento.timestamp() * 1000)
+    if semilla is not None:
+        aleatorio = int.from_bytes(hashlib.blake2b(semilla.encode('utf-8'), digest_size=10).digest(), 'big')
+    else:
+        with _lock_ids:
+            if ms <= _ultimo_id[0]:
+                ms = _ultimo_id[0]
+                aleatorio = (_ultimo_id[1] + 1) & _MASCARA_ALEATORIA
+            else:
+                aleatorio = int.from_bytes(os.urandom(10), 'big')
+            _ultimo_id[0], _ultimo_id[1] = ms, aleatorio
+    valor = (ms << 80) | aleatorio
+    return ''.join(_CROCKFORD[(valor >> desplazamiento) & 31] for desplazamiento in range(125, -1, -5))
+
+def momento_de_id(id_mensaje: str) -> Optional[datetime]:
+    """Momento codificado en un id de generar_id (None si es otro formato, p. ej. un uuid)"""
+    if len(id_mensaje) != 26 or any(c not in _CROCKFORD for c in id_mensaje):
+        return None
+    valor = 0
+    for c in id_mensaje:
+        valor = (valor << 5) | _CROCKFORD.index(c)
+    return datetime.fromtimestamp((valor >> 80) / 1000, pytz.timezone('America/Tijuana'))
+
+def id_de_registro(data: dict) -> str:
+    """Id de un registro guardado; los que no lo traen reciben uno estable según su contenido"""
+    if data.get('id'):
+        return data['id']
+    momento = datetime.fromisoformat(data['timestamp'])
+    semilla = f"{data['telefono']}\x1f{data.get('contenido', '')}\x1f{data.get('es_bot', False)}"
+    return generar_id(momento, semilla)
+
 class TipoMensaje(Enum):
     SALUDO = "saludo"
     DESPEDIDA = "despedida"
@@ -19,22 +66,47 @@ class Mensaje:
         self.contenido = contenido
         self.es_bot = es_bot
         self.timestamp = self._obtener_timestamp()
-        self.tipo = self._clasificar_tipo()
+        self.id = generar_id(self.timestamp)
+        # Los asigna GestorRespuestas.clasificar; sin clasificar, el tipo queda en None
+        self.tipo: Optional[TipoMensaje] = None
+        self.entidades: Dict[str, Any] = {}
+        # Milisegundos de cada etapa del webhook (en el del usuario, las previas a guardarlo)
+        self.tiempos: Dict[str, float] = {}
     
     def _obtener_timestamp(self) -> datetime:
         tz_mexico = pytz.timezone('America/Tijuana')
         return datetime.now(tz_mexico)
     
-    def _clasificar_tipo(self) -> TipoMensaje:
-        if self.contenido.lower().startswith('!'):
-            return TipoMensaje.OTRO
-        return TipoMensaje.OTRO
-    
     def to_dict(self) -> dict:
-        return {
+        datos = {
+            'id': self.id,
             'telefono': self.telefono,
             'contenido': self.contenido,
             'es_bot': self.es_bot,
             'timestamp': self.timestamp.isoformat(),
             'tipo': self.tipo.value if self.tipo else None
-        }
\ No newline at end of file
+        }
+        if self.entidades:
+            datos['entidades'] = self.entidades
+        if self.tiempos:
+            datos['tiempos'] = self.tiempos
+        return datos
+    
+    @classmethod
+    def from_dict(cls, data: dict):
+        # Sin pasar por __init__: no se genera un id ni se lee la hora para luego reemplazarlos
+        mensaje = cls.__new__(cls)
+        mensaje.telefono = data['telefono']
+        mensaje.contenido = data.get('contenido', '')
+        mensaje.es_bot = data.get('es_bot', False)
+        if data.get('timestamp'):
+            mensaje.timestamp = datetime.fromisoformat(data['timestamp'])
+            mensaje.id = id_de_registro(data)
+        else:
+            mensaje.timestamp = mensaje._obtener_timestamp()
+            mensaje.id = data.get('id') or generar_id(mensaje.timestamp)
+        tipo = data.get('tipo')
+        mensaje.tipo = TipoMensaje(tipo) if tipo in TipoMensaje._value2member_map_ else None
+        mensaje.entidades = data.get('entidades') or {}
+        mensaje.tiempos = data.get('tiempos') or {}
+        return mensaje
\ No newline at end of file
@@ -1,9 +1,12 @@
 from .procesador_lenguaje import ProcesadorLenguajeNatural
 from .gestor_respuestas import GestorRespuestas
-from .base_datos import BaseDatos
+from .base_datos import BaseDatos, crear_base_datos
+from .base_datos_sqlite import BaseDatosSQLite
 
 __all__ = [
     'ProcesadorLenguajeNatural',
     'GestorRespuestas',
-    'BaseDatos'
+    'BaseDatos',
+    'BaseDatosSQLite',
+    'crear_base_datos'
 ]
\ No newline at end of file
@@ -0,0 +1,128 @@
+import asyncio
+from datetime import datetime
+from typing import Optional, List, Dict, Callable
+
+# Pestañas de la hoja que alimentan la base de conocimiento, con el nombre de cada hoja
+PESTANAS = {
+    'horarios': 'Horarios',
+    'eventos': 'Eventos',
+    'carreras': 'Carreras',
+    'servicios': 'Servicios',
+    'suspensiones': 'Suspensiones',
+}
+
+
+def leer_intervalos(texto: str) -> Dict[str, float]:
+    """Interpreta 'pestana=segundos,pestana=segundos' (p. ej. 'eventos=60,suspensiones=60')"""
+    intervalos: Dict[str, float] = {}
+    for parte in texto.split(','):
+        parte = parte.strip()
+        if not parte:
+            continue
+        pestana, _, segundos = parte.partition('=')
+        pestana = pestana.strip().lower()
+        if pestana not in PESTANAS or not segundos:
+            raise ValueError(f"Intervalo de pestaña inválido: {parte}")
+        intervalos[pestana] = float(segundos)
+    return intervalos
+
+
+class ActualizadorConocimiento:
+    """Mantiene la base de conocimiento al día leyendo Google Sheets en segundo plano.
+
+    Cada pestaña se vuelve a leer cuando vence su intervalo (`ttl` por defecto, o el de
+    `intervalos` para esa pestaña). La lectura y la carga con `cargar` corren en un hilo
+    aparte, así que los requests siempre responden con la copia en memoria y nunca
+    esperan a Google.
+
+    `leer` recibe la lista de pestañas vencidas y devuelve sus filas por pestaña (todas las
+    vencidas juntas, para poder pedirlas en una sola llamada); si falla, se conservan las
+    filas anteriores y se reintenta tras `reintento` segundos. Solo se leen `pestanas`;
+    las demás se cargan vacías, y las que aún no se han podido leer se pasan como None
+    para que `cargar` conserve lo que ya tenía (p. ej. lo restaurado de disco).
+    """
+
+    def __init__(self, leer: Callable[[List[str]], Dict[str, List[Dict]]],
+                 cargar: Callable[[Dict[str, List[Dict]]], None], ttl: float = 300,
+                 intervalos: Optional[Dict[str, float]] = None, reintento: float = 30,
+                 pestanas: Optional[List[str]] = None):
+        if ttl <= 0 or any(segundos <= 0 for segundos in (intervalos or {}).values()):
+            raise ValueError("Los intervalos de actualización deben ser positivos")
+        self.pestanas = list(pestanas) if pestanas is not None else list(PESTANAS)
+        desconocidas = set(self.pestanas) - set(PESTANAS)
+        if desconocidas:
+            raise ValueError(f"Pestañas desconocidas: {', '.join(sorted(desconocidas))}")
+        self.leer = leer
+        self.cargar = cargar
+        self.intervalos = {pestana: (intervalos or {}).get(pestana, ttl) for pestana in self.pestanas}
+        self.reintento = reintento
+        # Últimas filas leídas de cada pestaña
+        self.datos: Dict[str, List[Dict]] = {pestana: [] for pestana in PESTANAS}
+        self.actualizado: Dict[str, Optional[datetime]] = {pestana: None for pestana in self.pestanas}
+        self._proxima: Dict[str, float] = {}
+        self._tarea: Optional[asyncio.Task] = None
+
+    @property
+    def activo(self) -> bool:
+        return self._tarea is not None and not self._tarea.done()
+
+    async def iniciar(self):
+        """Arranca la tarea de actualización; la primera lectura de todas las pestañas es inmediata"""
+        if self.activo or not self.pestanas:
+            return
+        self._proxima = {pestana: 0.0 for pestana in self.pestanas}
+        self._tarea = asyncio.create_task(self._ciclo())
+
+    async def detener(self):
+        if not self.activo:
+            return
+        self._tarea.cancel()
+        try:
+            await self._tarea
+        except asyncio.CancelledError:
+            pass
+        self._tarea = None
+
+    def estado(self) -> Dict[str, Dict]:
+        """Intervalo y hora de la última lectura correcta de cada pestaña"""
+        return {
+            pestana: {
+                'intervalo_s': self.intervalos[pestana],
+                'actualizado': self.actualizado[pestana].isoformat() if self.actualizado[pestana] else None,
+                'registros': len(self.datos[pestana])
+            }
+            for pestana in self.pestanas
+        }
+
+    async def _ciclo(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            ahora = loop.time()
+            vencidas = [pestana for pestana, momento in self._proxima.items() if momento <= ahora]
+            if vencidas:
+                await self._actualizar(vencidas)
+            await asyncio.sleep(max(0.0, min(self._proxima.values()) - loop.time()))
+
+    async def _actualizar(self, pestanas: List[str]):
+        loop = asyncio.get_running_loop()
+        try:
+            leidas = await asyncio.to_thread(self.leer, pestanas)
+        except Exception as e:
+            print(f"⚠️  Error actualizando {', '.join(pestanas)} desde Google Sheets: {e}")
+            for pestana in pestanas:
+                self._proxima[pestana] = loop.time() + min(self.reintento, self.intervalos[pestana])
+            return
+
+        for pestana in pestanas:
+            self._proxima[pestana] = loop.time() + self.intervalos[pestana]
+            if pestana in leidas:
+                self.datos[pestana] = leidas[pestana]
+                self.actualizado[pestana] = datetime.now()
+        datos = {
+            pestana: None if pestana in self.actualizado and self.actualizado[pestana] is None else filas
+            for pestana, filas in self.datos.items()
+        }
+        try:
+            await asyncio.to_thread(self.cargar, datos)
+        except Exception as e:
+            print(f"❌ Error cargando la base de conocimiento: {e}")
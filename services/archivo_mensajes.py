@@ -0,0 +1,237 @@
+import argparse
+import gzip
+import json
+import lzma
+import os
+import sys
+from array import array
+from datetime import datetime
+from typing import Dict, Iterator, Iterable, List
+
+COMPRESIONES = {
+    'gzip': ('.jsonl.gz', gzip.open),
+    'lzma': ('.jsonl.xz', lzma.open),
+}
+
+MAGIA_COLUMNAS = b'CHBCOL1\n'
+SIN_TIPO = 255
+
+
+class ArchivoMensajes:
+    """Archivo frío de mensajes: un JSONL comprimido por mes más su exportación columnar.
+
+    Por cada mes AAAA-MM se generan:
+        AAAA-MM.jsonl.gz (o .jsonl.xz)  registros completos, comprimidos
+        AAAA-MM.columnas                 timestamp epoch (float64), id de teléfono (uint32),
+                                         bitmap es_bot y código de intención (uint8)
+    El archivo columnar permite recorrer millones de mensajes sin parsear JSON.
+
+    `archivar` copia un bloque del origen (un segmento, un mes de SQLite) dejando marcas
+    para que una caída entre la copia y el borrado del origen no duplique ni pierda nada:
+        CLAVE.archivando  cuánto medía el archivo del periodo antes de escribir; si queda
+                          huérfana, al abrir el archivo se recorta a ese tamaño
+        CLAVE.archivado   el bloque ya está escrito y sincronizado; el origen se puede
+                          borrar y luego se quita con `confirmar`
+    """
+
+    def __init__(self, ruta: str, compresion: str = 'gzip'):
+        if compresion not in COMPRESIONES:
+            raise ValueError(f"Compresión desconocida: {compresion}")
+        self.ruta = ruta
+        self.compresion = compresion
+        if not os.path.exists(ruta):
+            os.makedirs(ruta)
+        self._deshacer_pendientes()
+
+    def ruta_periodo(self, periodo: str) -> str:
+        """Archivo comprimido del periodo, sin importar con qué compresión se creó"""
+        for extension, _ in COMPRESIONES.values():
+            ruta = os.path.join(self.ruta, periodo + extension)
+            if os.path.exists(ruta):
+                return ruta
+        return os.path.join(self.ruta, periodo + COMPRESIONES[self.compresion][0])
+
+    def ruta_columnas(self, periodo: str) -> str:
+        return os.path.join(self.ruta, f"{periodo}.columnas")
+
+    def periodos(self) -> List[str]:
+        extensiones = tuple(extension for extension, _ in COMPRESIONES.values())
+        return sorted(
+            nombre.split('.')[0] for nombre in os.listdir(self.ruta)
+            if nombre.endswith(extensiones)
+        )
+
+    def _abrir(self, ruta: str, modo: str):
+        for extension, abrir in COMPRESIONES.values():
+            if ruta.endswith(extension):
+                return abrir(ruta, modo)
+        raise ValueError(f"Archivo no reconocido: {ruta}")
+
+    def agregar(self, periodo: str, registros: Iterable[dict]) -> int:
+        """Agrega registros al archivo comprimido del periodo (como un nuevo miembro/stream)"""
+        total = 0
+        with self._abrir(self.ruta_periodo(periodo), 'at') as f:
+            for registro in registros:
+                f.write(json.dumps(registro, ensure_ascii=False) + '\n')
+                total += 1
+        return total
+
+    # ARCHIVADO CON MARCAS
+    def _ruta_marca(self, clave: str, estado: str) -> str:
+        return os.path.join(self.ruta, f"{clave}.{estado}")
+
+    def _escribir_marca(self, ruta: str, datos: Dict):
+        with open(ruta + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(datos, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(ruta + '.tmp', ruta)
+
+    def _deshacer_pendientes(self):
+        """Recorta los archivos que quedaron con un bloque a medio escribir"""
+        for nombre in os.listdir(self.ruta):
+            if not nombre.endswith('.archivando'):
+                continue
+            clave = nombre[:-len('.archivando')]
+            ruta_marca = os.path.join(self.ruta, nombre)
+            if not os.path.exists(self._ruta_marca(clave, 'archivado')):
+                with open(ruta_marca, encoding='utf-8') as f:
+                    marca = json.load(f)
+                ruta = self.ruta_periodo(marca['periodo'])
+                if marca['tamano']:
+                    os.truncate(ruta, marca['tamano'])
+                elif os.path.exists(ruta):
+                    os.remove(ruta)
+            os.remove(ruta_marca)
+
+    def marcas(self) -> Dict[str, Dict]:
+        """Bloques ya archivados cuyo origen falta borrar (clave -> datos de la marca)"""
+        marcas = {}
+        for nombre in sorted(os.listdir(self.ruta)):
+            if nombre.endswith('.archivado'):
+                with open(os.path.join(self.ruta, nombre), encoding='utf-8') as f:
+                    marcas[nombre[:-len('.archivado')]] = json.load(f)
+        return marcas
+
+    def archivar(self, clave: str, periodo: str, registros: Iterable[dict], **datos) -> int:
+        """Agrega al periodo el bloque `clave` una sola vez; devuelve cuántos registros tiene.
+
+        Si el bloque ya tiene marca de archivado no se vuelven a leer los registros. Los
+        `datos` extra quedan en la marca (p. ej. qué rango borrar del origen).
+        """
+        marca = self.marcas().get(clave)
+        if marca is not None:
+            return marca['total']
+        ruta = self.ruta_periodo(periodo)
+        pendiente = self._ruta_marca(clave, 'archivando')
+        marca = {**datos, 'periodo': periodo, 'tamano': os.path.getsize(ruta) if os.path.exists(ruta) else 0}
+        self._escribir_marca(pendiente, marca)
+        marca['total'] = self.agregar(periodo, registros)
+        with open(ruta, 'rb') as f:
+            os.fsync(f.fileno())
+        self._escribir_marca(self._ruta_marca(clave, 'archivado'), marca)
+        os.remove(pendiente)
+        return marca['total']
+
+    def confirmar(self, clave: str):
+        """Quita la marca de un bloque cuyo origen ya se borró"""
+        ruta = self._ruta_marca(clave, 'archivado')
+        if os.path.exists(ruta):
+            os.remove(ruta)
+
+    def iterar(self, periodo: str) -> Iterator[dict]:
+        """Recorre los registros archivados de un periodo"""
+        ruta = self.ruta_periodo(periodo)
+        if not os.path.exists(ruta):
+            return
+        with self._abrir(ruta, 'rt') as f:
+            for linea in f:
+                if linea.strip():
+                    yield json.loads(linea)
+
+    def exportar_columnas(self, periodo: str) -> int:
+        """Regenera AAAA-MM.columnas a partir del archivo comprimido del periodo"""
+        timestamps = array('d')
+        telefonos = array('I')
+        tipos = array('B')
+        es_bot = bytearray()
+        ids_telefono: Dict[str, int] = {}
+        ids_tipo: Dict[str, int] = {}
+
+        for n, registro in enumerate(self.iterar(periodo)):
+            timestamps.append(datetime.fromisoformat(registro['timestamp']).timestamp())
+            telefonos.append(ids_telefono.setdefault(registro['telefono'], len(ids_telefono)))
+            tipo = registro.get('tipo')
+            tipos.append(SIN_TIPO if tipo is None else ids_tipo.setdefault(tipo, len(ids_tipo)))
+            if n % 8 == 0:
+                es_bot.append(0)
+            if registro.get('es_bot'):
+                es_bot[n // 8] |= 1 << (n % 8)
+
+        encabezado = {
+            'periodo': periodo,
+            'total': len(timestamps),
+            'orden_bytes': sys.byteorder,
+            'telefonos': list(ids_telefono),
+            'tipos': list(ids_tipo),
+            'columnas': ['timestamp:d', 'telefono:I', 'es_bot:bitmap', 'tipo:B']
+        }
+        ruta_temporal = self.ruta_columnas(periodo) + '.tmp'
+        with open(ruta_temporal, 'wb') as f:
+            f.write(MAGIA_COLUMNAS)
+            f.write(json.dumps(encabezado, ensure_ascii=False).encode('utf-8') + b'\n')
+            timestamps.tofile(f)
+            telefonos.tofile(f)
+            f.write(bytes(es_bot))
+            tipos.tofile(f)
+        os.replace(ruta_temporal, self.ruta_columnas(periodo))
+        return len(timestamps)
+
+
+def leer_columnas(ruta: str) -> Dict:
+    """Carga un archivo .columnas; devuelve el encabezado y las columnas como arrays"""
+    with open(ruta, 'rb') as f:
+        if f.readline() != MAGIA_COLUMNAS:
+            raise ValueError(f"{ruta} no es un archivo de columnas")
+        encabezado = json.loads(f.readline())
+        total = encabezado['total']
+
+        timestamps = array('d')
+        timestamps.fromfile(f, total)
+        telefonos = array('I')
+        telefonos.fromfile(f, total)
+        es_bot = f.read((total + 7) // 8)
+        tipos = array('B')
+        tipos.fromfile(f, total)
+
+    if encabezado['orden_bytes'] != sys.byteorder:
+        timestamps.byteswap()
+        telefonos.byteswap()
+
+    return {
+        **encabezado,
+        'timestamp': timestamps,
+        'telefono': telefonos,
+        'es_bot': es_bot,
+        'tipo': tipos
+    }
+
+
+if __name__ == "__main__":
+    sys.path.append('.')
+    from services.base_datos import crear_base_datos
+
+    parser = argparse.ArgumentParser(description="Archiva mensajes antiguos en archivos comprimidos")
+    parser.add_argument('--datos', default=None,
+                        help="Directorio de datos (por defecto el almacenamiento configurado)")
+    parser.add_argument('--dias', type=int, default=180, help="Archivar mensajes con más de N días")
+    parser.add_argument('--compresion', choices=sorted(COMPRESIONES), default='gzip')
+    args = parser.parse_args()
+
+    bd = crear_base_datos(ruta_datos=args.datos)
+    resumen = bd.archivar_mensajes_antiguos(args.dias, args.compresion)
+    bd.cerrar()
+    for periodo, total in resumen.items():
+        print(f"✅ {periodo}: {total} mensajes archivados")
+    if not resumen:
+        print("ℹ️ No hay mensajes para archivar")
@@ -0,0 +1,136 @@
+import argparse
+import dbm
+import json
+import sys
+import zlib
+from typing import Dict, Iterable, List, Optional
+
+sys.path.append('.')
+
+from services.bloqueo_archivo import BloqueoArchivo
+
+
+class ArchivoUsuarios:
+    """Usuarios inactivos guardados fuera de usuarios.json en una base dbm.
+
+    La clave es el teléfono y el valor el JSON compacto del usuario comprimido con zlib;
+    consultar un teléfono no requiere leer a los demás. Se usa el mejor módulo dbm
+    disponible (gnu, ndbm o, en su defecto, dumb).
+
+    Con `entre_procesos=True` cada operación abre y cierra la base bajo un flock, para
+    que todos los workers vean los cambios de los demás; si no, queda abierta.
+    """
+
+    def __init__(self, ruta: str, entre_procesos: bool = False):
+        self.ruta = ruta
+        self.entre_procesos = entre_procesos
+        self._bloqueo = BloqueoArchivo(ruta + '.lock', entre_procesos)
+        self._db = None
+        self._total: Optional[int] = None
+
+    def _abrir(self):
+        if self._db is None:
+            self._db = dbm.open(self.ruta, 'c')
+        return self._db
+
+    def _liberar(self, modificado: bool = False):
+        if self._db is None:
+            return
+        if self.entre_procesos:
+            self._db.close()
+            self._db = None
+            self._total = None
+        elif modificado and hasattr(self._db, 'sync'):
+            self._db.sync()
+
+    def cerrar(self):
+        with self._bloqueo:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    @staticmethod
+    def _codificar(datos: dict) -> bytes:
+        return zlib.compress(json.dumps(datos, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+    @staticmethod
+    def _decodificar(valor: bytes) -> dict:
+        return json.loads(zlib.decompress(valor))
+
+    def obtener(self, telefono: str) -> Optional[dict]:
+        """Datos del usuario archivado, o None si no está en el archivo"""
+        with self._bloqueo:
+            try:
+                valor = self._abrir().get(telefono)
+            finally:
+                self._liberar()
+        return self._decodificar(valor) if valor is not None else None
+
+    def guardar_varios(self, usuarios: Dict[str, dict]):
+        """Archiva (o reemplaza) varios usuarios"""
+        with self._bloqueo:
+            db = self._abrir()
+            try:
+                for telefono, datos in usuarios.items():
+                    if self._total is not None and telefono not in db:
+                        self._total += 1
+                    db[telefono] = self._codificar(datos)
+            finally:
+                self._liberar(modificado=True)
+
+    def eliminar_varios(self, telefonos: Iterable[str]) -> int:
+        """Saca del archivo los teléfonos indicados que estén en él; devuelve cuántos eran"""
+        eliminados = 0
+        with self._bloqueo:
+            db = self._abrir()
+            try:
+                for telefono in telefonos:
+                    if telefono in db:
+                        del db[telefono]
+                        eliminados += 1
+                if self._total is not None:
+                    self._total -= eliminados
+            finally:
+                self._liberar(modificado=eliminados > 0)
+        return eliminados
+
+    def contar(self) -> int:
+        with self._bloqueo:
+            try:
+                if self._total is None:
+                    total = len(self._abrir())
+                    if not self.entre_procesos:
+                        self._total = total
+                    return total
+                return self._total
+            finally:
+                self._liberar()
+
+    def telefonos(self) -> List[str]:
+        with self._bloqueo:
+            try:
+                return [telefono.decode('utf-8') for telefono in self._abrir().keys()]
+            finally:
+                self._liberar()
+
+    def todos(self) -> List[dict]:
+        with self._bloqueo:
+            db = self._abrir()
+            try:
+                return [self._decodificar(db[telefono]) for telefono in db.keys()]
+            finally:
+                self._liberar()
+
+
+if __name__ == "__main__":
+    from services.base_datos import BaseDatos
+
+    parser = argparse.ArgumentParser(description="Archiva los usuarios sin actividad reciente")
+    parser.add_argument('--datos', default='datos', help="Directorio de datos")
+    parser.add_argument('--dias', type=int, default=90, help="Archivar usuarios inactivos por más de N días")
+    args = parser.parse_args()
+
+    bd = BaseDatos(args.datos, intervalo_flush=0)
+    archivados = bd.archivar_usuarios_inactivos(args.dias)
+    bd.cerrar()
+    print(f"✅ {archivados} usuarios archivados" if archivados else "ℹ️ No hay usuarios para archivar")
@@ -1,19 +1,92 @@
 import json
 import os
-from typing import Optional, List, Dict
-from datetime import datetime
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, List, Dict, Iterable, Iterator, Tuple
+from datetime import datetime, date, timedelta
 from models.usuario import Usuario
-from models.mensaje import Mensaje
+from models.mensaje import Mensaje, id_de_registro, momento_de_id
+from services.segmentos_mensajes import SegmentosMensajes
+from services.archivo_mensajes import ArchivoMensajes
+from services.archivo_usuarios import ArchivoUsuarios
+from services.bloqueo_archivo import BloqueoArchivo
+from services.indice_busqueda import IndiceBusqueda
+from services.lectura_mmap import iterar_json
+from services.procesador_lenguaje import ProcesadorLenguajeNatural
+from services.resumenes import (
+    GRANULARIDADES, agrupar, claves_periodo, descontar, periodo_abierto, resumen_vacio, seleccionar
+)
 
 class BaseDatos:
-    """Clase para gestionar la persistencia de datos"""
+    """Clase para gestionar la persistencia de datos
     
-    def __init__(self, ruta_datos: str = "datos"):
+    Con multiproceso=True varios procesos (p. ej. `uvicorn --workers N`) pueden compartir
+    el mismo directorio: cada proceso anexa mensajes a sus propios segmentos, usuarios.json
+    y estadisticas.json se fusionan bajo flock y se reemplazan atómicamente, y cada proceso
+    incorpora lo que escribieron los demás.
+    """
+    
+    def __init__(self, ruta_datos: str = "datos", max_usuarios_cache: int = 10000,
+                 intervalo_flush: float = 5.0, particion_mensajes: str = 'dia',
+                 multiproceso: bool = False, dias_inactividad: int = 0):
         self.ruta_datos = ruta_datos
         self.ruta_usuarios = os.path.join(ruta_datos, "usuarios.json")
-        self.ruta_mensajes = os.path.join(ruta_datos, "mensajes.json")
+        self.ruta_mensajes = os.path.join(ruta_datos, "mensajes")
+        self.ruta_mensajes_legado = os.path.join(ruta_datos, "mensajes.json")
+        self.ruta_estadisticas = os.path.join(ruta_datos, "estadisticas.json")
+        self.multiproceso = multiproceso
         self._crear_directorio()
-        self._inicializar_archivos()
+        # Protege usuarios.json y estadisticas.json frente a otros procesos
+        self._bloqueo_archivos = BloqueoArchivo(os.path.join(ruta_datos, ".lock"), multiproceso)
+        with self._bloqueo_archivos:
+            self._inicializar_archivos()
+        
+        # Caché LRU de usuarios (telefono -> dict) con escritura diferida
+        self.max_usuarios_cache = max_usuarios_cache
+        self.intervalo_flush = intervalo_flush
+        self._cache_usuarios: "OrderedDict[str, dict]" = OrderedDict()
+        self._usuarios_sucios = set()
+        self._cache_completo = False
+        # Teléfonos presentes en usuarios.json, para no leerlo al buscar un usuario nuevo
+        self._telefonos_usuarios = set()
+        self._firma_usuarios = None
+        self._lock = threading.RLock()
+        self._precargar_usuarios()
+        # Ids de mensajes ya anexados por un guardar_lote que falló después (p. ej. en el
+        # flush); si el lote se reintenta, esos mensajes no se vuelven a anexar
+        self._anexados_sin_confirmar = set()
+        
+        # Usuarios sin actividad en `dias_inactividad` días (0 = nunca) salen de usuarios.json
+        self.dias_inactividad = dias_inactividad
+        self._archivo_usuarios = ArchivoUsuarios(os.path.join(ruta_datos, "usuarios_archivo"), multiproceso)
+        self._ultimo_archivado_usuarios = None
+        
+        # Mensajes en segmentos por periodo, con índice por teléfono
+        self._mensajes = SegmentosMensajes(self.ruta_mensajes, particion_mensajes, multiproceso)
+        with self._bloqueo_archivos:
+            self._migrar_log_unico()
+            migrados = self._migrar_mensajes_legado()
+        
+        # Índice invertido del contenido, con la misma normalización que el procesador
+        self._busqueda = IndiceBusqueda(
+            self._mensajes,
+            os.path.join(ruta_datos, "busqueda.pkl"),
+            ProcesadorLenguajeNatural().limpiar_texto
+        )
+        
+        # Contadores de estadísticas mantenidos en cada escritura
+        self._estadisticas: Dict = {}
+        self._estadisticas_sucias = False
+        self._firma_estadisticas = None
+        # Los mensajes migrados ya estaban contados como heredados: se recuentan una vez
+        self._cargar_estadisticas(reconstruir=migrados > 0)
+        
+        self._detener_flush = threading.Event()
+        self._hilo_flush = None
+        if intervalo_flush and intervalo_flush > 0:
+            self._hilo_flush = threading.Thread(target=self._ciclo_flush, daemon=True)
+            self._hilo_flush.start()
         
     def _crear_directorio(self):
         """Crea el directorio de datos si no existe"""
@@ -24,13 +97,13 @@ class BaseDatos:
         """Inicializa los archivos JSON si no existen"""
         if not os.path.exists(self.ruta_usuarios):
             self._guardar_json(self.ruta_usuarios, {})
-        if not os.path.exists(self.ruta_mensajes):
-            self._guardar_json(self.ruta_mensajes, [])
     
     def _guardar_json(self, ruta: str, datos):
-        """Guarda datos en formato JSON"""
-        with open(ruta, 'w', encoding='utf-8') as f:
+        """Guarda datos en formato JSON (escribe a un temporal y lo renombra)"""
+        ruta_temporal = ruta + '.tmp'
+        with open(ruta_temporal, 'w', encoding='utf-8') as f:
             json.dump(datos, f, ensure_ascii=False, indent=2)
+        os.replace(ruta_temporal, ruta)
     
     def _cargar_json(self, ruta: str):
         """Carga datos desde un archivo JSON"""
@@ -40,13 +113,214 @@ class BaseDatos:
         except (FileNotFoundError, json.JSONDecodeError):
             return None
     
+    def _migrar_log_unico(self):
+        """Reparte el antiguo mensajes.jsonl (un solo archivo) en segmentos por periodo"""
+        ruta_log = os.path.join(self.ruta_datos, "mensajes.jsonl")
+        if not os.path.exists(ruta_log):
+            return
+        with open(ruta_log, 'r', encoding='utf-8') as f:
+            for linea in f:
+                try:
+                    self._mensajes.anexar(json.loads(linea))
+                except (json.JSONDecodeError, KeyError):
+                    continue
+        os.remove(ruta_log)
+        for ruta in (ruta_log + '.tmp', os.path.join(self.ruta_datos, "mensajes.idx")):
+            if os.path.exists(ruta):
+                os.remove(ruta)
+    
+    def _migrar_mensajes_legado(self, tamano_lote: int = 1000) -> int:
+        """Reparte el mensajes.json heredado (un arreglo) en segmentos e indice.idx, una sola vez.
+        
+        Se escribe por lotes con fsync y después de cada lote se anota en mensajes.json.progreso
+        hasta qué byte se leyó y cuánto medía cada segmento. Si el proceso muere a la mitad,
+        al reanudar se recortan los segmentos a esos tamaños (así el último lote no se
+        duplica) y se sigue desde ese byte. Al terminar el archivo queda como
+        mensajes.json.migrado. Devuelve cuántos mensajes se migraron.
+        """
+        if not os.path.exists(self.ruta_mensajes_legado):
+            return 0
+        ruta_progreso = self.ruta_mensajes_legado + '.progreso'
+        progreso = self._cargar_json(ruta_progreso)
+        if progreso:
+            # Se descarta lo escrito después del último lote confirmado
+            for segmento in self._mensajes.segmentos():
+                tamano = progreso['tamanos'].get(segmento, 0)
+                if self._mensajes.tamano_segmento(segmento) > tamano:
+                    if tamano:
+                        os.truncate(self._mensajes.ruta_segmento(segmento), tamano)
+                    else:
+                        os.remove(self._mensajes.ruta_segmento(segmento))
+            self._mensajes.reconstruir_indice()
+        
+        lote: List[dict] = []
+        
+        def confirmar(offset: int):
+            self._mensajes.anexar_lote(lote, fsync=True)
+            progreso['mensajes'] = progreso.get('mensajes', 0) + len(lote)
+            progreso['bytes'] = offset
+            progreso['tamanos'] = {s: self._mensajes.tamano_segmento(s) for s in self._mensajes.segmentos()}
+            self._guardar_json(ruta_progreso, progreso)
+            lote.clear()
+        
+        if not progreso:
+            progreso = {}
+            confirmar(0)
+        print(f"🚚 Migrando {self.ruta_mensajes_legado} a segmentos...")
+        try:
+            offset = progreso['bytes']
+            for _, registro, offset in iterar_json(self.ruta_mensajes_legado, progreso['bytes']):
+                if not isinstance(registro, dict) or 'telefono' not in registro or not registro.get('timestamp'):
+                    continue
+                lote.append(registro)
+                if len(lote) >= tamano_lote:
+                    confirmar(offset)
+            confirmar(offset)
+        except ValueError as e:
+            print(f"❌ Error al migrar {self.ruta_mensajes_legado}, se reintentará al reiniciar: {e}")
+            return 0
+        # El arreglo heredado no venía necesariamente ordenado y se escribió por lotes
+        if self._mensajes.ordenar_segmentos(self._mensajes.segmentos()):
+            # Los offsets cambiaron sin cambiar los tamaños: el índice de búsqueda se rehace
+            ruta_busqueda = os.path.join(self.ruta_datos, "busqueda.pkl")
+            if os.path.exists(ruta_busqueda):
+                os.remove(ruta_busqueda)
+        os.replace(self.ruta_mensajes_legado, self.ruta_mensajes_legado + '.migrado')
+        os.remove(ruta_progreso)
+        print(f"✅ {progreso['mensajes']} mensajes heredados migrados")
+        return progreso['mensajes']
+    
+    # CACHÉ DE USUARIOS
+    @staticmethod
+    def _firma_archivo(ruta: str):
+        try:
+            estado = os.stat(ruta)
+        except FileNotFoundError:
+            return None
+        return (estado.st_ino, estado.st_mtime_ns, estado.st_size)
+    
+    def _firma_archivo_usuarios(self):
+        return self._firma_archivo(self.ruta_usuarios)
+    
+    def _precargar_usuarios(self):
+        """Carga usuarios.json en la caché si cabe completo"""
+        self._firma_usuarios = self._firma_archivo_usuarios()
+        usuarios = self._cargar_json(self.ruta_usuarios) or {}
+        self._telefonos_usuarios = set(usuarios)
+        if len(usuarios) <= self.max_usuarios_cache:
+            self._cache_usuarios.update(usuarios)
+            self._cache_completo = True
+    
+    def _refrescar_usuarios(self):
+        """En modo multiproceso, recarga la caché si otro proceso reescribió usuarios.json"""
+        if not self.multiproceso or self._firma_archivo_usuarios() == self._firma_usuarios:
+            return
+        sucios = {telefono: self._cache_usuarios[telefono] for telefono in self._usuarios_sucios}
+        self._cache_usuarios.clear()
+        self._cache_completo = False
+        self._precargar_usuarios()
+        for telefono, datos in sucios.items():
+            self._cachear_usuario(telefono, datos)
+    
+    def _cachear_usuario(self, telefono: str, datos: dict):
+        """Inserta un usuario en la caché y expulsa los menos usados si se excede el límite"""
+        self._cache_usuarios[telefono] = datos
+        self._cache_usuarios.move_to_end(telefono)
+        while len(self._cache_usuarios) > self.max_usuarios_cache:
+            # Solo hay que escribir usuarios.json si el expulsado tiene cambios pendientes
+            if next(iter(self._cache_usuarios)) in self._usuarios_sucios:
+                self._flush_usuarios()
+            self._cache_usuarios.popitem(last=False)
+            self._cache_completo = False
+    
+    def _buscar_usuario(self, telefono: str) -> Optional[dict]:
+        """Busca un usuario en la caché, luego en usuarios.json y por último en el archivo de inactivos.
+        
+        Un usuario archivado no entra a la caché al consultarlo; vuelve a usuarios.json
+        cuando se guarda de nuevo (p. ej. al llegar su siguiente mensaje).
+        """
+        with self._lock:
+            self._refrescar_usuarios()
+            if telefono in self._cache_usuarios:
+                self._cache_usuarios.move_to_end(telefono)
+                return self._cache_usuarios[telefono]
+            if not self._cache_completo and telefono in self._telefonos_usuarios:
+                datos = (self._cargar_json(self.ruta_usuarios) or {}).get(telefono)
+                if datos is not None:
+                    self._cachear_usuario(telefono, datos)
+                    return datos
+            return self._archivo_usuarios.obtener(telefono)
+    
+    def _flush_usuarios(self):
+        """Escribe en usuarios.json los usuarios modificados en la caché"""
+        with self._lock:
+            if not self._usuarios_sucios:
+                return
+            with self._bloqueo_archivos:
+                usuarios = self._cargar_json(self.ruta_usuarios) or {}
+                for telefono in self._usuarios_sucios:
+                    usuarios[telefono] = self._cache_usuarios[telefono]
+                self._guardar_json(self.ruta_usuarios, usuarios)
+                self._firma_usuarios = self._firma_archivo_usuarios()
+                self._telefonos_usuarios = set(usuarios)
+                # Si alguno estaba archivado (quizá por otro proceso), ahora vive en usuarios.json
+                self._archivo_usuarios.eliminar_varios(self._usuarios_sucios)
+            self._usuarios_sucios.clear()
+            if self.multiproceso:
+                # La fusión trae también lo que guardaron otros procesos
+                if len(usuarios) <= self.max_usuarios_cache:
+                    self._cache_usuarios = OrderedDict(usuarios)
+                    self._cache_completo = True
+                else:
+                    for telefono in self._cache_usuarios:
+                        if telefono in usuarios:
+                            self._cache_usuarios[telefono] = usuarios[telefono]
+            total = len(usuarios) + self._archivo_usuarios.contar()
+            if self._estadisticas and self._estadisticas['total_usuarios'] != total:
+                self._estadisticas['total_usuarios'] = total
+                self._estadisticas_sucias = True
+    
+    def _ciclo_flush(self):
+        """Hilo que persiste periódicamente los cambios pendientes"""
+        while not self._detener_flush.wait(self.intervalo_flush):
+            try:
+                self.flush()
+                if self.dias_inactividad > 0 and (
+                    self._ultimo_archivado_usuarios is None
+                    or time.monotonic() - self._ultimo_archivado_usuarios >= 24 * 60 * 60
+                ):
+                    self._ultimo_archivado_usuarios = time.monotonic()
+                    self.archivar_usuarios_inactivos()
+            except Exception as e:
+                print(f"Error en flush periódico: {e}")
+    
+    def flush(self):
+        """Persiste en disco todos los cambios pendientes"""
+        self._flush_usuarios()
+        self._flush_estadisticas()
+        self._busqueda.guardar()
+    
+    def cerrar(self):
+        """Detiene el flush periódico y persiste los cambios pendientes"""
+        self._detener_flush.set()
+        if self._hilo_flush:
+            self._hilo_flush.join()
+        self.flush()
+        self._busqueda.guardar(forzar=True)
+        self._archivo_usuarios.cerrar()
+        self._mensajes.cerrar()
+    
     # MÉTODOS PARA USUARIOS
     def guardar_usuario(self, usuario: Usuario) -> bool:
-        """Guarda o actualiza un usuario"""
+        """Guarda o actualiza un usuario (se persiste en el siguiente flush)"""
         try:
-            usuarios = self._cargar_json(self.ruta_usuarios) or {}
-            usuarios[usuario.telefono] = usuario.to_dict()
-            self._guardar_json(self.ruta_usuarios, usuarios)
+            with self._lock:
+                if self._buscar_usuario(usuario.telefono) is None:
+                    self._estadisticas['total_usuarios'] += 1
+                    self._estadisticas_sucias = True
+                # Se marca antes de cachear: si la caché se llena, el flush ya lo incluye
+                self._usuarios_sucios.add(usuario.telefono)
+                self._cachear_usuario(usuario.telefono, usuario.to_dict())
             return True
         except Exception as e:
             print(f"Error al guardar usuario: {e}")
@@ -54,92 +328,537 @@ class BaseDatos:
     
     def obtener_usuario(self, telefono: str) -> Optional[Usuario]:
         """Obtiene un usuario por su teléfono"""
-        usuarios = self._cargar_json(self.ruta_usuarios) or {}
-        if telefono in usuarios:
-            return Usuario.from_dict(usuarios[telefono])
+        datos = self._buscar_usuario(telefono)
+        if datos is not None:
+            return Usuario.from_dict(datos)
         return None
     
     def usuario_existe(self, telefono: str) -> bool:
         """Verifica si un usuario existe"""
-        usuarios = self._cargar_json(self.ruta_usuarios) or {}
-        return telefono in usuarios
+        return self._buscar_usuario(telefono) is not None
     
     def obtener_todos_usuarios(self) -> List[Usuario]:
-        """Obtiene todos los usuarios"""
+        """Obtiene todos los usuarios, incluidos los archivados por inactividad"""
+        self._flush_usuarios()
         usuarios = self._cargar_json(self.ruta_usuarios) or {}
-        return [Usuario.from_dict(data) for data in usuarios.values()]
+        archivados = [data for data in self._archivo_usuarios.todos() if data['telefono'] not in usuarios]
+        return [Usuario.from_dict(data) for data in list(usuarios.values()) + archivados]
+    
+    def archivar_usuarios_inactivos(self, dias: Optional[int] = None) -> int:
+        """Mueve al archivo de inactivos a los usuarios sin interacción en X días.
+        
+        Sin `dias` se usa `dias_inactividad`. usuarios.json (y la caché) quedan solo con
+        los usuarios activos. Devuelve cuántos usuarios se archivaron.
+        """
+        dias = self.dias_inactividad if dias is None else dias
+        limite = datetime.now() - timedelta(days=dias)
+        with self._lock:
+            self._flush_usuarios()
+            with self._bloqueo_archivos:
+                usuarios = self._cargar_json(self.ruta_usuarios) or {}
+                inactivos = {
+                    telefono: datos for telefono, datos in usuarios.items()
+                    if datetime.fromisoformat(datos['ultima_interaccion']).replace(tzinfo=None) < limite
+                }
+                if not inactivos:
+                    return 0
+                # Primero se escribe el archivo para no perder a nadie si el proceso muere
+                self._archivo_usuarios.guardar_varios(inactivos)
+                for telefono in inactivos:
+                    del usuarios[telefono]
+                self._guardar_json(self.ruta_usuarios, usuarios)
+                self._firma_usuarios = self._firma_archivo_usuarios()
+                self._telefonos_usuarios = set(usuarios)
+            
+            for telefono in inactivos:
+                self._cache_usuarios.pop(telefono, None)
+            if len(usuarios) <= self.max_usuarios_cache:
+                self._cache_usuarios = OrderedDict(usuarios)
+                self._cache_completo = True
+        return len(inactivos)
     
     # MÉTODOS PARA MENSAJES
     def guardar_mensaje(self, mensaje: Mensaje) -> bool:
         """Guarda un mensaje en el historial"""
         try:
-            mensajes = self._cargar_json(self.ruta_mensajes) or []
-            mensajes.append(mensaje.to_dict())
-            self._guardar_json(self.ruta_mensajes, mensajes)
+            with self._lock:
+                registro = mensaje.to_dict()
+                segmento, offset, fin = self._mensajes.anexar(registro)
+                if not self.multiproceso:
+                    self._contabilizar_mensaje(registro)
+                    self._estadisticas['contabilizado'][segmento] = fin
+                    self._busqueda.agregar(segmento, offset, fin, registro)
             return True
         except Exception as e:
             print(f"Error al guardar mensaje: {e}")
             return False
     
+    def guardar_lote(self, usuarios: List[Usuario], mensajes: List[Mensaje], fsync: bool = False) -> bool:
+        """Guarda varios usuarios y mensajes de una vez (una escritura por segmento).
+        
+        Con fsync=True los segmentos se sincronizan a disco y se hace flush de usuarios
+        y estadísticas antes de regresar. Si falla después de anexar los mensajes, al
+        reintentar el mismo lote solo se escribe lo que faltó.
+        """
+        try:
+            for usuario in usuarios:
+                self.guardar_usuario(usuario)
+            with self._lock:
+                nuevos = [m for m in mensajes if m.id not in self._anexados_sin_confirmar]
+                registros = [m.to_dict() for m in nuevos]
+                ubicaciones = self._mensajes.anexar_lote(registros, fsync)
+                self._anexados_sin_confirmar.update(m.id for m in nuevos)
+                if self.multiproceso:
+                    ubicaciones = []
+                for registro, (segmento, offset, fin) in zip(registros, ubicaciones):
+                    self._contabilizar_mensaje(registro)
+                    contabilizado = self._estadisticas['contabilizado']
+                    contabilizado[segmento] = max(contabilizado.get(segmento, 0), fin)
+                    self._busqueda.agregar(segmento, offset, fin, registro)
+            if fsync:
+                self.flush()
+            with self._lock:
+                self._anexados_sin_confirmar.difference_update(m.id for m in mensajes)
+            return True
+        except Exception as e:
+            print(f"Error al guardar lote: {e}")
+            return False
+    
     def obtener_mensajes_usuario(self, telefono: str, limite: int = 50) -> List[Mensaje]:
         """Obtiene los últimos mensajes de un usuario"""
-        mensajes = self._cargar_json(self.ruta_mensajes) or []
-        mensajes_usuario = [
-            Mensaje.from_dict(m) for m in mensajes 
-            if m['telefono'] == telefono
-        ]
-        return mensajes_usuario[-limite:]
+        registros = self._mensajes.leer(self._mensajes.referencias(telefono, limite))
+        return [Mensaje.from_dict(m) for m in registros]
     
     def obtener_historial_completo(self, telefono: str) -> List[Mensaje]:
         """Obtiene el historial completo de un usuario"""
-        mensajes = self._cargar_json(self.ruta_mensajes) or []
-        return [Mensaje.from_dict(m) for m in mensajes if m['telefono'] == telefono]
+        registros = self._mensajes.leer(self._mensajes.referencias(telefono))
+        return [Mensaje.from_dict(m) for m in registros]
     
     def contar_mensajes_usuario(self, telefono: str) -> int:
         """Cuenta los mensajes de un usuario"""
-        mensajes = self._cargar_json(self.ruta_mensajes) or []
-        return sum(1 for m in mensajes if m['telefono'] == telefono)
+        return self._mensajes.contar(telefono)
     
-    # MÉTODOS DE ESTADÍSTICAS
-    def obtener_estadisticas(self) -> Dict:
-        """Obtiene estadísticas generales del chatbot"""
-        usuarios = self._cargar_json(self.ruta_usuarios) or {}
-        mensajes = self._cargar_json(self.ruta_mensajes) or []
+    def obtener_pagina_mensajes(self, telefono: str, limite: int = 20, antes_de: Optional[str] = None,
+                                despues_de: Optional[str] = None) -> Optional[List[Mensaje]]:
+        """Obtiene una página del historial de un usuario usando ids de mensaje como cursores
         
+        Con `antes_de` devuelve los `limite` mensajes anteriores a ese id y con `despues_de`
+        los siguientes; sin cursores, los últimos `limite`. Devuelve None si un cursor no existe.
+        """
+        referencias = self._mensajes.referencias(telefono)
+        inicio, fin = 0, len(referencias)
+        for cursor, es_inicio in ((despues_de, True), (antes_de, False)):
+            if not cursor:
+                continue
+            posicion = self._posicion_mensaje(cursor, referencias)
+            if posicion is None:
+                return None
+            if es_inicio:
+                inicio = posicion + 1
+            else:
+                fin = posicion
+        if despues_de:
+            fin = min(fin, inicio + limite)
+        else:
+            inicio = max(inicio, fin - limite)
+        if inicio >= fin:
+            return []
+        registros = self._mensajes.leer(referencias[inicio:fin])
+        return [Mensaje.from_dict(m) for m in registros]
+    
+    def _posicion_mensaje(self, id_mensaje: str, referencias: List) -> Optional[int]:
+        """Posición de un mensaje dentro de las referencias de un usuario"""
+        # Primero los segmentos del periodo que corresponde al momento codificado en el id; si no está
+        # ahí (o el id es un uuid heredado) se busca del más reciente al más antiguo
+        momento = momento_de_id(id_mensaje)
+        periodo = self._mensajes.clave_segmento(momento.isoformat()) if momento else None
+        en_periodo = [i for i, r in enumerate(referencias) if self._mensajes.periodo(r[0]) == periodo]
+        resto = [i for i in reversed(range(len(referencias))) if self._mensajes.periodo(referencias[i][0]) != periodo]
+        for candidatas in (en_periodo, resto):
+            for k in range(0, len(candidatas), 256):
+                bloque = candidatas[k:k + 256]
+                for i, registro in zip(bloque, self._mensajes.leer([referencias[i] for i in bloque])):
+                    if id_de_registro(registro) == id_mensaje:
+                        return i
+        return None
+    
+    def iterar_mensajes_usuario(self, telefono: str) -> Iterator[Mensaje]:
+        """Recorre el historial completo de un usuario leyendo de a poco desde el índice"""
+        referencias = self._mensajes.referencias(telefono)
+        for k in range(0, len(referencias), 256):
+            for m in self._mensajes.leer(referencias[k:k + 256]):
+                yield Mensaje.from_dict(m)
+    
+    def iterar_mensajes(self, desde: Optional[date] = None, hasta: Optional[date] = None,
+                        telefono: Optional[str] = None) -> Iterator[Mensaje]:
+        """Recorre los mensajes entre dos fechas (inclusivas) leyendo solo los segmentos que las cubren"""
+        desde_str = desde.isoformat() if desde else None
+        hasta_str = hasta.isoformat() if hasta else None
+        for m in self._mensajes.iterar(desde_str, hasta_str):
+            if telefono is None or m['telefono'] == telefono:
+                yield Mensaje.from_dict(m)
+    
+    def buscar_mensajes(self, consulta: str, telefono: Optional[str] = None, desde: Optional[date] = None,
+                        hasta: Optional[date] = None, limite: int = 20) -> List[Tuple[Mensaje, float]]:
+        """Busca mensajes por contenido y los devuelve con su puntaje, del más relevante al menos"""
+        resultados = self._busqueda.buscar(consulta, telefono, desde, hasta, limite)
+        registros = self._mensajes.leer([(segmento, offset) for _, segmento, offset in resultados])
+        return [(Mensaje.from_dict(m), puntaje) for m, (puntaje, _, _) in zip(registros, resultados)]
+    
+    # MÉTODOS DE ESTADÍSTICAS
+    def _estadisticas_vacias(self) -> Dict:
         return {
-            'total_usuarios': len(usuarios),
-            'total_mensajes': len(mensajes),
-            'mensajes_hoy': self._contar_mensajes_hoy(mensajes),
-            'usuarios_activos_hoy': self._contar_usuarios_activos_hoy(mensajes)
+            'total_usuarios': 0,
+            'total_mensajes': 0,
+            'por_dia': {},
+            'activos': {},
+            'contabilizado': {},
+            'resumenes': {granularidad: {} for granularidad in GRANULARIDADES}
         }
     
-    def _contar_mensajes_hoy(self, mensajes: List[dict]) -> int:
-        """Cuenta mensajes de hoy"""
-        hoy = datetime.now().date()
-        return sum(
-            1 for m in mensajes 
-            if datetime.fromisoformat(m['timestamp']).date() == hoy
-        )
+    def _contabilizar_mensaje(self, registro: dict):
+        """Suma un mensaje a los contadores globales, a los del día y a los resúmenes por periodo.
+        
+        `activos` guarda los teléfonos vistos en cada periodo abierto (día, semana o mes)
+        para contar usuarios distintos; el tipo solo se cuenta en los mensajes entrantes.
+        """
+        stats = self._estadisticas
+        telefono = registro['telefono']
+        fecha = registro['timestamp'][:10]
+        tipo = None if registro.get('es_bot') else registro.get('tipo')
+        stats['total_mensajes'] += 1
+        dia = stats['por_dia'].setdefault(fecha, {'mensajes': 0, 'usuarios_activos': 0})
+        dia['mensajes'] += 1
+        for granularidad, clave in claves_periodo(fecha):
+            resumenes = stats['resumenes'][granularidad]
+            resumen = resumenes.get(clave)
+            if resumen is None:
+                resumen = resumenes[clave] = resumen_vacio()
+            resumen['mensajes'] += 1
+            if tipo:
+                resumen['tipos'][tipo] = resumen['tipos'].get(tipo, 0) + 1
+            activos = stats['activos'].setdefault(clave, set())
+            if telefono not in activos:
+                activos.add(telefono)
+                resumen['usuarios_activos'] += 1
+                if granularidad == 'dia':
+                    dia['usuarios_activos'] += 1
+        self._estadisticas_sucias = True
+    
+    def _cargar_estadisticas(self, reconstruir: bool = False):
+        """Carga estadisticas.json y contabiliza lo escrito en los segmentos después del último flush"""
+        stats = self._cargar_json(self.ruta_estadisticas)
+        if reconstruir or not stats or 'contabilizado' not in stats or 'resumenes' not in stats or any(
+            fin > self._mensajes.tamano_segmento(segmento)
+            for segmento, fin in stats['contabilizado'].items()
+        ):
+            # Al reconstruir se conservan los resúmenes de periodos que ya no tienen mensajes
+            self._estadisticas = stats or {}
+            self.reconstruir_estadisticas()
+            return
+        
+        stats['activos'] = {fecha: set(telefonos) for fecha, telefonos in stats['activos'].items()}
+        self._estadisticas = stats
+        self._firma_estadisticas = self._firma_archivo(self.ruta_estadisticas)
+        self._contabilizar_pendientes()
+    
+    def _sincronizar_estadisticas(self):
+        """En modo multiproceso, parte de estadisticas.json y le suma lo pendiente.
+    
+        Si otro proceso reescribió el archivo se recarga en lugar de la vista propia: los
+        mensajes se vuelven a contar desde sus offsets y los descuentos de mantenimiento
+        que hizo ese proceso se conservan. Quien escribe después lo hace sobre esta fusión
+        (lectura-modificación-escritura bajo el bloqueo), así que nadie pisa a nadie.
+        """
+        if not self.multiproceso:
+            return
+        with self._lock, self._bloqueo_archivos:
+            firma = self._firma_archivo(self.ruta_estadisticas)
+            if firma != self._firma_estadisticas:
+                stats = self._cargar_json(self.ruta_estadisticas)
+                if stats and 'contabilizado' in stats and 'resumenes' in stats:
+                    stats['activos'] = {fecha: set(telefonos) for fecha, telefonos in stats['activos'].items()}
+                    self._estadisticas = stats
+                    self._estadisticas_sucias = False
+                self._firma_estadisticas = firma
+            self._refrescar_usuarios()
+            total = len(self._telefonos_usuarios) + self._archivo_usuarios.contar()
+            if self._estadisticas['total_usuarios'] != total:
+                self._estadisticas['total_usuarios'] = total
+                self._estadisticas_sucias = True
+            self._contabilizar_pendientes()
+    
+    def _contabilizar_pendientes(self):
+        """Contabiliza lo agregado a los segmentos después de lo ya contado.
+        
+        En modo multiproceso es la única vía de conteo, así que también incluye lo que
+        escribieron otros procesos y descuenta los segmentos que alguno eliminó.
+        """
+        with self._lock:
+            contabilizado = self._estadisticas['contabilizado']
+            existentes = self._mensajes.segmentos()
+            for segmento in set(contabilizado) - set(existentes):
+                self._descontar_segmento(segmento)
+            for segmento in existentes:
+                inicio = contabilizado.get(segmento, 0)
+                if self._mensajes.tamano_segmento(segmento) <= inicio:
+                    continue
+                registros, fin = self._mensajes.leer_desde(segmento, inicio)
+                for m in registros:
+                    self._contabilizar_mensaje(m)
+                contabilizado[segmento] = fin
+    
+    def reconstruir_estadisticas(self):
+        """Recalcula todos los contadores recorriendo usuarios y mensajes.
+        
+        Los resúmenes son historial: los de periodos anteriores al primer mensaje que
+        queda (borrados por retención o archivados) se conservan como estaban, igual que
+        el del periodo donde cae ese mensaje, que solo se recalcula si no existía.
+        """
+        with self._lock:
+            self._flush_usuarios()
+            anteriores = (self._estadisticas or {}).get('resumenes') or {}
+            self._estadisticas = self._estadisticas_vacias()
+            self._estadisticas['total_usuarios'] = (
+                len(self._cargar_json(self.ruta_usuarios) or {}) + self._archivo_usuarios.contar()
+            )
+            for segmento in self._mensajes.segmentos():
+                for _, m in self._mensajes.escanear(segmento):
+                    self._contabilizar_mensaje(m)
+                self._estadisticas['contabilizado'][segmento] = self._mensajes.tamano_segmento(segmento)
+            for granularidad, resumenes in self._estadisticas['resumenes'].items():
+                primera = min(resumenes, default=None)
+                for clave, resumen in anteriores.get(granularidad, {}).items():
+                    if primera is None or clave <= primera:
+                        resumenes[clave] = resumen
+            self._estadisticas_sucias = True
+            self._guardar_estadisticas()
+    
+    def _descontar_segmento(self, segmento: str):
+        """Quita de los contadores los días cubiertos por un segmento eliminado.
+    
+        En modo multiproceso un periodo tiene un segmento por escritor: sus días se
+        descuentan cuando se va el último de ellos.
+        """
+        stats = self._estadisticas
+        stats['contabilizado'].pop(segmento, None)
+        self._estadisticas_sucias = True
+        periodo = self._mensajes.periodo(segmento)
+        if any(self._mensajes.periodo(s) == periodo for s in stats['contabilizado']):
+            return
+        for fecha in [f for f in stats['por_dia'] if f[:len(periodo)] == periodo]:
+            stats['total_mensajes'] -= stats['por_dia'].pop(fecha)['mensajes']
+            stats['activos'].pop(fecha, None)
+    
+    def _flush_estadisticas(self):
+        """Persiste los contadores (en modo multiproceso, fusionados con los de otros procesos)"""
+        with self._lock, self._bloqueo_archivos:
+            self._sincronizar_estadisticas()
+            self._guardar_estadisticas()
     
-    def _contar_usuarios_activos_hoy(self, mensajes: List[dict]) -> int:
-        """Cuenta usuarios únicos que enviaron mensajes hoy"""
-        hoy = datetime.now().date()
-        usuarios_hoy = set()
-        for m in mensajes:
-            if datetime.fromisoformat(m['timestamp']).date() == hoy:
-                usuarios_hoy.add(m['telefono'])
-        return len(usuarios_hoy)
+    def _guardar_estadisticas(self):
+        """Escribe estadisticas.json si hay cambios; solo se conservan los teléfonos de los periodos abiertos"""
+        with self._lock, self._bloqueo_archivos:
+            if not self._estadisticas_sucias:
+                return
+            hoy = datetime.now().date()
+            activos = self._estadisticas['activos']
+            for clave in [c for c in activos if not periodo_abierto(c, hoy)]:
+                del activos[clave]
+            self._guardar_json(self.ruta_estadisticas, {
+                **self._estadisticas,
+                'activos': {fecha: sorted(telefonos) for fecha, telefonos in activos.items()}
+            })
+            self._firma_estadisticas = self._firma_archivo(self.ruta_estadisticas)
+            self._estadisticas_sucias = False
+    
+    def obtener_estadisticas(self) -> Dict:
+        """Obtiene estadísticas generales del chatbot"""
+        hoy = datetime.now().date().isoformat()
+        with self._lock:
+            self._sincronizar_estadisticas()
+            dia = self._estadisticas['por_dia'].get(hoy, {})
+            return {
+                'total_usuarios': self._estadisticas['total_usuarios'],
+                'total_mensajes': self._estadisticas['total_mensajes'],
+                'mensajes_hoy': dia.get('mensajes', 0),
+                'usuarios_activos_hoy': dia.get('usuarios_activos', 0)
+            }
+    
+    def obtener_resumenes(self, desde: date, hasta: date, granularidad: str = 'dia') -> List[Dict]:
+        """Mensajes, usuarios distintos y tipos de mensaje por día, semana o mes.
+        
+        Solo lee los resúmenes que se mantienen al contabilizar cada mensaje; devuelve
+        los periodos que se traslapan con [desde, hasta].
+        """
+        if granularidad not in GRANULARIDADES:
+            raise ValueError(f"Granularidad desconocida: {granularidad}")
+        with self._lock:
+            self._sincronizar_estadisticas()
+            return seleccionar(self._estadisticas['resumenes'][granularidad], desde, hasta, granularidad)
     
     def limpiar_mensajes_antiguos(self, dias: int = 90) -> int:
-        """Elimina mensajes más antiguos que X días"""
-        mensajes = self._cargar_json(self.ruta_mensajes) or []
-        fecha_limite = datetime.now().timestamp() - (dias * 24 * 60 * 60)
-        
-        mensajes_filtrados = [
-            m for m in mensajes
-            if datetime.fromisoformat(m['timestamp']).timestamp() > fecha_limite
-        ]
-        
-        eliminados = len(mensajes) - len(mensajes_filtrados)
-        self._guardar_json(self.ruta_mensajes, mensajes_filtrados)
-        return eliminados
\ No newline at end of file
+        """Elimina mensajes más antiguos que X días borrando segmentos completos.
+        
+        Un segmento se elimina cuando todo su periodo quedó antes de la fecha límite,
+        así que nunca hace falta leerlo.
+        """
+        dia_limite = (datetime.now() - timedelta(days=dias)).date().isoformat()
+        
+        with self._lock, self._bloqueo_archivos:
+            self._sincronizar_estadisticas()
+            vencidos = self._mensajes.segmentos_anteriores(dia_limite)
+            eliminados = self._mensajes.eliminar_segmentos(vencidos)
+            for segmento in vencidos:
+                self._descontar_segmento(segmento)
+                self._busqueda.descartar_segmento(segmento)
+            self._guardar_estadisticas()
+        
+        return eliminados
+    
+    def archivar_mensajes_antiguos(self, dias: int = 180, compresion: str = 'gzip') -> Dict[str, int]:
+        """Mueve los segmentos con más de X días al archivo frío comprimido (datos/archivo).
+        
+        Primero se copian todos (cada uno queda con marca de archivado), luego se regenera
+        la exportación columnar de cada mes tocado y al final se borran los segmentos. Si
+        una corrida anterior se interrumpió, los segmentos con marca no se copian de nuevo.
+        Devuelve los mensajes archivados por periodo AAAA-MM.
+        """
+        archivo = ArchivoMensajes(os.path.join(self.ruta_datos, "archivo"), compresion)
+        dia_limite = (datetime.now() - timedelta(days=dias)).date().isoformat()
+        marcados = [clave for clave, marca in archivo.marcas().items() if marca.get('origen') == 'segmentos']
+        segmentos = sorted(set(self._mensajes.segmentos_anteriores(dia_limite)) | set(marcados))
+        
+        resumen: Dict[str, int] = {}
+        for segmento in segmentos:
+            periodo = self._mensajes.periodo(segmento)[:7]
+            total = archivo.archivar(
+                segmento, periodo, (m for _, m in self._mensajes.escanear(segmento)), origen='segmentos'
+            )
+            resumen[periodo] = resumen.get(periodo, 0) + total
+        for periodo in resumen:
+            archivo.exportar_columnas(periodo)
+        
+        with self._lock, self._bloqueo_archivos:
+            self._sincronizar_estadisticas()
+            self._mensajes.eliminar_segmentos(segmentos)
+            for segmento in segmentos:
+                self._descontar_segmento(segmento)
+                self._busqueda.descartar_segmento(segmento)
+            self._guardar_estadisticas()
+        for segmento in segmentos:
+            archivo.confirmar(segmento)
+        return resumen
+    
+    # MÉTODOS PARA MOVER DATOS ENTRE FRAGMENTOS
+    def listar_telefonos(self) -> List[str]:
+        """Teléfonos con usuario (activo o archivado) o con mensajes en este directorio"""
+        self._flush_usuarios()
+        telefonos = set(self._cargar_json(self.ruta_usuarios) or {})
+        telefonos.update(self._archivo_usuarios.telefonos())
+        telefonos.update(self._mensajes.telefonos())
+        return sorted(telefonos)
+    
+    def eliminar_telefonos(self, telefonos: Iterable[str]) -> int:
+        """Borra usuarios y mensajes de varios teléfonos (p. ej. ya copiados a otro fragmento).
+        
+        Solo se reescriben los segmentos que tienen mensajes suyos y a las estadísticas
+        se les resta lo que se borra, sin volver a recorrer los demás mensajes. Devuelve
+        cuántos mensajes se eliminaron.
+        """
+        telefonos = set(telefonos)
+        if not telefonos:
+            return 0
+        with self._lock, self._bloqueo_archivos:
+            self._flush_usuarios()
+            usuarios = self._cargar_json(self.ruta_usuarios) or {}
+            if telefonos & set(usuarios):
+                usuarios = {t: datos for t, datos in usuarios.items() if t not in telefonos}
+                self._guardar_json(self.ruta_usuarios, usuarios)
+                self._firma_usuarios = self._firma_archivo_usuarios()
+                self._telefonos_usuarios = set(usuarios)
+            self._archivo_usuarios.eliminar_varios(telefonos)
+            for telefono in telefonos:
+                self._cache_usuarios.pop(telefono, None)
+            
+            # Con los segmentos bloqueados nadie anexa entre el conteo y la reescritura
+            with self._mensajes.exclusivo():
+                self._sincronizar_estadisticas()
+                stats = self._estadisticas
+                stats['total_usuarios'] = len(usuarios) + self._archivo_usuarios.contar()
+                borrar = []
+                for telefono in telefonos:
+                    borrar += self._mensajes.leer(self._mensajes.referencias(telefono))
+                for (granularidad, clave), grupo in agrupar(
+                    (m['telefono'], m['timestamp'][:10], m.get('es_bot'), m.get('tipo')) for m in borrar
+                ).items():
+                    if clave in stats['activos']:
+                        stats['activos'][clave] -= grupo['telefonos']
+                    if granularidad == 'dia' and clave in stats['por_dia']:
+                        dia = stats['por_dia'][clave]
+                        dia['mensajes'] -= grupo['mensajes']
+                        dia['usuarios_activos'] -= len(grupo['telefonos'])
+                        if dia['mensajes'] <= 0:
+                            del stats['por_dia'][clave]
+                    # Los resúmenes guardan historial que ya no está en los mensajes
+                    resumen = stats['resumenes'][granularidad].get(clave)
+                    if resumen is not None:
+                        descontar(resumen, grupo)
+                        if resumen['mensajes'] <= 0:
+                            del stats['resumenes'][granularidad][clave]
+                stats['total_mensajes'] -= len(borrar)
+                
+                eliminados, reescritos = self._mensajes.eliminar_telefonos(telefonos)
+                # Los mensajes que quedan en los segmentos reescritos siguen buscándose
+                self._busqueda.reindexar_segmentos(reescritos)
+                for segmento in reescritos:
+                    # Ya estaba contado completo: lo contado es ahora el segmento reescrito
+                    tamano = self._mensajes.tamano_segmento(segmento)
+                    if tamano:
+                        stats['contabilizado'][segmento] = tamano
+                    else:
+                        stats['contabilizado'].pop(segmento, None)
+                self._estadisticas_sucias = True
+                self._guardar_estadisticas()
+        return eliminados
+    
+    def ordenar_mensajes(self, desde: Optional[date] = None, hasta: Optional[date] = None) -> int:
+        """Deja en orden cronológico los segmentos entre dos fechas (p. ej. después de copiarles
+        historial de otro fragmento, que queda detrás de lo que ya tenían).
+        
+        Los segmentos reescritos se vuelven a indexar para la búsqueda. Devuelve cuántos se reescribieron.
+        """
+        with self._lock:
+            segmentos = self._mensajes.segmentos_en_rango(
+                desde.isoformat() if desde else None, hasta.isoformat() if hasta else None
+            )
+            reordenados = self._mensajes.ordenar_segmentos(segmentos)
+            self._busqueda.reindexar_segmentos(reordenados)
+        return len(reordenados)
+
+def crear_base_datos(backend: Optional[str] = None, ruta_datos: Optional[str] = None):
+    """Crea el almacenamiento configurado en CHATBOT_BACKEND_DATOS ('json' o 'sqlite')
+    
+    Sin `ruta_datos` explícita, si CHATBOT_FRAGMENTOS lista varios directorios
+    ('nombre=ruta,nombre=ruta') los datos se reparten entre ellos por teléfono.
+    """
+    if ruta_datos is None:
+        fragmentos = os.getenv("CHATBOT_FRAGMENTOS", "").strip()
+        if fragmentos:
+            from services.base_datos_fragmentada import BaseDatosFragmentada, leer_fragmentos
+            return BaseDatosFragmentada(leer_fragmentos(fragmentos), backend)
+        ruta_datos = "datos"
+    backend = (backend or os.getenv("CHATBOT_BACKEND_DATOS", "json")).strip().lower()
+    if backend == 'json':
+        return BaseDatos(
+            ruta_datos,
+            max_usuarios_cache=int(os.getenv("CHATBOT_CACHE_USUARIOS", "10000")),
+            intervalo_flush=float(os.getenv("CHATBOT_FLUSH_SEGUNDOS", "5")),
+            particion_mensajes=os.getenv("CHATBOT_PARTICION_MENSAJES", "dia"),
+            multiproceso=os.getenv("CHATBOT_MULTIPROCESO", "0").lower() in ("1", "true", "si"),
+            dias_inactividad=int(os.getenv("CHATBOT_DIAS_USUARIO_INACTIVO", "0"))
+        )
+    if backend == 'sqlite':
+        from services.base_datos_sqlite import BaseDatosSQLite
+        return BaseDatosSQLite(ruta_datos)
+    raise ValueError(f"Backend de datos desconocido: {backend}")
@@ -0,0 +1,288 @@
+import argparse
+import bisect
+import hashlib
+import heapq
+import os
+import sys
+from itertools import chain
+from typing import Optional, List, Dict, Iterable, Iterator, Tuple
+from datetime import date
+
+sys.path.append('.')
+
+from models.usuario import Usuario
+from models.mensaje import Mensaje
+from services.base_datos import crear_base_datos
+from services.resumenes import resumen_vacio
+
+# Puntos que ocupa cada fragmento en el anillo; más puntos reparten la carga más parejo
+VIRTUALES = 160
+# Teléfonos que se copian (y luego se borran del origen) por paso al rebalancear
+TELEFONOS_POR_PASO = 500
+
+
+def _hash(clave: str) -> int:
+    return int.from_bytes(hashlib.blake2b(clave.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def leer_fragmentos(texto: str) -> Dict[str, str]:
+    """Interpreta una lista 'nombre=ruta,nombre=ruta' (sin nombre se usa el de la carpeta)"""
+    fragmentos: Dict[str, str] = {}
+    for parte in texto.split(','):
+        parte = parte.strip()
+        if not parte:
+            continue
+        nombre, _, ruta = parte.rpartition('=')
+        ruta = ruta.strip()
+        nombre = nombre.strip() or os.path.basename(os.path.normpath(ruta))
+        if nombre in fragmentos:
+            raise ValueError(f"Fragmento repetido: {nombre}")
+        fragmentos[nombre] = ruta
+    return fragmentos
+
+
+class AnilloHash:
+    """Hash consistente de teléfonos a fragmentos.
+
+    Cada fragmento ocupa `virtuales` puntos del anillo (hash de "nombre#i") y un teléfono
+    pertenece al primer punto que sigue a su propio hash. El dueño depende solo de los
+    nombres, no del orden ni de las rutas; al agregar o quitar un fragmento únicamente
+    cambian de dueño los teléfonos de los tramos que ese fragmento gana o pierde.
+    """
+
+    def __init__(self, nodos: List[str], virtuales: int = VIRTUALES):
+        if not nodos:
+            raise ValueError("Se necesita al menos un fragmento")
+        puntos = sorted((_hash(f"{nodo}#{i}"), nodo) for nodo in nodos for i in range(virtuales))
+        self.nodos = list(nodos)
+        self._puntos = [punto for punto, _ in puntos]
+        self._duenos = [nodo for _, nodo in puntos]
+
+    def nodo(self, telefono: str) -> str:
+        """Fragmento dueño de un teléfono"""
+        i = bisect.bisect(self._puntos, _hash(telefono))
+        return self._duenos[i % len(self._duenos)]
+
+
+class BaseDatosFragmentada:
+    """Reparte usuarios y mensajes entre varios directorios de datos según el teléfono.
+
+    Tiene la misma interfaz que BaseDatos: lo que pertenece a un teléfono va solo a su
+    fragmento y lo global (estadísticas, búsqueda, limpieza) se consulta en todos y se
+    combina. Cada fragmento es una base normal del backend configurado, así que puede
+    vivir en otro disco o en un volumen montado desde otro servidor.
+    """
+
+    def __init__(self, fragmentos: Dict[str, str], backend: Optional[str] = None,
+                 virtuales: int = VIRTUALES):
+        self.rutas = dict(fragmentos)
+        self.anillo = AnilloHash(list(fragmentos), virtuales)
+        self.fragmentos = {nombre: crear_base_datos(backend, ruta) for nombre, ruta in fragmentos.items()}
+
+    def fragmento(self, telefono: str):
+        """Base de datos del fragmento dueño del teléfono"""
+        return self.fragmentos[self.anillo.nodo(telefono)]
+
+    def _por_fragmento(self, elementos: Iterable, telefono) -> Dict[str, list]:
+        grupos: Dict[str, list] = {}
+        for elemento in elementos:
+            grupos.setdefault(self.anillo.nodo(telefono(elemento)), []).append(elemento)
+        return grupos
+
+    def flush(self):
+        for bd in self.fragmentos.values():
+            bd.flush()
+
+    def cerrar(self):
+        for bd in self.fragmentos.values():
+            bd.cerrar()
+
+    # MÉTODOS PARA USUARIOS
+    def guardar_usuario(self, usuario: Usuario) -> bool:
+        return self.fragmento(usuario.telefono).guardar_usuario(usuario)
+
+    def obtener_usuario(self, telefono: str) -> Optional[Usuario]:
+        return self.fragmento(telefono).obtener_usuario(telefono)
+
+    def usuario_existe(self, telefono: str) -> bool:
+        return self.fragmento(telefono).usuario_existe(telefono)
+
+    def obtener_todos_usuarios(self) -> List[Usuario]:
+        return [u for bd in self.fragmentos.values() for u in bd.obtener_todos_usuarios()]
+
+    def archivar_usuarios_inactivos(self, dias: Optional[int] = None) -> int:
+        return sum(bd.archivar_usuarios_inactivos(dias) for bd in self.fragmentos.values())
+
+    # MÉTODOS PARA MENSAJES
+    def guardar_mensaje(self, mensaje: Mensaje) -> bool:
+        return self.fragmento(mensaje.telefono).guardar_mensaje(mensaje)
+
+    def guardar_lote(self, usuarios: List[Usuario], mensajes: List[Mensaje], fsync: bool = False) -> bool:
+        """Divide el lote por fragmento; devuelve False si alguno falló"""
+        usuarios_por_fragmento = self._por_fragmento(usuarios, lambda u: u.telefono)
+        mensajes_por_fragmento = self._por_fragmento(mensajes, lambda m: m.telefono)
+        correcto = True
+        for nombre in set(usuarios_por_fragmento) | set(mensajes_por_fragmento):
+            correcto = self.fragmentos[nombre].guardar_lote(
+                usuarios_por_fragmento.get(nombre, []), mensajes_por_fragmento.get(nombre, []), fsync
+            ) and correcto
+        return correcto
+
+    def obtener_mensajes_usuario(self, telefono: str, limite: int = 50) -> List[Mensaje]:
+        return self.fragmento(telefono).obtener_mensajes_usuario(telefono, limite)
+
+    def obtener_historial_completo(self, telefono: str) -> List[Mensaje]:
+        return self.fragmento(telefono).obtener_historial_completo(telefono)
+
+    def contar_mensajes_usuario(self, telefono: str) -> int:
+        return self.fragmento(telefono).contar_mensajes_usuario(telefono)
+
+    def obtener_pagina_mensajes(self, telefono: str, limite: int = 20, antes_de: Optional[str] = None,
+                                despues_de: Optional[str] = None) -> Optional[List[Mensaje]]:
+        return self.fragmento(telefono).obtener_pagina_mensajes(telefono, limite, antes_de, despues_de)
+
+    def iterar_mensajes_usuario(self, telefono: str) -> Iterator[Mensaje]:
+        return self.fragmento(telefono).iterar_mensajes_usuario(telefono)
+
+    def iterar_mensajes(self, desde: Optional[date] = None, hasta: Optional[date] = None,
+                        telefono: Optional[str] = None) -> Iterator[Mensaje]:
+        """Con teléfono lee solo su fragmento; sin él intercala todos por fecha"""
+        if telefono is not None:
+            return self.fragmento(telefono).iterar_mensajes(desde, hasta, telefono)
+        return heapq.merge(
+            *(bd.iterar_mensajes(desde, hasta) for bd in self.fragmentos.values()),
+            key=lambda m: m.timestamp
+        )
+
+    def buscar_mensajes(self, consulta: str, telefono: Optional[str] = None, desde: Optional[date] = None,
+                        hasta: Optional[date] = None, limite: int = 20) -> List[Tuple[Mensaje, float]]:
+        """Busca en todos los fragmentos y conserva los `limite` mejores puntajes.
+
+        Cada fragmento calcula BM25 con sus propias frecuencias, así que los puntajes
+        de fragmentos distintos son comparables solo de forma aproximada.
+        """
+        if telefono is not None:
+            return self.fragmento(telefono).buscar_mensajes(consulta, telefono, desde, hasta, limite)
+        return heapq.nlargest(limite, chain.from_iterable(
+            bd.buscar_mensajes(consulta, None, desde, hasta, limite) for bd in self.fragmentos.values()
+        ), key=lambda par: par[1])
+
+    # MÉTODOS DE ESTADÍSTICAS
+    def obtener_estadisticas(self) -> Dict:
+        """Suma las estadísticas de los fragmentos (cada teléfono vive en uno solo)"""
+        totales = {'total_usuarios': 0, 'total_mensajes': 0, 'mensajes_hoy': 0, 'usuarios_activos_hoy': 0}
+        for bd in self.fragmentos.values():
+            for clave, valor in bd.obtener_estadisticas().items():
+                totales[clave] = totales.get(clave, 0) + valor
+        return totales
+
+    def obtener_resumenes(self, desde: date, hasta: date, granularidad: str = 'dia') -> List[Dict]:
+        """Suma por periodo los resúmenes de los fragmentos (los usuarios no se repiten entre fragmentos)"""
+        periodos: Dict[str, Dict] = {}
+        for bd in self.fragmentos.values():
+            for resumen in bd.obtener_resumenes(desde, hasta, granularidad):
+                total = periodos.setdefault(resumen['periodo'], resumen_vacio())
+                total['mensajes'] += resumen['mensajes']
+                total['usuarios_activos'] += resumen['usuarios_activos']
+                for tipo, cantidad in resumen['tipos'].items():
+                    total['tipos'][tipo] = total['tipos'].get(tipo, 0) + cantidad
+        return [{'periodo': periodo, **periodos[periodo]} for periodo in sorted(periodos)]
+
+    def reconstruir_estadisticas(self):
+        for bd in self.fragmentos.values():
+            if hasattr(bd, 'reconstruir_estadisticas'):
+                bd.reconstruir_estadisticas()
+
+    def limpiar_mensajes_antiguos(self, dias: int = 90) -> int:
+        return sum(bd.limpiar_mensajes_antiguos(dias) for bd in self.fragmentos.values())
+
+    def archivar_mensajes_antiguos(self, dias: int = 180, compresion: str = 'gzip') -> Dict[str, int]:
+        resumen: Dict[str, int] = {}
+        for bd in self.fragmentos.values():
+            for periodo, total in bd.archivar_mensajes_antiguos(dias, compresion).items():
+                resumen[periodo] = resumen.get(periodo, 0) + total
+        return resumen
+
+    # MÉTODOS PARA MOVER DATOS ENTRE FRAGMENTOS
+    def listar_telefonos(self) -> List[str]:
+        return sorted(chain.from_iterable(bd.listar_telefonos() for bd in self.fragmentos.values()))
+
+    def eliminar_telefonos(self, telefonos: Iterable[str]) -> int:
+        return sum(
+            self.fragmentos[nombre].eliminar_telefonos(grupo)
+            for nombre, grupo in self._por_fragmento(telefonos, lambda t: t).items()
+        )
+
+
+def _copiar_telefonos(origen, destino, telefonos: List[str]) -> int:
+    """Copia usuarios y mensajes al destino sin duplicar los que ya tenga; devuelve mensajes copiados"""
+    usuarios = [u for u in (origen.obtener_usuario(t) for t in telefonos) if u is not None]
+    copiados = 0
+    lote: List[Mensaje] = []
+    for telefono in telefonos:
+        # Si un rebalanceo anterior se interrumpió, parte de los mensajes ya está en el destino
+        existentes = {m.id for m in destino.iterar_mensajes_usuario(telefono)}
+        for mensaje in origen.iterar_mensajes_usuario(telefono):
+            if mensaje.id not in existentes:
+                lote.append(mensaje)
+    for inicio in range(0, max(len(lote), 1), 1000):
+        if not destino.guardar_lote(usuarios if inicio == 0 else [], lote[inicio:inicio + 1000], fsync=True):
+            raise RuntimeError("No se pudo escribir en el fragmento de destino; vuelva a ejecutar el rebalanceo")
+        copiados += len(lote[inicio:inicio + 1000])
+    # El historial copiado quedó detrás de lo que el destino ya tenía en esos días
+    if lote and hasattr(destino, 'ordenar_mensajes'):
+        fechas = [mensaje.timestamp.date() for mensaje in lote]
+        destino.ordenar_mensajes(min(fechas), max(fechas))
+    return copiados
+
+
+def rebalancear(anteriores: Dict[str, str], nuevos: Dict[str, str], backend: Optional[str] = None,
+                virtuales: int = VIRTUALES) -> Dict[str, int]:
+    """Mueve a su nuevo dueño los teléfonos que cambian de fragmento al pasar de `anteriores` a `nuevos`.
+
+    Solo se leen y escriben los teléfonos afectados. Cada paso copia al destino con fsync
+    y después borra del origen, así que si se interrumpe se puede volver a ejecutar.
+    Debe correr con el servicio detenido.
+    """
+    rutas = dict(anteriores)
+    for nombre, ruta in nuevos.items():
+        if nombre in rutas and os.path.abspath(rutas[nombre]) != os.path.abspath(ruta):
+            raise ValueError(f"El fragmento {nombre} cambió de ruta: {rutas[nombre]} -> {ruta}")
+        rutas[nombre] = ruta
+    anillo = AnilloHash(list(nuevos), virtuales)
+    bases = {nombre: crear_base_datos(backend, ruta) for nombre, ruta in rutas.items()}
+    resumen = {'telefonos': 0, 'mensajes': 0}
+    try:
+        for nombre in anteriores:
+            origen = bases[nombre]
+            por_destino: Dict[str, List[str]] = {}
+            for telefono in origen.listar_telefonos():
+                dueno = anillo.nodo(telefono)
+                if dueno != nombre:
+                    por_destino.setdefault(dueno, []).append(telefono)
+            for destino, telefonos in por_destino.items():
+                print(f"   {nombre} -> {destino}: {len(telefonos)} teléfonos")
+                for inicio in range(0, len(telefonos), TELEFONOS_POR_PASO):
+                    paso = telefonos[inicio:inicio + TELEFONOS_POR_PASO]
+                    resumen['mensajes'] += _copiar_telefonos(origen, bases[destino], paso)
+                    bases[destino].flush()
+                    origen.eliminar_telefonos(paso)
+                    resumen['telefonos'] += len(paso)
+    finally:
+        for bd in bases.values():
+            bd.cerrar()
+    for nombre in set(anteriores) - set(nuevos):
+        print(f"ℹ️ El fragmento {nombre} ({anteriores[nombre]}) quedó vacío y puede retirarse")
+    return resumen
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebalancea los fragmentos de datos al cambiar CHATBOT_FRAGMENTOS")
+    parser.add_argument('--anteriores', required=True, help="Fragmentos actuales: 'nombre=ruta,nombre=ruta'")
+    parser.add_argument('--nuevos', required=True, help="Fragmentos después del cambio")
+    parser.add_argument('--backend', choices=['json', 'sqlite'], default=None,
+                        help="Backend de los fragmentos (por defecto CHATBOT_BACKEND_DATOS)")
+    args = parser.parse_args()
+
+    resumen = rebalancear(leer_fragmentos(args.anteriores), leer_fragmentos(args.nuevos), args.backend)
+    print(f"✅ {resumen['telefonos']} teléfonos movidos ({resumen['mensajes']} mensajes)")
@@ -0,0 +1,688 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Optional, List, Dict, Iterable, Iterator, Tuple
+from datetime import datetime, date, timedelta
+from models.usuario import Usuario
+from models.mensaje import Mensaje, id_de_registro
+from services.archivo_mensajes import ArchivoMensajes
+from services.procesador_lenguaje import ProcesadorLenguajeNatural
+from services.resumenes import (
+    GRANULARIDADES, agrupar, clave_periodo, claves_periodo, descontar, primera_clave_abierta
+)
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS usuarios (
+    telefono TEXT PRIMARY KEY,
+    nombre TEXT,
+    carrera TEXT,
+    semestre INTEGER,
+    fecha_registro TEXT,
+    ultima_interaccion TEXT,
+    conversaciones TEXT
+);
+CREATE TABLE IF NOT EXISTS mensajes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    telefono TEXT NOT NULL,
+    contenido TEXT,
+    es_bot INTEGER NOT NULL DEFAULT 0,
+    timestamp TEXT NOT NULL,
+    tipo TEXT,
+    fecha TEXT NOT NULL,
+    epoch REAL NOT NULL,
+    id_mensaje TEXT,
+    entidades TEXT,
+    tiempos TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_mensajes_telefono_timestamp ON mensajes (telefono, timestamp);
+CREATE INDEX IF NOT EXISTS idx_mensajes_fecha ON mensajes (fecha, telefono);
+CREATE INDEX IF NOT EXISTS idx_mensajes_epoch ON mensajes (epoch);
+CREATE TABLE IF NOT EXISTS resumenes (
+    granularidad TEXT NOT NULL,
+    periodo TEXT NOT NULL,
+    mensajes INTEGER NOT NULL DEFAULT 0,
+    usuarios_activos INTEGER NOT NULL DEFAULT 0,
+    tipos TEXT NOT NULL DEFAULT '{}',
+    PRIMARY KEY (granularidad, periodo)
+);
+CREATE TABLE IF NOT EXISTS activos_periodo (
+    periodo TEXT NOT NULL,
+    telefono TEXT NOT NULL,
+    PRIMARY KEY (periodo, telefono)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS totales (
+    nombre TEXT PRIMARY KEY,
+    valor INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS totales_usuarios_insertar AFTER INSERT ON usuarios BEGIN
+    UPDATE totales SET valor = valor + 1 WHERE nombre = 'usuarios';
+END;
+CREATE TRIGGER IF NOT EXISTS totales_usuarios_borrar AFTER DELETE ON usuarios BEGIN
+    UPDATE totales SET valor = valor - 1 WHERE nombre = 'usuarios';
+END;
+"""
+
+# Upsert y no INSERT OR REPLACE: el reemplazo no dispara el trigger de borrado y
+# totales contaría dos veces al mismo usuario
+GUARDAR_USUARIO = (
+    "INSERT INTO usuarios (telefono, nombre, carrera, semestre, fecha_registro, ultima_interaccion, "
+    "conversaciones) VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (telefono) DO UPDATE SET "
+    "nombre = excluded.nombre, carrera = excluded.carrera, semestre = excluded.semestre, "
+    "fecha_registro = excluded.fecha_registro, ultima_interaccion = excluded.ultima_interaccion, "
+    "conversaciones = excluded.conversaciones"
+)
+
+INSERTAR_MENSAJE = (
+    "INSERT INTO mensajes (telefono, contenido, es_bot, timestamp, tipo, fecha, epoch, id_mensaje, "
+    "entidades, tiempos) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+class BaseDatosSQLite:
+    """Persistencia en SQLite con la misma interfaz que BaseDatos
+
+    Es segura con varios procesos: WAL permite lectores concurrentes y los escritores
+    esperan su turno (timeout de 30 s) en lugar de fallar.
+    """
+
+    def __init__(self, ruta_datos: str = "datos"):
+        self.ruta_datos = ruta_datos
+        self.ruta_sqlite = os.path.join(ruta_datos, "chatbot.sqlite3")
+        if not os.path.exists(ruta_datos):
+            os.makedirs(ruta_datos)
+        self._lock = threading.Lock()
+        # Ids de mensajes confirmados por un guardar_lote cuyo checkpoint falló después; si
+        # el lote se reintenta, esos mensajes no se vuelven a insertar
+        self._anexados_sin_confirmar = set()
+        self._conexion = sqlite3.connect(
+            self.ruta_sqlite, check_same_thread=False, timeout=30
+        )
+        self._conexion.row_factory = sqlite3.Row
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=NORMAL")
+        # La búsqueda indexa el contenido normalizado igual que el procesador de lenguaje
+        self._normalizar = ProcesadorLenguajeNatural().limpiar_texto
+        self._conexion.create_function(
+            "normalizar", 1, lambda texto: self._normalizar(texto or ''), deterministic=True
+        )
+        sin_resumenes = not self._conexion.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'resumenes'"
+        ).fetchone()
+        self._conexion.executescript(ESQUEMA)
+        # Se cuenta una sola vez; desde ahí lo mantienen los triggers de usuarios
+        self._conexion.execute(
+            "INSERT OR IGNORE INTO totales (nombre, valor) SELECT 'usuarios', COUNT(*) FROM usuarios "
+            "WHERE NOT EXISTS (SELECT 1 FROM totales WHERE nombre = 'usuarios')"
+        )
+        self._agregar_columnas_faltantes()
+        self._migrar_ids_mensaje()
+        self._conexion.commit()
+        self._crear_busqueda()
+        # Día de la última poda de activos_periodo
+        self._poda_activos: Optional[date] = None
+        if sin_resumenes:
+            self.reconstruir_resumenes()
+
+    def _agregar_columnas_faltantes(self):
+        """Agrega a bases anteriores las columnas de mensajes que se sumaron después"""
+        columnas = [fila['name'] for fila in self._conexion.execute("PRAGMA table_info(mensajes)")]
+        for columna in ('id_mensaje', 'entidades', 'tiempos'):
+            if columna not in columnas:
+                self._conexion.execute(f"ALTER TABLE mensajes ADD COLUMN {columna} TEXT")
+
+    def _migrar_ids_mensaje(self):
+        """Llena id_mensaje para las filas guardadas antes de que existiera"""
+        ultimo = 0
+        while True:
+            filas = self._conexion.execute(
+                "SELECT id, telefono, contenido, es_bot, timestamp FROM mensajes "
+                "WHERE id > ? AND id_mensaje IS NULL ORDER BY id LIMIT 1000", (ultimo,)
+            ).fetchall()
+            if not filas:
+                break
+            self._conexion.executemany(
+                "UPDATE mensajes SET id_mensaje = ? WHERE id = ?",
+                [(id_de_registro({
+                    'telefono': f['telefono'],
+                    'contenido': f['contenido'],
+                    'es_bot': bool(f['es_bot']),
+                    'timestamp': f['timestamp']
+                }), f['id']) for f in filas]
+            )
+            ultimo = filas[-1]['id']
+        self._conexion.execute("CREATE INDEX IF NOT EXISTS idx_mensajes_id_mensaje ON mensajes (id_mensaje)")
+
+    def _soporta_fts5(self) -> bool:
+        """Si este SQLite trae el módulo FTS5 (algunas compilaciones no lo incluyen)"""
+        try:
+            self._conexion.execute("CREATE VIRTUAL TABLE temp.prueba_fts5 USING fts5(texto)")
+            self._conexion.execute("DROP TABLE temp.prueba_fts5")
+            return True
+        except sqlite3.OperationalError:
+            print("⚠️  SQLite sin FTS5: la búsqueda de mensajes se hará sin índice")
+            return False
+
+    def _crear_busqueda(self):
+        """Crea el índice FTS5 del contenido normalizado y lo llena con los mensajes existentes.
+
+        Sin FTS5 la búsqueda compara las palabras de los mensajes filtrados (ver
+        buscar_mensajes) y se quitan los triggers que llenan el índice: sin el módulo
+        harían fallar cada escritura en una base creada con FTS5.
+        """
+        self.fts5 = self._soporta_fts5()
+        if not self.fts5:
+            self._conexion.create_function("coincidencias", 2, self._coincidencias, deterministic=True)
+        self._conexion.execute("BEGIN IMMEDIATE")
+        try:
+            if not self.fts5:
+                self._conexion.execute("DROP TRIGGER IF EXISTS mensajes_busqueda_insertar")
+                self._conexion.execute("DROP TRIGGER IF EXISTS mensajes_busqueda_borrar")
+                self._conexion.commit()
+                return
+            existe = self._conexion.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'mensajes_busqueda'"
+            ).fetchone()
+            sin_triggers = not self._conexion.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'mensajes_busqueda_insertar'"
+            ).fetchone()
+            if not existe:
+                self._conexion.execute("CREATE VIRTUAL TABLE mensajes_busqueda USING fts5(texto)")
+            elif sin_triggers:
+                # La base se usó sin FTS5 y el índice dejó de seguir a mensajes
+                self._conexion.execute("DELETE FROM mensajes_busqueda")
+            if not existe or sin_triggers:
+                self._conexion.execute(
+                    "INSERT INTO mensajes_busqueda (rowid, texto) SELECT id, normalizar(contenido) FROM mensajes"
+                )
+            self._conexion.execute(
+                "CREATE TRIGGER IF NOT EXISTS mensajes_busqueda_insertar AFTER INSERT ON mensajes BEGIN "
+                "INSERT INTO mensajes_busqueda (rowid, texto) VALUES (new.id, normalizar(new.contenido)); END"
+            )
+            self._conexion.execute(
+                "CREATE TRIGGER IF NOT EXISTS mensajes_busqueda_borrar AFTER DELETE ON mensajes BEGIN "
+                "DELETE FROM mensajes_busqueda WHERE rowid = old.id; END"
+            )
+            self._conexion.commit()
+        except Exception:
+            self._conexion.rollback()
+            raise
+
+    def _coincidencias(self, contenido: Optional[str], terminos: str) -> int:
+        """Cuántos de los términos (separados por espacios) aparecen como palabra en el contenido"""
+        return len(set(terminos.split()).intersection(self._normalizar(contenido or '').split()))
+
+    def flush(self):
+        """Las escrituras en SQLite se confirman al momento; no hay nada pendiente"""
+
+    def cerrar(self):
+        """Cierra la conexión con la base de datos"""
+        with self._lock:
+            self._conexion.close()
+
+    def _usuario_desde_fila(self, fila: sqlite3.Row) -> Usuario:
+        datos = dict(fila)
+        datos['conversaciones'] = json.loads(datos['conversaciones'] or '[]')
+        return Usuario.from_dict(datos)
+
+    def _mensaje_desde_fila(self, fila: sqlite3.Row) -> Mensaje:
+        return Mensaje.from_dict({
+            'id': fila['id_mensaje'],
+            'telefono': fila['telefono'],
+            'contenido': fila['contenido'],
+            'es_bot': bool(fila['es_bot']),
+            'timestamp': fila['timestamp'],
+            'tipo': fila['tipo'],
+            'entidades': json.loads(fila['entidades'] or '{}'),
+            'tiempos': json.loads(fila['tiempos'] or '{}')
+        })
+
+    @staticmethod
+    def _fila_mensaje(mensaje: Mensaje) -> tuple:
+        datos = mensaje.to_dict()
+        return (
+            datos['telefono'], datos['contenido'], int(datos['es_bot']),
+            datos['timestamp'], datos['tipo'], datos['timestamp'][:10],
+            mensaje.timestamp.timestamp(), datos['id'],
+            json.dumps(datos['entidades'], ensure_ascii=False) if 'entidades' in datos else None,
+            json.dumps(datos['tiempos']) if 'tiempos' in datos else None
+        )
+
+    # MÉTODOS PARA USUARIOS
+    def guardar_usuario(self, usuario: Usuario) -> bool:
+        """Guarda o actualiza un usuario"""
+        try:
+            datos = usuario.to_dict()
+            with self._lock, self._conexion:
+                self._conexion.execute(
+                    GUARDAR_USUARIO,
+                    (datos['telefono'], datos['nombre'], datos['carrera'], datos['semestre'],
+                     datos['fecha_registro'], datos['ultima_interaccion'],
+                     json.dumps(datos['conversaciones'], ensure_ascii=False))
+                )
+            return True
+        except Exception as e:
+            print(f"Error al guardar usuario: {e}")
+            return False
+
+    def obtener_usuario(self, telefono: str) -> Optional[Usuario]:
+        """Obtiene un usuario por su teléfono"""
+        with self._lock:
+            fila = self._conexion.execute(
+                "SELECT * FROM usuarios WHERE telefono = ?", (telefono,)
+            ).fetchone()
+        return self._usuario_desde_fila(fila) if fila else None
+
+    def usuario_existe(self, telefono: str) -> bool:
+        """Verifica si un usuario existe"""
+        with self._lock:
+            fila = self._conexion.execute(
+                "SELECT 1 FROM usuarios WHERE telefono = ?", (telefono,)
+            ).fetchone()
+        return fila is not None
+
+    def obtener_todos_usuarios(self) -> List[Usuario]:
+        """Obtiene todos los usuarios"""
+        with self._lock:
+            filas = self._conexion.execute("SELECT * FROM usuarios").fetchall()
+        return [self._usuario_desde_fila(f) for f in filas]
+
+    def archivar_usuarios_inactivos(self, dias: Optional[int] = None) -> int:
+        """Los usuarios se buscan por clave primaria, así que los inactivos no encarecen
+        las consultas y no hace falta sacarlos de la tabla"""
+        return 0
+
+    # MÉTODOS PARA MENSAJES
+    def guardar_mensaje(self, mensaje: Mensaje) -> bool:
+        """Guarda un mensaje en el historial"""
+        try:
+            fila = self._fila_mensaje(mensaje)
+            with self._lock, self._conexion:
+                self._conexion.execute(INSERTAR_MENSAJE, fila)
+                self._sumar_a_resumenes([(fila[0], fila[5], fila[2], fila[4])])
+            return True
+        except Exception as e:
+            print(f"Error al guardar mensaje: {e}")
+            return False
+
+    def guardar_lote(self, usuarios: List[Usuario], mensajes: List[Mensaje], fsync: bool = False) -> bool:
+        """Guarda varios usuarios y mensajes en una sola transacción.
+
+        Si falla el checkpoint posterior, al reintentar el mismo lote solo se escribe lo que faltó.
+        """
+        try:
+            filas_usuarios = []
+            for usuario in usuarios:
+                datos = usuario.to_dict()
+                filas_usuarios.append(
+                    (datos['telefono'], datos['nombre'], datos['carrera'], datos['semestre'],
+                     datos['fecha_registro'], datos['ultima_interaccion'],
+                     json.dumps(datos['conversaciones'], ensure_ascii=False))
+                )
+            with self._lock:
+                filas_mensajes = [
+                    self._fila_mensaje(mensaje) for mensaje in mensajes
+                    if mensaje.id not in self._anexados_sin_confirmar
+                ]
+                with self._conexion:
+                    self._conexion.executemany(GUARDAR_USUARIO, filas_usuarios)
+                    self._conexion.executemany(INSERTAR_MENSAJE, filas_mensajes)
+                    self._sumar_a_resumenes([(f[0], f[5], f[2], f[4]) for f in filas_mensajes])
+                self._anexados_sin_confirmar.update(f[7] for f in filas_mensajes)
+                if fsync:
+                    self._conexion.execute("PRAGMA wal_checkpoint(FULL)")
+                self._anexados_sin_confirmar.difference_update(m.id for m in mensajes)
+            return True
+        except Exception as e:
+            print(f"Error al guardar lote: {e}")
+            return False
+
+    def obtener_mensajes_usuario(self, telefono: str, limite: int = 50) -> List[Mensaje]:
+        """Obtiene los últimos mensajes de un usuario"""
+        with self._lock:
+            filas = self._conexion.execute(
+                "SELECT * FROM mensajes WHERE telefono = ? ORDER BY timestamp DESC, id DESC LIMIT ?",
+                (telefono, limite)
+            ).fetchall()
+        return [self._mensaje_desde_fila(f) for f in reversed(filas)]
+
+    def obtener_historial_completo(self, telefono: str) -> List[Mensaje]:
+        """Obtiene el historial completo de un usuario"""
+        with self._lock:
+            filas = self._conexion.execute(
+                "SELECT * FROM mensajes WHERE telefono = ? ORDER BY timestamp, id", (telefono,)
+            ).fetchall()
+        return [self._mensaje_desde_fila(f) for f in filas]
+
+    def contar_mensajes_usuario(self, telefono: str) -> int:
+        """Cuenta los mensajes de un usuario"""
+        with self._lock:
+            return self._conexion.execute(
+                "SELECT COUNT(*) FROM mensajes WHERE telefono = ?", (telefono,)
+            ).fetchone()[0]
+
+    def obtener_pagina_mensajes(self, telefono: str, limite: int = 20, antes_de: Optional[str] = None,
+                                despues_de: Optional[str] = None) -> Optional[List[Mensaje]]:
+        """Obtiene una página del historial de un usuario usando ids de mensaje como cursores
+
+        Con `antes_de` devuelve los `limite` mensajes anteriores a ese id y con `despues_de`
+        los siguientes; sin cursores, los últimos `limite`. Devuelve None si un cursor no existe.
+        """
+        condiciones = ["telefono = ?"]
+        parametros: list = [telefono]
+        with self._lock:
+            for cursor, operador in ((despues_de, '>'), (antes_de, '<')):
+                if not cursor:
+                    continue
+                fila = self._conexion.execute(
+                    "SELECT timestamp, id FROM mensajes WHERE id_mensaje = ? AND telefono = ?",
+                    (cursor, telefono)
+                ).fetchone()
+                if fila is None:
+                    return None
+                condiciones.append(f"(timestamp {operador} ? OR (timestamp = ? AND id {operador} ?))")
+                parametros.extend([fila['timestamp'], fila['timestamp'], fila['id']])
+            orden = "ASC" if despues_de else "DESC"
+            filas = self._conexion.execute(
+                f"SELECT * FROM mensajes WHERE {' AND '.join(condiciones)} "
+                f"ORDER BY timestamp {orden}, id {orden} LIMIT ?",
+                (*parametros, limite)
+            ).fetchall()
+        if not despues_de:
+            filas.reverse()
+        return [self._mensaje_desde_fila(f) for f in filas]
+
+    def _iterar_consulta(self, consulta: str, parametros: tuple) -> Iterator[Mensaje]:
+        """Recorre una consulta con una conexión de solo lectura propia (una instantánea WAL),
+        sin bloquear a los escritores ni cargar todas las filas"""
+        conexion = sqlite3.connect(f"file:{self.ruta_sqlite}?mode=ro", uri=True, timeout=30)
+        conexion.row_factory = sqlite3.Row
+        try:
+            cursor = conexion.execute(consulta, parametros)
+            while True:
+                filas = cursor.fetchmany(500)
+                if not filas:
+                    break
+                for fila in filas:
+                    yield self._mensaje_desde_fila(fila)
+        finally:
+            conexion.close()
+
+    def iterar_mensajes_usuario(self, telefono: str) -> Iterator[Mensaje]:
+        """Recorre el historial completo de un usuario"""
+        return self._iterar_consulta(
+            "SELECT * FROM mensajes WHERE telefono = ? ORDER BY timestamp, id", (telefono,)
+        )
+
+    def iterar_mensajes(self, desde: Optional[date] = None, hasta: Optional[date] = None,
+                        telefono: Optional[str] = None) -> Iterator[Mensaje]:
+        """Recorre los mensajes entre dos fechas (inclusivas)"""
+        condiciones = ["fecha >= ?", "fecha <= ?"]
+        parametros = [desde.isoformat() if desde else '', hasta.isoformat() if hasta else '9999']
+        if telefono is not None:
+            condiciones.append("telefono = ?")
+            parametros.append(telefono)
+        return self._iterar_consulta(
+            f"SELECT * FROM mensajes WHERE {' AND '.join(condiciones)} ORDER BY fecha, timestamp, id",
+            tuple(parametros)
+        )
+
+    def buscar_mensajes(self, consulta: str, telefono: Optional[str] = None, desde: Optional[date] = None,
+                        hasta: Optional[date] = None, limite: int = 20) -> List[Tuple[Mensaje, float]]:
+        """Busca mensajes por contenido y los devuelve con su puntaje, del más relevante al menos.
+
+        Con FTS5 el puntaje es BM25; sin él, el número de términos de la consulta que
+        contiene cada mensaje (se recorren todos los que pasan los filtros).
+        """
+        terminos = list(dict.fromkeys(self._normalizar(consulta).split()))
+        if not terminos:
+            return []
+        if self.fts5:
+            # bm25() de SQLite es menor mientras más relevante
+            origen = ("bm25(mensajes_busqueda) AS puntaje FROM mensajes_busqueda "
+                      "JOIN mensajes m ON m.id = mensajes_busqueda.rowid")
+            condiciones = ["mensajes_busqueda MATCH ?"]
+            parametros: list = [' OR '.join(f'"{termino}"' for termino in terminos)]
+            orden, signo = "puntaje", -1
+        else:
+            origen = "coincidencias(m.contenido, ?) AS puntaje FROM mensajes m"
+            condiciones = ["puntaje > 0"]
+            parametros = [' '.join(terminos)]
+            orden, signo = "puntaje DESC", 1
+        if telefono is not None:
+            condiciones.append("m.telefono = ?")
+            parametros.append(telefono)
+        if desde is not None:
+            condiciones.append("m.fecha >= ?")
+            parametros.append(desde.isoformat())
+        if hasta is not None:
+            condiciones.append("m.fecha <= ?")
+            parametros.append(hasta.isoformat())
+        with self._lock:
+            filas = self._conexion.execute(
+                f"SELECT m.*, {origen} WHERE {' AND '.join(condiciones)} ORDER BY {orden}, m.id DESC LIMIT ?",
+                (*parametros, limite)
+            ).fetchall()
+        return [(self._mensaje_desde_fila(f), signo * float(f['puntaje'])) for f in filas]
+
+    # MÉTODOS DE ESTADÍSTICAS
+    def obtener_estadisticas(self) -> Dict:
+        """Obtiene estadísticas generales del chatbot sin recorrer las tablas.
+
+        Los usuarios salen de totales y los mensajes de los resúmenes por día: los días
+        posteriores al mensaje más antiguo que queda se toman del resumen y ese primer
+        día (que la retención pudo dejar a medias) se cuenta con el índice por fecha.
+        """
+        hoy = datetime.now().date().isoformat()
+        with self._lock:
+            total_usuarios = self._conexion.execute(
+                "SELECT valor FROM totales WHERE nombre = 'usuarios'"
+            ).fetchone()[0]
+            primera = self._conexion.execute("SELECT MIN(fecha) FROM mensajes").fetchone()[0]
+            total_mensajes = 0
+            if primera is not None:
+                total_mensajes = self._conexion.execute(
+                    "SELECT COUNT(*) FROM mensajes WHERE fecha = ?", (primera,)
+                ).fetchone()[0] + self._conexion.execute(
+                    "SELECT COALESCE(SUM(mensajes), 0) FROM resumenes WHERE granularidad = 'dia' AND periodo > ?",
+                    (primera,)
+                ).fetchone()[0]
+            fila = self._conexion.execute(
+                "SELECT mensajes, usuarios_activos FROM resumenes WHERE granularidad = 'dia' AND periodo = ?",
+                (hoy,)
+            ).fetchone()
+            mensajes_hoy, usuarios_hoy = (fila['mensajes'], fila['usuarios_activos']) if fila else (0, 0)
+
+        return {
+            'total_usuarios': total_usuarios,
+            'total_mensajes': total_mensajes,
+            'mensajes_hoy': mensajes_hoy,
+            'usuarios_activos_hoy': usuarios_hoy
+        }
+
+    def _sumar_a_resumenes(self, mensajes: Iterable[Tuple[str, str, int, Optional[str]]]):
+        """Suma (telefono, fecha, es_bot, tipo) a los resúmenes dentro de la transacción en curso.
+
+        activos_periodo recuerda qué teléfonos escribieron en cada periodo abierto para
+        contar usuarios distintos; el tipo solo se cuenta en los mensajes entrantes.
+        """
+        sumas = agrupar(mensajes)
+        if not sumas:
+            return
+
+        self._podar_activos()
+        for (granularidad, clave), suma in sumas.items():
+            nuevos = self._conexion.executemany(
+                "INSERT OR IGNORE INTO activos_periodo (periodo, telefono) VALUES (?, ?)",
+                [(clave, telefono) for telefono in suma['telefonos']]
+            ).rowcount
+            fila = self._conexion.execute(
+                "SELECT tipos FROM resumenes WHERE granularidad = ? AND periodo = ?", (granularidad, clave)
+            ).fetchone()
+            tipos = json.loads(fila['tipos']) if fila else {}
+            for tipo, cantidad in suma['tipos'].items():
+                tipos[tipo] = tipos.get(tipo, 0) + cantidad
+            self._conexion.execute(
+                "INSERT INTO resumenes (granularidad, periodo, mensajes, usuarios_activos, tipos) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT (granularidad, periodo) DO UPDATE SET "
+                "mensajes = mensajes + excluded.mensajes, "
+                "usuarios_activos = usuarios_activos + excluded.usuarios_activos, tipos = excluded.tipos",
+                (granularidad, clave, suma['mensajes'], nuevos, json.dumps(tipos, ensure_ascii=False))
+            )
+
+    def _descontar_de_resumenes(self, telefonos: List[Tuple[str]]):
+        """Resta de los resúmenes los mensajes de teléfonos que se van a borrar (dentro de la transacción)"""
+        filas = []
+        for k in range(0, len(telefonos), 500):
+            marcas = ','.join('?' * len(telefonos[k:k + 500]))
+            filas += self._conexion.execute(
+                f"SELECT telefono, fecha, es_bot, tipo FROM mensajes WHERE telefono IN ({marcas})",
+                [t for (t,) in telefonos[k:k + 500]]
+            ).fetchall()
+        for (granularidad, clave), grupo in agrupar(tuple(f) for f in filas).items():
+            fila = self._conexion.execute(
+                "SELECT mensajes, usuarios_activos, tipos FROM resumenes WHERE granularidad = ? AND periodo = ?",
+                (granularidad, clave)
+            ).fetchone()
+            if fila is None:
+                continue
+            resumen = {'mensajes': fila['mensajes'], 'usuarios_activos': fila['usuarios_activos'],
+                       'tipos': json.loads(fila['tipos'])}
+            descontar(resumen, grupo)
+            if resumen['mensajes'] > 0:
+                self._conexion.execute(
+                    "UPDATE resumenes SET mensajes = ?, usuarios_activos = ?, tipos = ? "
+                    "WHERE granularidad = ? AND periodo = ?",
+                    (resumen['mensajes'], resumen['usuarios_activos'],
+                     json.dumps(resumen['tipos'], ensure_ascii=False), granularidad, clave)
+                )
+            else:
+                self._conexion.execute(
+                    "DELETE FROM resumenes WHERE granularidad = ? AND periodo = ?", (granularidad, clave)
+                )
+            self._conexion.executemany(
+                "DELETE FROM activos_periodo WHERE periodo = ? AND telefono = ?",
+                [(clave, telefono) for telefono in grupo['telefonos']]
+            )
+
+    def _podar_activos(self):
+        """Una vez al día olvida los teléfonos de los periodos que ya cerraron"""
+        hoy = datetime.now().date()
+        if self._poda_activos == hoy:
+            return
+        self._conexion.execute(
+            "DELETE FROM activos_periodo WHERE (length(periodo) = 10 AND periodo < ?) "
+            "OR (length(periodo) = 8 AND periodo < ?) OR (length(periodo) = 7 AND periodo < ?)",
+            tuple(primera_clave_abierta(granularidad, hoy) for granularidad in GRANULARIDADES)
+        )
+        self._poda_activos = hoy
+
+    def reconstruir_resumenes(self):
+        """Recalcula los resúmenes desde el periodo del mensaje más antiguo que queda.
+
+        Se usa al crear las tablas en una base existente; los periodos anteriores (ya
+        borrados por retención) se conservan como historial.
+        """
+        with self._lock, self._conexion:
+            primera = self._conexion.execute("SELECT MIN(fecha) FROM mensajes").fetchone()[0]
+            if primera is None:
+                return
+            for granularidad, clave in claves_periodo(primera):
+                self._conexion.execute(
+                    "DELETE FROM resumenes WHERE granularidad = ? AND periodo >= ?", (granularidad, clave)
+                )
+                self._conexion.execute(
+                    "DELETE FROM activos_periodo WHERE length(periodo) = ? AND periodo >= ?", (len(clave), clave)
+                )
+            cursor = self._conexion.execute("SELECT telefono, fecha, es_bot, tipo FROM mensajes ORDER BY id")
+            while True:
+                filas = cursor.fetchmany(5000)
+                if not filas:
+                    break
+                self._sumar_a_resumenes([tuple(f) for f in filas])
+            self._poda_activos = None
+            self._podar_activos()
+
+    def obtener_resumenes(self, desde: date, hasta: date, granularidad: str = 'dia') -> List[Dict]:
+        """Mensajes, usuarios distintos y tipos de mensaje por día, semana o mes (solo lee los resúmenes)"""
+        if granularidad not in GRANULARIDADES:
+            raise ValueError(f"Granularidad desconocida: {granularidad}")
+        with self._lock:
+            filas = self._conexion.execute(
+                "SELECT periodo, mensajes, usuarios_activos, tipos FROM resumenes "
+                "WHERE granularidad = ? AND periodo BETWEEN ? AND ? ORDER BY periodo",
+                (granularidad, clave_periodo(desde.isoformat(), granularidad),
+                 clave_periodo(hasta.isoformat(), granularidad))
+            ).fetchall()
+        return [
+            {'periodo': f['periodo'], 'mensajes': f['mensajes'], 'usuarios_activos': f['usuarios_activos'],
+             'tipos': json.loads(f['tipos'])}
+            for f in filas
+        ]
+
+    def limpiar_mensajes_antiguos(self, dias: int = 90) -> int:
+        """Elimina mensajes más antiguos que X días (los resúmenes por periodo se conservan)"""
+        fecha_limite = datetime.now().timestamp() - (dias * 24 * 60 * 60)
+        with self._lock, self._conexion:
+            cursor = self._conexion.execute("DELETE FROM mensajes WHERE epoch <= ?", (fecha_limite,))
+        return cursor.rowcount
+
+    def archivar_mensajes_antiguos(self, dias: int = 180, compresion: str = 'gzip') -> Dict[str, int]:
+        """Mueve los mensajes con más de X días al archivo frío comprimido (datos/archivo), un mes a la vez.
+
+        Igual que en BaseDatos: se copian todos los meses (con marca de archivado), se
+        regenera su exportación columnar y al final se borran en una sola transacción; la
+        marca guarda el rango de fechas para terminar el borrado si la corrida se interrumpe.
+        Los resúmenes por periodo se conservan. Devuelve los mensajes archivados por mes.
+        """
+        archivo = ArchivoMensajes(os.path.join(self.ruta_datos, "archivo"), compresion)
+        dia_limite = (datetime.now() - timedelta(days=dias)).date().isoformat()
+        rangos = {
+            clave: (marca['desde'], marca['hasta'])
+            for clave, marca in archivo.marcas().items() if marca.get('origen') == 'sqlite'
+        }
+        with self._lock:
+            meses = [fila[0] for fila in self._conexion.execute(
+                "SELECT DISTINCT substr(fecha, 1, 7) FROM mensajes WHERE fecha < ? ORDER BY 1", (dia_limite,)
+            )]
+        for mes in meses:
+            # 'AAAA-MM-32' queda después de cualquier día del mes
+            rangos.setdefault(f"sqlite-{mes}", (f"{mes}-01", min(dia_limite, f"{mes}-32")))
+
+        resumen: Dict[str, int] = {}
+        for clave, (desde, hasta) in sorted(rangos.items()):
+            mensajes = self._iterar_consulta(
+                "SELECT * FROM mensajes WHERE fecha >= ? AND fecha < ? ORDER BY fecha, timestamp, id",
+                (desde, hasta)
+            )
+            total = archivo.archivar(
+                clave, desde[:7], (m.to_dict() for m in mensajes), origen='sqlite', desde=desde, hasta=hasta
+            )
+            resumen[desde[:7]] = resumen.get(desde[:7], 0) + total
+        for periodo in resumen:
+            archivo.exportar_columnas(periodo)
+
+        with self._lock, self._conexion:
+            self._conexion.executemany(
+                "DELETE FROM mensajes WHERE fecha >= ? AND fecha < ?", list(rangos.values())
+            )
+        for clave in rangos:
+            archivo.confirmar(clave)
+        return resumen
+
+    # MÉTODOS PARA MOVER DATOS ENTRE FRAGMENTOS
+    def listar_telefonos(self) -> List[str]:
+        """Teléfonos con usuario o con mensajes en esta base"""
+        with self._lock:
+            filas = self._conexion.execute(
+                "SELECT telefono FROM usuarios UNION SELECT telefono FROM mensajes ORDER BY telefono"
+            ).fetchall()
+        return [f['telefono'] for f in filas]
+
+    def eliminar_telefonos(self, telefonos: Iterable[str]) -> int:
+        """Borra usuarios y mensajes de varios teléfonos; devuelve cuántos mensajes se eliminaron"""
+        parametros = [(telefono,) for telefono in set(telefonos)]
+        with self._lock, self._conexion:
+            self._descontar_de_resumenes(parametros)
+            cursor = self._conexion.executemany("DELETE FROM mensajes WHERE telefono = ?", parametros)
+            self._conexion.executemany("DELETE FROM usuarios WHERE telefono = ?", parametros)
+        return cursor.rowcount
@@ -0,0 +1,86 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class BloqueoArchivo:
+    """Bloqueo reentrante entre hilos y, opcionalmente, entre procesos.
+
+    Siempre usa un RLock para los hilos del proceso. Con `entre_procesos=True` además
+    toma un flock sobre `ruta`, de modo que varios workers de uvicorn que comparten el
+    directorio de datos no se pisen: exclusivo con `with bloqueo:` y compartido con
+    `with bloqueo.compartido():` (varios procesos a la vez, pero ninguno mientras otro
+    tenga el exclusivo). Un bloqueo anidado conserva el modo del primero.
+    """
+
+    def __init__(self, ruta: str, entre_procesos: bool = False):
+        if entre_procesos and fcntl is None:
+            raise RuntimeError("El modo multiproceso requiere fcntl (Linux/macOS)")
+        self.ruta = ruta
+        self.entre_procesos = entre_procesos
+        self._lock = threading.RLock()
+        self._profundidad = 0
+        self._exclusivo = False
+        self._fd = None
+
+    def _tomar(self, exclusivo: bool):
+        self._lock.acquire()
+        if self._profundidad > 0 and exclusivo and not self._exclusivo:
+            self._lock.release()
+            raise RuntimeError("No se puede pedir el bloqueo exclusivo dentro del compartido")
+        if self.entre_procesos and self._profundidad == 0:
+            try:
+                if self._fd is None:
+                    self._fd = os.open(self.ruta, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._fd, fcntl.LOCK_EX if exclusivo else fcntl.LOCK_SH)
+            except BaseException:
+                self._lock.release()
+                raise
+        if self._profundidad == 0:
+            self._exclusivo = exclusivo
+        self._profundidad += 1
+        return self
+
+    def __enter__(self):
+        return self._tomar(True)
+
+    def __exit__(self, *exc):
+        self._profundidad -= 1
+        if self.entre_procesos and self._profundidad == 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._lock.release()
+        return False
+
+    @contextmanager
+    def compartido(self):
+        self._tomar(False)
+        try:
+            yield self
+        finally:
+            self.__exit__()
+
+
+def reservar_numero(directorio: str, prefijo: str) -> Tuple[int, int]:
+    """Reserva el menor número libre entre los procesos que usan `directorio`.
+
+    Toma sin esperar el flock de `prefijoN.lock` para N = 0, 1, ... y devuelve (N, fd);
+    el número queda reservado mientras el fd siga abierto (o el proceso viva), así que
+    un worker que reinicia vuelve a usar uno de los números ya existentes.
+    """
+    if fcntl is None:
+        raise RuntimeError("El modo multiproceso requiere fcntl (Linux/macOS)")
+    numero = 0
+    while True:
+        fd = os.open(os.path.join(directorio, f"{prefijo}{numero}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return numero, fd
+        except BlockingIOError:
+            os.close(fd)
+            numero += 1
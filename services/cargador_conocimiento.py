@@ -0,0 +1,505 @@
+import hashlib
+import json
+import os
+import pickle
+import re
+import threading
+from collections import Counter
+from datetime import datetime, date, time
+from typing import Optional, List, Dict, Any, Tuple
+
+from models.conocimiento import (
+    AlmacenConocimiento, Horario, Evento, Carrera, DiaSemana, Servicio, Suspension
+)
+
+PESTANAS_CONOCIMIENTO = ('horarios', 'eventos', 'carreras', 'servicios', 'suspensiones')
+# Cambia si cambia lo que se guarda en la instantánea; las de otro formato se ignoran
+FORMATO_INSTANTANEA = 2
+
+
+def parse_fecha_google_sheets(fecha_str: str) -> Optional[datetime]:
+    if not fecha_str or str(fecha_str).strip() == '':
+        return None
+
+    fecha_str = str(fecha_str).strip()
+
+    meses_es = {
+        'enero': 1, 'febrero': 2, 'marzo': 3, 'abril': 4,
+        'mayo': 5, 'junio': 6, 'julio': 7, 'agosto': 8,
+        'septiembre': 9, 'octubre': 10, 'noviembre': 11, 'diciembre': 12
+    }
+
+    try:
+        if ' de ' in fecha_str:
+            match = re.search(r'(\d+)\s+de\s+(\w+)', fecha_str)
+            if match:
+                dia = int(match.group(1))
+                mes_nombre = match.group(2).lower()
+                mes = meses_es.get(mes_nombre, 1)
+
+                año = datetime.now().year
+
+                if datetime.now().month > mes or (datetime.now().month == mes and datetime.now().day > dia):
+                    año += 1
+
+                return datetime(año, mes, dia)
+
+        elif '/' in fecha_str:
+            partes = fecha_str.split('/')
+            dia = int(partes[0])
+            mes = int(partes[1])
+            año = int(partes[2]) if len(partes) > 2 else datetime.now().year
+            return datetime(año, mes, dia)
+
+        elif '-' in fecha_str and len(fecha_str) >= 10:
+            return datetime.fromisoformat(fecha_str.split(' ')[0])
+
+    except Exception as e:
+        print(f"   ⚠️  Error parseando fecha '{fecha_str}': {e}")
+        return None
+
+    return None
+
+
+# CONSTRUCCIÓN DE OBJETOS A PARTIR DE UNA FILA
+# Cada función devuelve el objeto de la fila, o None si la fila se omite
+
+def crear_horario(h: Dict) -> Optional[Horario]:
+    dias_str = str(h.get('Dias', '')).lower()
+    dias_lista = []
+
+    if 'lunes' in dias_str and 'viernes' in dias_str:
+        dias_lista = [DiaSemana.LUNES, DiaSemana.MARTES, DiaSemana.MIERCOLES,
+                     DiaSemana.JUEVES, DiaSemana.VIERNES]
+    else:
+        if 'lunes' in dias_str: dias_lista.append(DiaSemana.LUNES)
+        if 'martes' in dias_str: dias_lista.append(DiaSemana.MARTES)
+        if 'miercoles' in dias_str or 'miércoles' in dias_str: dias_lista.append(DiaSemana.MIERCOLES)
+        if 'jueves' in dias_str: dias_lista.append(DiaSemana.JUEVES)
+        if 'viernes' in dias_str: dias_lista.append(DiaSemana.VIERNES)
+        if 'sabado' in dias_str or 'sábado' in dias_str: dias_lista.append(DiaSemana.SABADO)
+        if 'domingo' in dias_str: dias_lista.append(DiaSemana.DOMINGO)
+
+    if not dias_lista:
+        dias_lista = [DiaSemana.LUNES]
+
+    hora_inicio_str = str(h.get('Hora_Inicio', '08:00'))
+    hora_fin_str = str(h.get('Hora_Fin', '20:00'))
+
+    h_inicio_parts = hora_inicio_str.split(':')
+    h_fin_parts = hora_fin_str.split(':')
+
+    h_inicio = time(int(h_inicio_parts[0]), int(h_inicio_parts[1]) if len(h_inicio_parts) > 1 else 0)
+    h_fin = time(int(h_fin_parts[0]), int(h_fin_parts[1]) if len(h_fin_parts) > 1 else 0)
+
+    return Horario(
+        servicio=str(h.get('Servicio', 'Servicio')),
+        dias=dias_lista,
+        hora_inicio=h_inicio,
+        hora_fin=h_fin,
+        notas=str(h.get('Notas', ''))
+    )
+
+
+def crear_evento(e: Dict) -> Optional[Evento]:
+    fecha_inicio_str = str(e.get('Fecha_Inicio', ''))
+    fecha_fin_str = str(e.get('Fecha_Fin', ''))
+
+    fecha_inicio = parse_fecha_google_sheets(fecha_inicio_str)
+    fecha_fin = parse_fecha_google_sheets(fecha_fin_str) if fecha_fin_str else fecha_inicio
+
+    if not fecha_inicio:
+        print(f"   ⚠️  No se pudo parsear fecha para: {e.get('Nombre', 'Evento')}")
+        return None
+    return Evento(
+        nombre=str(e.get('Nombre', 'Evento')),
+        descripcion=str(e.get('Descripcion', '')),
+        fecha_inicio=fecha_inicio,
+        fecha_fin=fecha_fin or fecha_inicio,
+        lugar=str(e.get('Lugar', '')),
+        categoria=str(e.get('Categoria', 'General'))
+    )
+
+
+def crear_carrera(c: Dict) -> Optional[Carrera]:
+    duracion = c.get('Duracion_Semestres', 8)
+    if isinstance(duracion, str):
+        duracion = int(duracion)
+
+    return Carrera(
+        nombre=str(c.get('Nombre', 'Carrera')).strip(),
+        duracion_semestres=duracion,
+        descripcion=str(c.get('Descripción', '') or c.get('Descripción ', '')).strip(),
+        coordinador=str(c.get('Coordinador', '')).strip()
+    )
+
+
+def crear_servicio(s: Dict) -> Optional[Servicio]:
+    nombre = str(s.get('Nombre', 'Servicio')).strip()
+    if not nombre:
+        return None
+
+    return Servicio(
+        nombre=nombre,
+        descripcion=str(s.get('Descripcion', '')).strip(),
+        pagos=str(s.get('Pagos', '')).strip(),
+        dias=str(s.get('Dias', '')).strip(),
+        lugar=str(s.get('Lugar', '')).strip()
+    )
+
+
+def crear_suspension(susp: Dict) -> Optional[Suspension]:
+    return Suspension(
+        fecha=str(susp.get('Fecha', '')).strip(),
+        suspension=str(susp.get('Suspension', '')).strip()
+    )
+
+
+# Por pestaña: cómo se construye cada fila, qué la identifica (para distinguir una fila
+# modificada de una nueva en el resumen) y cómo se arma la colección de BaseConocimiento.
+# `fechas_relativas`: lo construido depende del día en que se construye ("15 de marzo" es
+# la próxima vez que llegue esa fecha), así que no se reutiliza de un día para otro
+_PESTANAS: Dict[str, Dict[str, Any]] = {
+    'horarios': {
+        'crear': crear_horario,
+        'identidad': lambda fila: str(fila.get('Servicio', '')).strip().lower(),
+        'coleccion': lambda objetos: {h.servicio.lower(): h for h in objetos},
+    },
+    'eventos': {
+        'crear': crear_evento,
+        'identidad': lambda fila: (str(fila.get('Nombre', '')).strip().lower(), str(fila.get('Fecha_Inicio', ''))),
+        'coleccion': list,
+        'fechas_relativas': True,
+    },
+    'carreras': {
+        'crear': crear_carrera,
+        'identidad': lambda fila: str(fila.get('Nombre', '')).strip().lower(),
+        'coleccion': lambda objetos: {c.nombre.lower(): c for c in objetos},
+    },
+    'servicios': {
+        'crear': crear_servicio,
+        'identidad': lambda fila: str(fila.get('Nombre', '')).strip().lower(),
+        'coleccion': lambda objetos: {s.nombre.lower(): s for s in objetos},
+    },
+    'suspensiones': {
+        'crear': crear_suspension,
+        'identidad': lambda fila: str(fila.get('Fecha', '')).strip().lower(),
+        'coleccion': list,
+    },
+}
+
+
+def huella_payload(*pestanas: Optional[List[Dict]]) -> str:
+    """Huella de las pestañas tal como llegaron en un webhook.
+
+    Sin ordenar claves ni pasar fila por fila: solo sirve para reconocer el mismo
+    payload repetido, que es lo que n8n manda en cada mensaje.
+    """
+    contenido = json.dumps(pestanas, separators=(',', ':'), default=str)
+    return hashlib.blake2b(contenido.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def hash_fila(fila: Dict) -> str:
+    """Hash del contenido de una fila; no depende del orden de las columnas"""
+    contenido = json.dumps(fila, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(contenido.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def hash_pestana(filas: List[Dict]) -> str:
+    """Hash de una pestaña completa; se calcula de una vez, sin pasar fila por fila"""
+    contenido = json.dumps(filas, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(contenido.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def hash_contenido(hashes_pestanas: Dict[str, str]) -> str:
+    """Hash de todo el conocimiento a partir de los hashes de sus pestañas"""
+    contenido = "\n".join(f"{pestana}:{hashes_pestanas.get(pestana, '')}" for pestana in PESTANAS_CONOCIMIENTO)
+    return hashlib.blake2b(contenido.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class CargadorConocimiento:
+    """Carga las filas de Google Sheets en un AlmacenConocimiento, aplicando solo lo que cambió.
+
+    Guarda el hash de cada pestaña y de cada fila con el objeto que se construyó a partir
+    de ella. Una pestaña con el mismo hash que la última vez no se toca; en una que cambió,
+    solo se construyen las filas nuevas o modificadas y la colección se vuelve a armar (en
+    el orden de la hoja) con los objetos ya construidos.
+
+    Las colecciones nuevas se juntan en una instantánea derivada de la vigente (las que no
+    cambiaron se comparten) y se publica con una nueva versión; la instantánea anterior no
+    se modifica, así que los requests en curso terminan con ella.
+
+    Las fechas relativas de los eventos ("15 de marzo") se resuelven cuando se construye la
+    fila, y lo construido vale solo ese día: la primera carga de otro día (o renovar_fechas,
+    o restaurar una instantánea de otro día) vuelve a construir esas pestañas aunque sus
+    filas no hayan cambiado.
+
+    Con `ruta_instantanea`, cada versión publicada se guarda en ese archivo (pickle) junto
+    con los hashes y objetos por fila; al arrancar, cargar_instantanea la restaura sin
+    esperar a Google, y la siguiente carga sigue siendo incremental. El archivo es local
+    y solo debe escribirlo este proceso.
+
+    Cada instantánea publicada lleva en `hash_contenido` un hash de las pestañas cargadas,
+    que sirve de token para que n8n mande solo los cambios (ver aplicar_deltas).
+    """
+
+    def __init__(self, almacen: AlmacenConocimiento, ruta_instantanea: Optional[str] = None):
+        self.almacen = almacen
+        self.ruta_instantanea = ruta_instantanea
+        # Una carga a la vez: los hashes y objetos guardados deben corresponder a lo publicado
+        self._lock = threading.Lock()
+        self.hashes_pestanas: Dict[str, str] = {}
+        # Por pestaña: hash de fila -> objeto construido (None si la fila se omitió)
+        self._objetos: Dict[str, Dict[str, Any]] = {pestana: {} for pestana in PESTANAS_CONOCIMIENTO}
+        self._identidades: Dict[str, Dict[str, Any]] = {pestana: {} for pestana in PESTANAS_CONOCIMIENTO}
+        # Por pestaña: filas vigentes y sus hashes, en el mismo orden (para aplicar deltas)
+        self._filas: Dict[str, List[Dict]] = {pestana: [] for pestana in PESTANAS_CONOCIMIENTO}
+        self._hashes_filas: Dict[str, List[str]] = {pestana: [] for pestana in PESTANAS_CONOCIMIENTO}
+        # Última vez que el contenido se confirmó contra la fuente, y de dónde viene lo publicado
+        self.confirmado: Optional[datetime] = None
+        self.origen: Optional[str] = None
+        # Día en que se construyeron los objetos de las pestañas con fechas relativas
+        self._dia_objetos: Optional[date] = None
+        # (huella, versión) del último payload de webhook aplicado
+        self._ultimo_payload: Optional[Tuple[str, int]] = None
+
+    def cargar(self, horarios: Optional[List[Dict]], eventos: Optional[List[Dict]],
+               carreras: Optional[List[Dict]], servicios: Optional[List[Dict]],
+               suspensiones: Optional[List[Dict]]) -> Dict[str, Dict[str, int]]:
+        """Aplica las filas de las cinco pestañas y devuelve un resumen de cambios por pestaña.
+
+        Una pestaña en None se deja como está (p. ej. si todavía no se ha podido leer). El
+        resumen cuenta filas agregadas, actualizadas, eliminadas y sin cambios; las
+        pestañas que no cambiaron no aparecen.
+        """
+        filas_por_pestana = {
+            'horarios': horarios, 'eventos': eventos, 'carreras': carreras,
+            'servicios': servicios, 'suspensiones': suspensiones
+        }
+        with self._lock:
+            return self._aplicar(filas_por_pestana)
+
+    def aplicar_deltas(self, hash_base: str,
+                       deltas: Dict[str, Dict[str, List[Dict]]]) -> Optional[Dict[str, Dict[str, int]]]:
+        """Aplica filas agregadas y eliminadas por pestaña sobre el contenido con hash `hash_base`.
+
+        `deltas` es {pestana: {'agregar': [...], 'eliminar': [...]}}; una fila eliminada se
+        reconoce por su contenido completo, y una fila modificada llega como eliminar la
+        anterior y agregar la nueva (que queda al final de su pestaña). Si `hash_base` no es
+        el del contenido publicado, no se aplica nada y se devuelve None: quien mandó los
+        deltas debe volver a mandar las pestañas completas.
+        """
+        desconocidas = set(deltas) - set(PESTANAS_CONOCIMIENTO)
+        if desconocidas:
+            raise ValueError(f"Pestañas desconocidas: {', '.join(sorted(desconocidas))}")
+        with self._lock:
+            if hash_base != self.almacen.actual.hash_contenido:
+                return None
+            filas_por_pestana: Dict[str, Optional[List[Dict]]] = {pestana: None for pestana in PESTANAS_CONOCIMIENTO}
+            hashes_por_pestana: Dict[str, List[str]] = {}
+            for pestana, delta in deltas.items():
+                eliminar = Counter(hash_fila(fila) for fila in delta.get('eliminar') or [])
+                agregar = list(delta.get('agregar') or [])
+                filas, hashes = [], []
+                for fila, clave in zip(self._filas[pestana], self._hashes_filas[pestana]):
+                    if eliminar[clave] > 0:
+                        eliminar[clave] -= 1
+                        continue
+                    filas.append(fila)
+                    hashes.append(clave)
+                filas_por_pestana[pestana] = filas + agregar
+                hashes_por_pestana[pestana] = hashes + [hash_fila(fila) for fila in agregar]
+            return self._aplicar(filas_por_pestana, hashes_por_pestana)
+
+    def renovar_fechas(self) -> bool:
+        """Si cambió el día, reconstruye las pestañas con fechas relativas; devuelve si publicó"""
+        if self._dia_objetos == date.today():
+            return False
+        with self._lock:
+            version = self.almacen.version
+            self._aplicar({pestana: None for pestana in PESTANAS_CONOCIMIENTO}, desde_fuente=False)
+            return self.almacen.version != version
+
+    def _aplicar(self, filas_por_pestana: Dict[str, Optional[List[Dict]]],
+                 hashes_por_pestana: Optional[Dict[str, List[str]]] = None,
+                 desde_fuente: bool = True) -> Dict[str, Dict[str, int]]:
+        """Carga las pestañas que no son None y publica el resultado; se llama con el lock tomado.
+
+        Si los objetos con fechas relativas son de otro día, esas pestañas se reconstruyen
+        (con las filas recibidas o, si no llegaron, con las vigentes).
+        """
+        vencidas = set()
+        if self._dia_objetos != date.today():
+            vencidas = {pestana for pestana in PESTANAS_CONOCIMIENTO if _PESTANAS[pestana].get('fechas_relativas')}
+            self._dia_objetos = date.today()
+        resumen: Dict[str, Dict[str, int]] = {}
+        colecciones = {}
+        for pestana in PESTANAS_CONOCIMIENTO:
+            filas = filas_por_pestana[pestana]
+            hashes = (hashes_por_pestana or {}).get(pestana)
+            if filas is None and pestana in vencidas and pestana in self.hashes_pestanas:
+                filas, hashes = self._filas[pestana], self._hashes_filas[pestana]
+            if filas is None:
+                continue
+            cargada = self._cargar_pestana(pestana, filas, hashes, reconstruir=pestana in vencidas)
+            if cargada is not None:
+                resumen[pestana], colecciones[pestana] = cargada
+        if desde_fuente:
+            self.confirmado = datetime.now()
+            self.origen = 'fuente'
+        if not colecciones:
+            return resumen
+        base = self.almacen.actual.derivar(**colecciones)
+        base.hash_contenido = hash_contenido(self.hashes_pestanas)
+        self.almacen.publicar(base)
+        if self.ruta_instantanea:
+            self._guardar_instantanea(base)
+
+        print(f"📊 Conocimiento versión {base.version}: " + "; ".join(
+            f"{pestana} +{c['agregadas']} ~{c['actualizadas']} -{c['eliminadas']}"
+            for pestana, c in resumen.items()
+        ) + f" ({len(base.horarios)} horarios, {len(base.eventos)} eventos, {len(base.carreras)} carreras, "
+            f"{len(base.servicios)} servicios, {len(base.suspensiones)} suspensiones)")
+        return resumen
+
+    def cargar_payload(self, horarios: Optional[List[Dict]], eventos: Optional[List[Dict]],
+                       carreras: Optional[List[Dict]], servicios: Optional[List[Dict]],
+                       suspensiones: Optional[List[Dict]]) -> Optional[Dict[str, Dict[str, int]]]:
+        """Como cargar, para las pestañas que llegan completas en cada webhook.
+
+        Las pestañas que no vienen en el payload (None) se dejan como están. Si el payload
+        tiene la misma huella que el último aplicado y desde entonces no se ha publicado
+        otra versión, no se vuelve a procesar y se devuelve None.
+        """
+        huella = huella_payload(horarios, eventos, carreras, servicios, suspensiones)
+        if self._ultimo_payload == (huella, self.almacen.version) and self._dia_objetos == date.today():
+            self.confirmado = datetime.now()
+            return None
+        resumen = self.cargar(horarios, eventos, carreras, servicios, suspensiones)
+        self._ultimo_payload = (huella, self.almacen.version)
+        return resumen
+
+    def _cargar_pestana(self, pestana: str, filas: List[Dict], hashes: Optional[List[str]] = None,
+                        reconstruir: bool = False) -> Optional[Tuple[Dict[str, int], Any]]:
+        """Arma la colección nueva de una pestaña y su resumen; None si su contenido no cambió.
+
+        Con `reconstruir` se vuelve a construir cada fila aunque no haya cambiado.
+        """
+        hash_actual = hash_pestana(filas)
+        if not reconstruir and self.hashes_pestanas.get(pestana) == hash_actual:
+            return None
+
+        if hashes is None:
+            hashes = [hash_fila(fila) for fila in filas]
+        definicion = _PESTANAS[pestana]
+        anteriores = self._objetos[pestana]
+        identidades_anteriores = self._identidades[pestana]
+        objetos: Dict[str, Any] = {}
+        identidades: Dict[str, Any] = {}
+        for fila, clave in zip(filas, hashes):
+            if clave in objetos:
+                continue
+            if clave in anteriores and not reconstruir:
+                objetos[clave] = anteriores[clave]
+                identidades[clave] = identidades_anteriores[clave]
+                continue
+            identidades[clave] = definicion['identidad'](fila)
+            try:
+                objetos[clave] = definicion['crear'](fila)
+            except Exception as e:
+                print(f"   ❌ Error procesando fila de {pestana}: {e}")
+                objetos[clave] = None
+
+        nuevas = {identidades[c] for c in objetos if c not in anteriores}
+        quitadas = {identidades_anteriores[c] for c in anteriores if c not in objetos}
+        actualizadas = len(nuevas & quitadas)
+        cambios = {
+            'agregadas': len(nuevas) - actualizadas,
+            'actualizadas': actualizadas,
+            'eliminadas': len(quitadas) - actualizadas,
+            'sin_cambios': sum(1 for c in objetos if c in anteriores),
+        }
+
+        coleccion = definicion['coleccion'](
+            objetos[clave] for clave in hashes if objetos[clave] is not None
+        )
+        self._objetos[pestana] = objetos
+        self._identidades[pestana] = identidades
+        self._filas[pestana] = list(filas)
+        self._hashes_filas[pestana] = hashes
+        self.hashes_pestanas[pestana] = hash_actual
+        return cambios, coleccion
+
+    # INSTANTÁNEA EN DISCO
+    def _guardar_instantanea(self, base):
+        """Escribe la versión publicada a un temporal y lo renombra"""
+        datos = {
+            'formato': FORMATO_INSTANTANEA,
+            'guardado': self.confirmado,
+            'version': base.version,
+            # Los pickles no admiten MappingProxyType: se guardan copias simples
+            'colecciones': {
+                pestana: (dict(getattr(base, pestana)) if hasattr(getattr(base, pestana), 'items')
+                          else list(getattr(base, pestana)))
+                for pestana in PESTANAS_CONOCIMIENTO
+            },
+            'hashes_pestanas': self.hashes_pestanas,
+            'objetos': self._objetos,
+            'identidades': self._identidades,
+            'filas': self._filas,
+            'hashes_filas': self._hashes_filas,
+            'dia_objetos': self._dia_objetos,
+        }
+        try:
+            os.makedirs(os.path.dirname(self.ruta_instantanea) or '.', exist_ok=True)
+            ruta_temporal = self.ruta_instantanea + '.tmp'
+            with open(ruta_temporal, 'wb') as f:
+                pickle.dump(datos, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(ruta_temporal, self.ruta_instantanea)
+        except Exception as e:
+            print(f"⚠️  Error guardando la instantánea de conocimiento: {e}")
+
+    def cargar_instantanea(self) -> bool:
+        """Publica la última instantánea guardada, si existe y es de este formato"""
+        if not self.ruta_instantanea or not os.path.exists(self.ruta_instantanea):
+            return False
+        try:
+            with open(self.ruta_instantanea, 'rb') as f:
+                datos = pickle.load(f)
+            if datos.get('formato') != FORMATO_INSTANTANEA:
+                print(f"⚠️  Instantánea de conocimiento con formato {datos.get('formato')}, se ignora")
+                return False
+        except Exception as e:
+            print(f"⚠️  Error leyendo la instantánea de conocimiento: {e}")
+            return False
+
+        with self._lock:
+            base = self.almacen.actual.derivar(**datos['colecciones'])
+            base.hash_contenido = hash_contenido(datos['hashes_pestanas'])
+            self.almacen.publicar(base, datos['version'])
+            self.hashes_pestanas = datos['hashes_pestanas']
+            self._objetos = datos['objetos']
+            self._identidades = datos['identidades']
+            self._filas = datos['filas']
+            self._hashes_filas = datos['hashes_filas']
+            self._dia_objetos = datos.get('dia_objetos')
+            self.confirmado = datos['guardado']
+            self.origen = 'instantanea'
+        print(f"✅ Conocimiento versión {base.version} restaurado de la instantánea del "
+              f"{self.confirmado:%Y-%m-%d %H:%M:%S}")
+        # Una instantánea de otro día trae las fechas relativas de ese día
+        self.renovar_fechas()
+        return True
+
+    def estado(self) -> Dict[str, Any]:
+        """Versión y hash publicados, de dónde vienen y cuántos segundos tiene sin confirmarse contra la fuente.
+
+        Con origen 'instantanea' la edad cuenta desde que se guardó el archivo.
+        """
+        return {
+            'version': self.almacen.version,
+            'hash': self.almacen.actual.hash_contenido,
+            'origen': self.origen,
+            'confirmado': self.confirmado.isoformat() if self.confirmado else None,
+            'edad_s': round((datetime.now() - self.confirmado).total_seconds(), 1) if self.confirmado else None,
+        }
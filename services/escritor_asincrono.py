@@ -0,0 +1,210 @@
+import asyncio
+from typing import Optional, List, Dict, Tuple, Any
+
+from models.usuario import Usuario
+from models.mensaje import Mensaje
+
+DURABILIDADES = ('normal', 'fsync')
+
+_FIN = object()
+# La encola sincronizar: el lote donde cae se escribe sin esperar más elementos
+_BARRERA = object()
+
+
+class EscritorAsincrono:
+    """Escritor en segundo plano que agrupa escrituras de muchos requests en un solo flush.
+
+    Los webhooks encolan usuarios y mensajes; una tarea de asyncio junta lo encolado durante
+    `intervalo_flush` segundos (o hasta `tamano_lote` elementos) y lo escribe con
+    `guardar_lote` en un hilo aparte, fuera del event loop.
+
+    Durabilidad:
+        'normal': cada lote se escribe a los archivos y el sistema operativo decide cuándo
+                  llevarlo a disco; los webhooks responden sin esperar la escritura.
+        'fsync':  cada lote se sincroniza a disco, y guardar_usuario/guardar_mensaje
+                  devuelven un futuro que se resuelve cuando el lote donde quedaron ya
+                  está en disco (los webhooks lo esperan antes de responder).
+
+    Un lote que no se pudo escribir no se descarta: se reintenta junto con lo que llegue
+    después, esperando cada vez el doble (de `reintento_inicial` a `reintento_maximo`
+    segundos). Los futuros de ese lote fallan en el primer intento para que el webhook no
+    confirme algo que aún no está escrito. `fallos` cuenta los intentos fallidos.
+    """
+
+    def __init__(self, base_datos, intervalo_flush: float = 0.05, tamano_lote: int = 256,
+                 durabilidad: str = 'normal', reintento_inicial: float = 0.1,
+                 reintento_maximo: float = 5.0):
+        if durabilidad not in DURABILIDADES:
+            raise ValueError(f"Durabilidad desconocida: {durabilidad}")
+        self.base_datos = base_datos
+        self.intervalo_flush = intervalo_flush
+        self.tamano_lote = tamano_lote
+        self.durabilidad = durabilidad
+        self.reintento_inicial = reintento_inicial
+        self.reintento_maximo = reintento_maximo
+        self.fallos = 0
+        self._cola: Optional[asyncio.Queue] = None
+        self._tarea: Optional[asyncio.Task] = None
+        # Usuarios encolados que aún no llegan a la base de datos
+        self._usuarios_pendientes: Dict[str, Usuario] = {}
+        # Elementos (elemento, futuro) de un lote que falló, a la espera del siguiente intento
+        self._reintentar: List[Tuple[Any, Optional[asyncio.Future]]] = []
+
+    @property
+    def activo(self) -> bool:
+        return self._tarea is not None and not self._tarea.done()
+
+    async def iniciar(self):
+        """Arranca la tarea escritora en el event loop actual"""
+        if self.activo:
+            return
+        self._cola = asyncio.Queue(maxsize=self.tamano_lote * 64)
+        self._tarea = asyncio.create_task(self._ciclo())
+
+    async def detener(self):
+        """Escribe todo lo pendiente y detiene la tarea escritora"""
+        if not self.activo:
+            return
+        await self._cola.put(_FIN)
+        await self._tarea
+        self._tarea = None
+
+    def estado(self) -> Dict[str, Any]:
+        """Elementos por escribir y lotes fallidos desde el arranque"""
+        return {
+            'durabilidad': self.durabilidad,
+            'pendientes': (self._cola.qsize() if self._cola else 0) + len(self._reintentar),
+            'fallos': self.fallos
+        }
+
+    # ENCOLADO
+    async def _encolar(self, elemento) -> Optional[asyncio.Future]:
+        futuro = asyncio.get_running_loop().create_future() if self.durabilidad == 'fsync' else None
+        await self._cola.put((elemento, futuro))
+        return futuro
+
+    async def guardar_usuario(self, usuario: Usuario) -> Optional[asyncio.Future]:
+        """Encola un usuario; si el escritor no está activo se guarda directamente.
+
+        Con durabilidad 'fsync' devuelve el futuro de su escritura (si no, None).
+        """
+        if not self.activo:
+            self.base_datos.guardar_usuario(usuario)
+            return None
+        self._usuarios_pendientes[usuario.telefono] = usuario
+        return await self._encolar(usuario)
+
+    async def guardar_mensaje(self, mensaje: Mensaje) -> Optional[asyncio.Future]:
+        """Encola un mensaje; si el escritor no está activo se guarda directamente.
+
+        Con durabilidad 'fsync' devuelve el futuro de su escritura (si no, None).
+        """
+        if not self.activo:
+            self.base_datos.guardar_mensaje(mensaje)
+            return None
+        return await self._encolar(mensaje)
+
+    async def sincronizar(self) -> bool:
+        """Espera a que se escriba todo lo encolado hasta ahora; False si la escritura falló"""
+        if not self.activo:
+            return True
+        futuro = asyncio.get_running_loop().create_future()
+        await self._cola.put((_BARRERA, futuro))
+        try:
+            await futuro
+            return True
+        except RuntimeError:
+            return False
+
+    def obtener_usuario(self, telefono: str) -> Optional[Usuario]:
+        """Obtiene un usuario considerando también los que siguen en la cola"""
+        pendiente = self._usuarios_pendientes.get(telefono)
+        if pendiente is not None:
+            return pendiente
+        return self.base_datos.obtener_usuario(telefono)
+
+    # ESCRITURA
+    async def _ciclo(self):
+        loop = asyncio.get_running_loop()
+        terminar = False
+        espera = 0.0
+        while not terminar:
+            if self._reintentar:
+                await asyncio.sleep(espera)
+                lote, self._reintentar = self._reintentar, []
+            else:
+                elemento = await self._cola.get()
+                if elemento is _FIN:
+                    break
+                lote = [elemento]
+            limite = loop.time() + self.intervalo_flush
+            while len(lote) < self.tamano_lote and lote[-1][0] is not _BARRERA:
+                restante = limite - loop.time()
+                if restante <= 0:
+                    break
+                try:
+                    elemento = await asyncio.wait_for(self._cola.get(), restante)
+                except asyncio.TimeoutError:
+                    break
+                if elemento is _FIN:
+                    terminar = True
+                    break
+                lote.append(elemento)
+            if await self._escribir(lote):
+                espera = 0.0
+            else:
+                espera = min(max(espera * 2, self.reintento_inicial), self.reintento_maximo)
+
+        # Drena lo que se haya encolado detrás de la señal de fin
+        restantes, self._reintentar = self._reintentar, []
+        while not self._cola.empty():
+            elemento = self._cola.get_nowait()
+            if elemento is not _FIN:
+                restantes.append(elemento)
+        for _ in range(3):
+            if not restantes or await self._escribir(restantes):
+                return
+            await asyncio.sleep(self.reintento_inicial)
+            restantes, self._reintentar = self._reintentar, []
+        print(f"❌ Se cerró el escritor sin poder escribir {len(restantes)} elementos")
+
+    async def _escribir(self, lote: List[Tuple[Any, Optional[asyncio.Future]]]) -> bool:
+        """Escribe un lote; si falla, lo deja en `_reintentar` y devuelve False"""
+        usuarios: Dict[str, Usuario] = {}
+        mensajes: List[Mensaje] = []
+        for elemento, _ in lote:
+            if isinstance(elemento, Usuario):
+                usuarios[elemento.telefono] = elemento
+            elif elemento is not _BARRERA:
+                mensajes.append(elemento)
+        correcto = True
+        if usuarios or mensajes:
+            try:
+                correcto = await asyncio.to_thread(
+                    self.base_datos.guardar_lote,
+                    list(usuarios.values()),
+                    mensajes,
+                    self.durabilidad == 'fsync'
+                )
+            except Exception as e:
+                print(f"❌ Error escribiendo lote: {e}")
+                correcto = False
+
+        if not correcto:
+            self.fallos += 1
+            print(f"⚠️  No se pudo escribir un lote de {len(usuarios)} usuarios y {len(mensajes)} mensajes; "
+                  f"se reintentará")
+            # Las barreras se responden ahora; no hace falta reintentarlas
+            self._reintentar = [(elemento, futuro) for elemento, futuro in lote if elemento is not _BARRERA]
+            for _, futuro in lote:
+                if futuro is not None and not futuro.done():
+                    futuro.set_exception(RuntimeError("No se pudo escribir el lote"))
+            return False
+
+        for telefono, usuario in usuarios.items():
+            if self._usuarios_pendientes.get(telefono) is usuario:
+                del self._usuarios_pendientes[telefono]
+        for _, futuro in lote:
+            if futuro is not None and not futuro.done():
+                futuro.set_result(None)
+        return True
@@ -3,17 +3,41 @@ from datetime import datetime
 import pytz
 import random
 from models.mensaje import Mensaje, TipoMensaje
-from models.conocimiento import BaseConocimiento, DiaSemana
+from models.conocimiento import AlmacenConocimiento, BaseConocimiento, DiaSemana
 from services.procesador_lenguaje import ProcesadorLenguajeNatural
 
 class GestorRespuestas:
     
-    def __init__(self, base_conocimiento: BaseConocimiento):
-        self.base_conocimiento = base_conocimiento
+    def __init__(self, conocimiento):
+        """`conocimiento` es un AlmacenConocimiento o una BaseConocimiento fija"""
+        if not isinstance(conocimiento, AlmacenConocimiento):
+            conocimiento = AlmacenConocimiento(conocimiento)
+        self.almacen = conocimiento
         self.procesador = ProcesadorLenguajeNatural()
+    
+    @property
+    def base_conocimiento(self) -> BaseConocimiento:
+        """Instantánea vigente del conocimiento"""
+        return self.almacen.actual
         
-    def generar_respuesta(self, mensaje: Mensaje) -> str:
+    def clasificar(self, mensaje: Mensaje) -> dict:
+        """Extrae las intenciones y guarda en el mensaje su tipo y las entidades encontradas"""
         intenciones = self.procesador.extraer_intenciones(mensaje)
+        mensaje.tipo = intenciones['tipo']
+        mensaje.entidades = {
+            clave: intenciones[clave] for clave in ('servicio', 'carrera') if intenciones[clave]
+        }
+        mensaje.entidades['es_pregunta'] = intenciones['es_pregunta']
+        return intenciones
+    
+    def generar_respuesta(self, mensaje: Mensaje, intenciones: Optional[dict] = None,
+                          conocimiento: Optional[BaseConocimiento] = None) -> str:
+        """Responde con una sola instantánea del conocimiento (la vigente si no se indica),
+        aunque durante la respuesta se publique otra"""
+        if intenciones is None:
+            intenciones = self.clasificar(mensaje)
+        if conocimiento is None:
+            conocimiento = self.almacen.actual
         tipo = intenciones['tipo']
         
         if tipo == TipoMensaje.SALUDO:
@@ -24,24 +48,24 @@ class GestorRespuestas:
         
         elif tipo == TipoMensaje.CONSULTA_HORARIO:
             servicio = intenciones.get('servicio')
-            return self._respuesta_horario(servicio)
+            return self._respuesta_horario(conocimiento, servicio)
         
         elif tipo == TipoMensaje.CONSULTA_EVENTO:
-            return self._respuesta_eventos()
+            return self._respuesta_eventos(conocimiento)
         
         elif tipo == TipoMensaje.CONSULTA_CARRERA:
             carrera = intenciones.get('carrera')
-            return self._respuesta_carrera(carrera)
+            return self._respuesta_carrera(conocimiento, carrera)
         
         elif tipo == TipoMensaje.CONSULTA_SERVICIO:
             servicio = intenciones.get('servicio')
-            return self._respuesta_servicios(servicio)
+            return self._respuesta_servicios(conocimiento, servicio)
         
         elif tipo == TipoMensaje.CONSULTA_TRAMITE:
-            return self._respuesta_tramites()
+            return self._respuesta_tramites(conocimiento)
         
         elif tipo == TipoMensaje.CONSULTA_SUSPENSION:
-            return self._respuesta_suspensiones(mensaje.contenido)
+            return self._respuesta_suspensiones(conocimiento, mensaje.contenido)
         
         else:
             return self._respuesta_default()
@@ -80,28 +104,28 @@ class GestorRespuestas:
         ]
         return random.choice(respuestas)
     
-    def _respuesta_horario(self, servicio: Optional[str]) -> str:
+    def _respuesta_horario(self, conocimiento: BaseConocimiento, servicio: Optional[str]) -> str:
         if servicio is None:
             respuesta = "📅 *HORARIOS DE SERVICIOS*\n\n"
-            if not self.base_conocimiento.horarios:
+            if not conocimiento.horarios:
                 return "Lo siento, no tengo información de horarios disponible. 😔"
             
-            for horario in self.base_conocimiento.horarios.values():
+            for horario in conocimiento.horarios.values():
                 respuesta += horario.obtener_info() + "\n"
             return respuesta
         
-        horario = self.base_conocimiento.buscar_horario(servicio)
+        horario = conocimiento.buscar_horario(servicio)
         if horario:
             return horario.obtener_info()
         else:
             respuesta = f"Lo siento, no encontré información sobre '{servicio}'. 😔\n\n"
             respuesta += "Servicios disponibles:\n"
-            for nombre in self.base_conocimiento.horarios.keys():
+            for nombre in conocimiento.horarios.keys():
                 respuesta += f"• {nombre.capitalize()}\n"
             return respuesta
     
-    def _respuesta_eventos(self) -> str:
-        eventos_proximos = self.base_conocimiento.obtener_eventos_proximos(dias=60)
+    def _respuesta_eventos(self, conocimiento: BaseConocimiento) -> str:
+        eventos_proximos = conocimiento.obtener_eventos_proximos(dias=60)
         
         if not eventos_proximos:
             return "No hay eventos próximos registrados en este momento. 📅"
@@ -115,35 +139,35 @@ class GestorRespuestas:
         
         return respuesta
     
-    def _respuesta_carrera(self, carrera: Optional[str]) -> str:
+    def _respuesta_carrera(self, conocimiento: BaseConocimiento, carrera: Optional[str]) -> str:
         if carrera is None:
             
-            if not self.base_conocimiento.carreras:
+            if not conocimiento.carreras:
                 return "Lo siento, no tengo información de carreras disponible. 😔"
             
             respuesta = "🎓 *CARRERAS DISPONIBLES*\n\n"
-            for nombre in self.base_conocimiento.carreras.keys():
+            for nombre in conocimiento.carreras.keys():
                 respuesta += f"• {nombre.capitalize()}\n"
             respuesta += "\n¿Sobre cuál te gustaría saber más?"
             return respuesta
         
-        info_carrera = self.base_conocimiento.buscar_carrera(carrera)
+        info_carrera = conocimiento.buscar_carrera(carrera)
         if info_carrera:
             return info_carrera.obtener_info()
         else:
             respuesta = f"No encontré información sobre la carrera '{carrera}'. 😔\n\n"
             respuesta += "Carreras disponibles:\n"
-            for nombre in self.base_conocimiento.carreras.keys():
+            for nombre in conocimiento.carreras.keys():
                 respuesta += f"• {nombre.capitalize()}\n"
             return respuesta
     
-    def _respuesta_servicios(self, servicio: Optional[str]) -> str:
+    def _respuesta_servicios(self, conocimiento: BaseConocimiento, servicio: Optional[str]) -> str:
         if servicio is None:
-            if not self.base_conocimiento.servicios:
+            if not conocimiento.servicios:
                 return "Lo siento, no hay servicios disponibles. 😔"
             
             respuesta = "📋 *SERVICIOS DISPONIBLES*\n\n"
-            for nombre in self.base_conocimiento.servicios.keys():
+            for nombre in conocimiento.servicios.keys():
                 respuesta += f"• {nombre.capitalize()}\n"
             respuesta += "\n¿Sobre cuál te gustaría saber más?"
             return respuesta
@@ -157,35 +181,35 @@ class GestorRespuestas:
         
         servicio_limpio = servicio.lower().replace('á', 'a').replace('é', 'e')
         
-        info_servicio = self.base_conocimiento.buscar_servicio(servicio)
+        info_servicio = conocimiento.buscar_servicio(servicio)
         if info_servicio:
             return info_servicio.obtener_info()
         
         for nombre_servicio, keywords in palabras_servicios.items():
             if any(keyword in servicio_limpio for keyword in keywords):
-                info_servicio = self.base_conocimiento.buscar_servicio(nombre_servicio)
+                info_servicio = conocimiento.buscar_servicio(nombre_servicio)
                 if info_servicio:
                     return info_servicio.obtener_info()
         
         respuesta = f"No encontré información sobre '{servicio}'. 😔\n\n"
         respuesta += "Servicios disponibles:\n"
-        for nombre in self.base_conocimiento.servicios.keys():
+        for nombre in conocimiento.servicios.keys():
             respuesta += f"• {nombre.capitalize()}\n"
         return respuesta
     
-    def _respuesta_tramites(self) -> str:
-        if not self.base_conocimiento.tramites:
+    def _respuesta_tramites(self, conocimiento: BaseConocimiento) -> str:
+        if not conocimiento.tramites:
             return "Lo siento, no tengo información de trámites disponible. 😔"
         
         respuesta = "📋 *TRÁMITES DISPONIBLES*\n\n"
-        for nombre, descripcion in self.base_conocimiento.tramites.items():
+        for nombre, descripcion in conocimiento.tramites.items():
             respuesta += f"*{nombre.upper()}*\n"
             respuesta += f"{descripcion}\n\n"
         
         return respuesta
     
-    def _respuesta_suspensiones(self, mensaje_contenido: str) -> str:
-        suspension = self.base_conocimiento.obtener_suspension_fecha_relativa(mensaje_contenido)
+    def _respuesta_suspensiones(self, conocimiento: BaseConocimiento, mensaje_contenido: str) -> str:
+        suspension = conocimiento.obtener_suspension_fecha_relativa(mensaje_contenido)
     
         if suspension is None:
             return "No hay información de suspensiones para la fecha consultada. 📚"
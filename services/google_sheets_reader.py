@@ -3,14 +3,34 @@ from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
 import os
 
+# Pestañas que usa el chatbot; 'Avisos' existe en la hoja pero nada la consume
+DEFAULT_TABS = ['Horarios', 'Eventos', 'Carreras', 'Servicios', 'Suspensiones']
+
+
+def rows_to_dicts(values):
+    """Convierte las filas de una pestaña (la primera son los encabezados) en diccionarios"""
+    if not values:
+        return []
+    headers = values[0]
+    data = []
+    for row in values[1:]:
+        row = list(row) + [''] * (len(headers) - len(row))
+        data.append({headers[i]: row[i] for i in range(len(headers))})
+    return data
+
+
 class GoogleSheetsReader:
-    def __init__(self, credentials_file, sheet_id):
+    def __init__(self, credentials_file, sheet_id, tabs=None, service=None):
+        """`tabs` son las pestañas que lee get_all_data (por defecto DEFAULT_TABS);
+        con `service` se usa ese cliente de Sheets en vez de autenticarse."""
 
         self.SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
         self.credentials_file = credentials_file
         self.sheet_id = sheet_id
-        self.service = None
-        self._authenticate()
+        self.tabs = list(tabs) if tabs else list(DEFAULT_TABS)
+        self.service = service
+        if self.service is None:
+            self._authenticate()
     
     def _authenticate(self):
         try:
@@ -45,15 +65,7 @@ class GoogleSheetsReader:
                 print(f"⚠️  No hay datos en {sheet_name}")
                 return []
             
-            headers = values[0]
-            data = []
-            
-            for row in values[1:]:
-                while len(row) < len(headers):
-                    row.append('')
-                
-                row_dict = {headers[i]: row[i] for i in range(len(headers))}
-                data.append(row_dict)
+            data = rows_to_dicts(values)
             
             print(f"✅ Leídos {len(data)} registros de {sheet_name}")
             return data
@@ -80,15 +92,34 @@ class GoogleSheetsReader:
     def get_suspensiones(self):
         return self.read_range('Suspensiones')
     
+    def batch_read(self, sheet_names, range_notation='A:Z'):
+        """Lee varias pestañas con una sola llamada a batchGet.
+
+        Devuelve {pestaña: [registros]} con el mismo formato que read_range. A diferencia
+        de read_range, los errores de la API se propagan para que quien llama pueda
+        conservar los datos que ya tenía.
+        """
+        sheet_names = list(sheet_names)
+        if not sheet_names:
+            return {}
+        result = self.service.spreadsheets().values().batchGet(
+            spreadsheetId=self.sheet_id,
+            ranges=[f"'{name}'!{range_notation}" for name in sheet_names]
+        ).execute()
+        
+        # Los rangos vuelven en el mismo orden en que se pidieron
+        value_ranges = result.get('valueRanges', [])
+        data = {}
+        for i, name in enumerate(sheet_names):
+            values = value_ranges[i].get('values', []) if i < len(value_ranges) else []
+            data[name] = rows_to_dicts(values)
+        print(f"✅ Leídas {len(sheet_names)} pestañas en una llamada: "
+              + ", ".join(f"{name} ({len(rows)})" for name, rows in data.items()))
+        return data
+    
     def get_all_data(self):
-        return {
-            'horarios': self.get_horarios(),
-            'eventos': self.get_eventos(),
-            'carreras': self.get_carreras(),
-            'avisos': self.get_avisos(),
-            'servicios': self.get_servicios(),
-            'suspensiones': self.get_suspensiones()
-        }
+        """Todas las pestañas configuradas en `tabs`, con claves en minúsculas ('horarios', ...)"""
+        return {name.lower(): rows for name, rows in self.batch_read(self.tabs).items()}
 
 
 if __name__ == "__main__":
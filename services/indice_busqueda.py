@@ -0,0 +1,304 @@
+import heapq
+import math
+import os
+import pickle
+import threading
+import time
+from array import array
+from collections import Counter
+from datetime import date
+from typing import Callable, Dict, List, Optional, Tuple
+
+from services.lectura_mmap import iterar_lineas
+from services.segmentos_mensajes import SegmentosMensajes
+
+VERSION_INDICE = 2
+# Parámetros de BM25
+K1 = 1.2
+B = 0.75
+# Las longitudes de documento se guardan en un byte; los mensajes más largos cuentan como 255 palabras
+MAX_LONGITUD = 255
+
+
+class IndiceBusqueda:
+    """Índice invertido sobre el contenido de los mensajes guardados en segmentos.
+
+    Cada mensaje es un documento con número consecutivo; sus datos viven en arrays
+    (segmento, offset, teléfono, día y número de palabras) y cada término normalizado apunta a
+    un array con sus postings intercalados: documento, veces que aparece, documento, ...
+    Así el índice ocupa unos pocos bytes por palabra aunque haya millones de mensajes, y una
+    búsqueda recorre cada documento una sola vez por término.
+
+    Se carga la primera vez que se usa: toma la copia guardada en `ruta` y agrega lo
+    escrito en los segmentos después de ella (en modo multiproceso, lo que escribieron
+    los demás procesos se incorpora igual antes de cada búsqueda).
+    """
+
+    def __init__(self, segmentos: SegmentosMensajes, ruta: str, normalizar: Callable[[str], str],
+                 intervalo_guardado: float = 60.0):
+        self.segmentos = segmentos
+        self.ruta = ruta
+        self.normalizar = normalizar
+        self.intervalo_guardado = intervalo_guardado
+        self._lock = threading.RLock()
+        self._cargado = False
+        self._sucio = False
+        self._ultimo_guardado = time.monotonic()
+        self._vaciar()
+
+    def _vaciar(self):
+        self._nombres_segmentos: List[str] = []
+        self._ids_segmento: Dict[str, int] = {}
+        self._telefonos: List[str] = []
+        self._ids_telefono: Dict[str, int] = {}
+        self._doc_segmento = array('I')
+        self._doc_offset = array('Q')
+        self._doc_telefono = array('I')
+        self._doc_dia = array('I')
+        self._doc_longitud = array('B')
+        self._terminos: Dict[str, array] = {}
+        self._indexado: Dict[str, int] = {}
+        self._descartados: set = set()
+        self._longitud_total = 0
+        # Factores de longitud de BM25 por número de palabras; dependen de la longitud media
+        self._factores: Tuple[Optional[float], List[float]] = (None, [])
+
+    # CARGA Y PERSISTENCIA
+    def _asegurar_cargado(self):
+        if not self._cargado:
+            self._cargar()
+            self._cargado = True
+            self.poner_al_dia()
+        elif self.segmentos.multiproceso:
+            self.poner_al_dia()
+
+    def _cargar(self):
+        try:
+            with open(self.ruta, 'rb') as f:
+                estado = pickle.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"Error al cargar el índice de búsqueda, se reconstruirá: {e}")
+            return
+        if estado.get('version') != VERSION_INDICE:
+            return
+        for nombre, valor in estado.items():
+            if nombre != 'version':
+                setattr(self, nombre, valor)
+        # Un segmento más corto que lo indexado fue reescrito: se vuelve a indexar
+        for segmento, fin in list(self._indexado.items()):
+            if self.segmentos.tamano_segmento(segmento) < fin:
+                self.descartar_segmento(segmento)
+
+    def guardar(self, forzar: bool = False):
+        """Guarda el índice si cambió (como máximo una vez por `intervalo_guardado`)"""
+        with self._lock:
+            if not self._cargado or not self._sucio:
+                return
+            if not forzar and time.monotonic() - self._ultimo_guardado < self.intervalo_guardado:
+                return
+            if self._descartados:
+                self._compactar()
+            estado = {
+                'version': VERSION_INDICE,
+                '_nombres_segmentos': self._nombres_segmentos,
+                '_ids_segmento': self._ids_segmento,
+                '_telefonos': self._telefonos,
+                '_ids_telefono': self._ids_telefono,
+                '_doc_segmento': self._doc_segmento,
+                '_doc_offset': self._doc_offset,
+                '_doc_telefono': self._doc_telefono,
+                '_doc_dia': self._doc_dia,
+                '_doc_longitud': self._doc_longitud,
+                '_terminos': self._terminos,
+                '_indexado': self._indexado,
+                '_descartados': self._descartados,
+                '_longitud_total': self._longitud_total
+            }
+            ruta_temporal = f"{self.ruta}.{os.getpid()}.tmp"
+            with open(ruta_temporal, 'wb') as f:
+                pickle.dump(estado, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(ruta_temporal, self.ruta)
+            self._sucio = False
+            self._ultimo_guardado = time.monotonic()
+
+    def _compactar(self):
+        """Quita del índice los documentos de segmentos descartados y renumera el resto"""
+        nuevos = array('i', [-1]) * len(self._doc_segmento)
+        vivos = 0
+        for doc, segmento in enumerate(self._doc_segmento):
+            if segmento not in self._descartados:
+                nuevos[doc] = vivos
+                vivos += 1
+        for nombre in ('_doc_segmento', '_doc_offset', '_doc_telefono', '_doc_dia', '_doc_longitud'):
+            anterior = getattr(self, nombre)
+            setattr(self, nombre, array(anterior.typecode, (
+                valor for doc, valor in enumerate(anterior) if nuevos[doc] >= 0
+            )))
+        for termino in list(self._terminos):
+            postings = self._terminos[termino]
+            compactados = array('I')
+            for i in range(0, len(postings), 2):
+                doc = nuevos[postings[i]]
+                if doc >= 0:
+                    compactados.append(doc)
+                    compactados.append(postings[i + 1])
+            if compactados:
+                self._terminos[termino] = compactados
+            else:
+                del self._terminos[termino]
+        self._longitud_total = sum(self._doc_longitud)
+        self._descartados = set()
+
+    # ACTUALIZACIÓN
+    def agregar(self, segmento: str, offset: int, fin: int, registro: dict):
+        """Indexa un mensaje recién escrito en (segmento, offset).
+
+        Si el índice aún no se carga no hace nada (se incorporará al cargarlo); si hay
+        bytes del segmento sin indexar antes de este mensaje, indexa el segmento desde
+        ahí para conservar el orden.
+        """
+        with self._lock:
+            if not self._cargado:
+                return
+            indexado = self._indexado.get(segmento, 0)
+            if indexado == offset:
+                self._indexar(segmento, offset, registro)
+                self._indexado[segmento] = fin
+            elif indexado < offset:
+                self._poner_al_dia_segmento(segmento)
+
+    def _indexar(self, segmento: str, offset: int, registro: dict):
+        id_segmento = self._ids_segmento.get(segmento)
+        if id_segmento is None:
+            id_segmento = self._ids_segmento[segmento] = len(self._nombres_segmentos)
+            self._nombres_segmentos.append(segmento)
+        telefono = registro['telefono']
+        id_telefono = self._ids_telefono.get(telefono)
+        if id_telefono is None:
+            id_telefono = self._ids_telefono[telefono] = len(self._telefonos)
+            self._telefonos.append(telefono)
+
+        palabras = self.normalizar(registro.get('contenido') or '').split()
+        doc = len(self._doc_segmento)
+        self._doc_segmento.append(id_segmento)
+        self._doc_offset.append(offset)
+        self._doc_telefono.append(id_telefono)
+        self._doc_dia.append(date.fromisoformat(registro['timestamp'][:10]).toordinal())
+        longitud = min(len(palabras), MAX_LONGITUD)
+        self._doc_longitud.append(longitud)
+        self._longitud_total += longitud
+        for palabra, frecuencia in Counter(palabras).items():
+            postings = self._terminos.get(palabra)
+            if postings is None:
+                postings = self._terminos[palabra] = array('I')
+            postings.append(doc)
+            postings.append(frecuencia)
+        self._sucio = True
+
+    def _factores_longitud(self, longitud_media: float) -> List[float]:
+        """Parte del denominador de BM25 que depende de la longitud del documento, por longitud"""
+        media, factores = self._factores
+        if media != longitud_media:
+            factores = [K1 * (1 - B + B * longitud / longitud_media) for longitud in range(MAX_LONGITUD + 1)]
+            self._factores = (longitud_media, factores)
+        return factores
+
+    def descartar_segmento(self, segmento: str):
+        """Saca del índice un segmento eliminado o reescrito"""
+        with self._lock:
+            id_segmento = self._ids_segmento.pop(segmento, None)
+            if id_segmento is not None:
+                self._descartados.add(id_segmento)
+            self._indexado.pop(segmento, None)
+            self._sucio = True
+
+    def reindexar_segmentos(self, segmentos: List[str]):
+        """Vuelve a indexar segmentos reescritos (sus mensajes cambiaron de offset).
+
+        Carga el índice antes: un segmento reordenado mide lo mismo que antes, así que al
+        cargar la copia guardada no se notaría que sus offsets ya no sirven.
+        """
+        if not segmentos:
+            return
+        with self._lock:
+            self._asegurar_cargado()
+            for segmento in segmentos:
+                self.descartar_segmento(segmento)
+                self._poner_al_dia_segmento(segmento)
+
+    def poner_al_dia(self):
+        """Indexa lo escrito en los segmentos después de lo ya indexado"""
+        with self._lock:
+            existentes = self.segmentos.segmentos()
+            for segmento in set(self._indexado) - set(existentes):
+                self.descartar_segmento(segmento)
+            for segmento in existentes:
+                self._poner_al_dia_segmento(segmento)
+
+    def _poner_al_dia_segmento(self, segmento: str):
+        inicio = self._indexado.get(segmento, 0)
+        if self.segmentos.tamano_segmento(segmento) <= inicio:
+            return
+        for offset, fin, registro in iterar_lineas(self.segmentos.ruta_segmento(segmento), inicio):
+            self._indexar(segmento, offset, registro)
+            self._indexado[segmento] = fin
+
+    # CONSULTA
+    def buscar(self, consulta: str, telefono: Optional[str] = None, desde: Optional[date] = None,
+               hasta: Optional[date] = None, limite: int = 20) -> List[Tuple[float, str, int]]:
+        """Busca mensajes que contengan alguno de los términos de la consulta.
+
+        Devuelve hasta `limite` tuplas (puntaje, segmento, offset) ordenadas por relevancia
+        BM25; entre puntajes iguales gana el mensaje más reciente.
+        """
+        terminos = list(dict.fromkeys(self.normalizar(consulta).split()))
+        if not terminos:
+            return []
+        with self._lock:
+            self._asegurar_cargado()
+            id_telefono = None
+            if telefono is not None:
+                id_telefono = self._ids_telefono.get(telefono)
+                if id_telefono is None:
+                    return []
+            dia_desde = desde.toordinal() if desde else 0
+            dia_hasta = hasta.toordinal() if hasta else 2 ** 32 - 1
+            total_docs = max(len(self._doc_segmento), 1)
+            longitud_media = max(self._longitud_total / total_docs, 1)
+
+            doc_telefono = self._doc_telefono
+            doc_dia = self._doc_dia
+            doc_segmento = self._doc_segmento
+            descartados = self._descartados
+            filtrar = id_telefono is not None or desde is not None or hasta is not None or bool(descartados)
+
+            def aceptar(doc: int) -> bool:
+                return ((id_telefono is None or doc_telefono[doc] == id_telefono)
+                        and dia_desde <= doc_dia[doc] <= dia_hasta
+                        and doc_segmento[doc] not in descartados)
+
+            longitudes = self._doc_longitud
+            factores = self._factores_longitud(longitud_media)
+
+            puntajes: Dict[int, float] = {}
+            for termino in terminos:
+                postings = self._terminos.get(termino)
+                if not postings:
+                    continue
+                documentos = len(postings) // 2
+                idf = math.log(1 + (total_docs - documentos + 0.5) / (documentos + 0.5))
+                peso = idf * (K1 + 1)
+                candidatos = zip(postings[0::2], postings[1::2])
+                if filtrar:
+                    candidatos = [(doc, tf) for doc, tf in candidatos if aceptar(doc)]
+                obtener = puntajes.get
+                for doc, tf in candidatos:
+                    puntajes[doc] = obtener(doc, 0.0) + peso * tf / (tf + factores[longitudes[doc]])
+
+            mejores = heapq.nlargest(limite, puntajes.items(), key=lambda par: (par[1], par[0]))
+            return [
+                (puntaje, self._nombres_segmentos[self._doc_segmento[doc]], self._doc_offset[doc])
+                for doc, puntaje in mejores
+            ]
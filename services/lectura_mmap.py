@@ -0,0 +1,140 @@
+import codecs
+import json
+import mmap
+import os
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional, Tuple
+
+TAMANO_BLOQUE = 1 << 16
+_ESPACIOS = ' \t\r\n'
+
+
+@contextmanager
+def mapear(ruta: str):
+    """Mapea un archivo en memoria de solo lectura (un archivo vacío da b'')"""
+    with open(ruta, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+            yield mapa
+
+
+def iterar_lineas(ruta: str, inicio: int = 0) -> Iterator[Tuple[int, int, dict]]:
+    """Recorre un archivo JSONL mapeado en memoria y produce (offset, fin, registro).
+
+    Las páginas las pone y las quita el sistema operativo según se van leyendo, así que
+    la memoria del proceso no crece con el tamaño del archivo. Se ignoran las líneas
+    inválidas y se termina en una última línea incompleta (escritura interrumpida).
+    """
+    try:
+        with mapear(ruta) as mapa:
+            posicion = inicio
+            while posicion < len(mapa):
+                fin = mapa.find(b'\n', posicion)
+                if fin < 0:
+                    break
+                try:
+                    registro = json.loads(mapa[posicion:fin])
+                except json.JSONDecodeError:
+                    registro = None
+                if registro is not None:
+                    yield posicion, fin + 1, registro
+                posicion = fin + 1
+    except FileNotFoundError:
+        return
+
+
+def iterar_json(ruta: str, inicio: int = 0) -> Iterator[Tuple[Optional[str], Any, int]]:
+    """Recorre incrementalmente un arreglo u objeto JSON de nivel superior.
+
+    Produce (clave, valor, offset) por elemento: la clave es None en los arreglos y
+    el offset es la posición en bytes justo después del elemento, que sirve para
+    reanudar con `inicio`. El archivo se decodifica por bloques desde un mmap, así
+    que la memoria usada depende del tamaño de un elemento, no del archivo.
+    """
+    decodificador = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    with mapear(ruta) as mapa:
+        buffer = ''
+        i = 0
+        posicion = inicio
+        leido = inicio
+        es_objeto = None if inicio == 0 else _es_objeto(mapa, ruta)
+
+        def leer_mas() -> bool:
+            nonlocal buffer, i, leido
+            if leido >= len(mapa):
+                return False
+            bloque = mapa[leido:leido + TAMANO_BLOQUE]
+            leido += len(bloque)
+            buffer = buffer[i:] + utf8.decode(bloque, final=leido >= len(mapa))
+            i = 0
+            return True
+
+        def saltar(caracteres: str) -> Optional[str]:
+            """Salta espacios y los caracteres dados (ASCII); devuelve el siguiente carácter"""
+            nonlocal i, posicion
+            while True:
+                inicio_salto = i
+                while i < len(buffer) and (buffer[i] in _ESPACIOS or buffer[i] in caracteres):
+                    i += 1
+                posicion += i - inicio_salto
+                if i < len(buffer):
+                    return buffer[i]
+                if not leer_mas():
+                    return None
+
+        def avanzar(caracteres: int = 1):
+            nonlocal i, posicion
+            i += caracteres
+            posicion += caracteres
+
+        def decodificar() -> Any:
+            nonlocal i, posicion
+            while True:
+                try:
+                    valor, fin = decodificador.raw_decode(buffer, i)
+                except json.JSONDecodeError:
+                    if not leer_mas():
+                        raise
+                    continue
+                if fin == len(buffer) and leido < len(mapa):
+                    # Un número puede continuar en el siguiente bloque
+                    leer_mas()
+                    continue
+                posicion += len(buffer[i:fin].encode('utf-8'))
+                i = fin
+                return valor
+
+        if es_objeto is None:
+            apertura = saltar('')
+            if apertura is None:
+                return
+            if apertura not in ('[', '{'):
+                raise ValueError(f"{ruta} no contiene un arreglo ni un objeto JSON")
+            es_objeto = apertura == '{'
+            avanzar()
+
+        while True:
+            siguiente = saltar(',')
+            if siguiente is None or siguiente in (']', '}'):
+                return
+            clave = None
+            if es_objeto:
+                clave = decodificar()
+                if saltar('') != ':':
+                    raise ValueError(f"JSON inválido en {ruta} cerca del byte {posicion}")
+                avanzar()
+                saltar('')
+            valor = decodificar()
+            yield clave, valor, posicion
+
+
+def _es_objeto(mapa, ruta: str) -> bool:
+    """True si el JSON de nivel superior es un objeto, False si es un arreglo"""
+    for byte in mapa:
+        caracter = chr(byte[0]) if isinstance(byte, bytes) else chr(byte)
+        if caracter not in _ESPACIOS:
+            return caracter == '{'
+    raise ValueError(f"{ruta} está vacío")
@@ -0,0 +1,185 @@
+"""
+Migra datos/mensajes.json y datos/usuarios.json heredados al almacenamiento que use BaseDatos
+(segmentos JSONL o SQLite) sin cargar los archivos completos en memoria.
+
+Uso:
+    python -m services.migracion --origen datos --destino datos --backend sqlite
+    python -m services.migracion --origen datos --reanudar
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import List, Optional, Tuple
+
+sys.path.append('.')
+
+from models.usuario import Usuario
+from models.mensaje import Mensaje
+from services.base_datos import BaseDatos, crear_base_datos
+from services.lectura_mmap import iterar_json
+
+
+class Migracion:
+    """Migración reanudable de los JSON heredados hacia el almacenamiento configurado.
+
+    El progreso (offset en bytes y conteos por archivo) se guarda en destino/.migracion.json
+    después de cada lote escrito con fsync. Si el proceso muere justo entre ambos pasos, al
+    reanudar se vuelve a leer ese último lote: por eso del primer lote de mensajes de cada
+    ejecución se omiten los que ya están en el destino (mismo id). Los usuarios se
+    sobrescriben, así que repetirlos no duplica nada.
+    """
+
+    def __init__(self, origen: str, destino: str, backend: Optional[str] = None,
+                 tamano_lote: int = 1000):
+        self.origen = origen
+        self.destino = destino
+        self.backend = backend
+        self.tamano_lote = tamano_lote
+        self.ruta_progreso = os.path.join(destino, ".migracion.json")
+        self.progreso = self._cargar_progreso()
+
+    def _cargar_progreso(self) -> dict:
+        try:
+            with open(self.ruta_progreso, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _guardar_progreso(self):
+        ruta_temporal = self.ruta_progreso + '.tmp'
+        with open(ruta_temporal, 'w', encoding='utf-8') as f:
+            json.dump(self.progreso, f, indent=2)
+        os.replace(ruta_temporal, self.ruta_progreso)
+
+    @staticmethod
+    def _sin_repetidos(bd, mensajes: List[Mensaje]) -> List[Mensaje]:
+        """Quita los mensajes que ya están en el destino"""
+        existentes = set()
+        for telefono in {mensaje.telefono for mensaje in mensajes}:
+            existentes.update(mensaje.id for mensaje in bd.iterar_mensajes_usuario(telefono))
+        return [mensaje for mensaje in mensajes if mensaje.id not in existentes]
+
+    def _migrar_archivo(self, bd, nombre: str, convertir, es_usuario: bool) -> Tuple[int, int]:
+        """Migra un archivo por lotes; devuelve (registros leídos en total, registros con error)"""
+        ruta = os.path.join(self.origen, nombre)
+        estado = self.progreso.setdefault(nombre, {'bytes': 0, 'registros': 0, 'errores': 0, 'completo': False})
+        if estado['completo'] or not os.path.exists(ruta):
+            return estado['registros'], estado['errores']
+
+        tamano = os.path.getsize(ruta)
+        inicio = time.perf_counter()
+        leidos_sesion = 0
+        lote = []
+        # Leídos/erróneos desde el último lote escrito; solo pasan al progreso al escribir
+        pendientes = {'registros': 0, 'errores': 0}
+        # El primer lote puede haberse escrito ya en una ejecución interrumpida
+        revisar_repetidos = not es_usuario
+
+        def escribir_lote(offset: int):
+            nonlocal revisar_repetidos
+            if revisar_repetidos:
+                lote[:] = self._sin_repetidos(bd, lote)
+                revisar_repetidos = False
+            usuarios, mensajes = (lote, []) if es_usuario else ([], lote)
+            if not bd.guardar_lote(usuarios, mensajes, fsync=True):
+                raise RuntimeError(f"No se pudo escribir el lote de {nombre}; reanude con --reanudar")
+            lote.clear()
+            estado['bytes'] = offset
+            for clave in pendientes:
+                estado[clave] += pendientes[clave]
+                pendientes[clave] = 0
+            self._guardar_progreso()
+            transcurrido = max(time.perf_counter() - inicio, 1e-9)
+            print(f"   {nombre}: {estado['registros']} registros "
+                  f"({offset * 100 / max(tamano, 1):.1f}%) - {leidos_sesion / transcurrido:.0f} registros/s")
+
+        offset = estado['bytes']
+        for clave, valor, offset in iterar_json(ruta, estado['bytes']):
+            pendientes['registros'] += 1
+            leidos_sesion += 1
+            try:
+                lote.append(convertir(clave, valor))
+            except Exception as e:
+                pendientes['errores'] += 1
+                print(f"   ⚠️  Registro inválido en {nombre}: {e}")
+            if len(lote) >= self.tamano_lote:
+                escribir_lote(offset)
+        escribir_lote(offset)
+
+        estado['completo'] = True
+        self._guardar_progreso()
+        return estado['registros'], estado['errores']
+
+    def ejecutar(self) -> bool:
+        """Ejecuta (o reanuda) la migración; devuelve True si los conteos coinciden"""
+        bd = crear_base_datos(self.backend, self.destino)
+        misma_ubicacion = os.path.abspath(self.origen) == os.path.abspath(self.destino)
+        # Las estadísticas previas se fijan en la primera ejecución para poder verificar al reanudar
+        antes = self.progreso.get('antes') or bd.obtener_estadisticas()
+        self.progreso['antes'] = {'total_usuarios': antes['total_usuarios'],
+                                  'total_mensajes': antes['total_mensajes']}
+        self._guardar_progreso()
+
+        print("=" * 60)
+        print(f"🚚 MIGRANDO {self.origen} -> {self.destino} ({type(bd).__name__})")
+        print("=" * 60)
+
+        # Con el backend JSON en el mismo directorio, usuarios.json ya es el destino y
+        # BaseDatos ya pasó el mensajes.json heredado a segmentos al abrirse
+        en_sitio = misma_ubicacion and isinstance(bd, BaseDatos)
+        migrar_usuarios = not en_sitio
+        usuarios = errores_usuarios = 0
+        if migrar_usuarios:
+            usuarios, errores_usuarios = self._migrar_archivo(
+                bd, "usuarios.json", lambda telefono, datos: Usuario.from_dict(datos), True
+            )
+        mensajes, errores_mensajes = self._migrar_archivo(
+            bd, "mensajes.json", lambda _, datos: Mensaje.from_dict(datos), False
+        )
+
+        # Los mensajes heredados ya no deben leerse junto con los migrados
+        ruta_legado = os.path.join(self.origen, "mensajes.json")
+        if misma_ubicacion and os.path.exists(ruta_legado):
+            os.replace(ruta_legado, ruta_legado + ".migrado")
+            if hasattr(bd, 'reconstruir_estadisticas'):
+                bd.reconstruir_estadisticas()
+
+        despues = bd.obtener_estadisticas()
+        bd.cerrar()
+
+        if en_sitio:
+            esperados_mensajes = antes['total_mensajes'] - errores_mensajes
+        else:
+            esperados_mensajes = antes['total_mensajes'] + mensajes - errores_mensajes
+        correcto = despues['total_mensajes'] == esperados_mensajes
+        if migrar_usuarios:
+            correcto = correcto and despues['total_usuarios'] >= usuarios - errores_usuarios
+
+        print("\n" + "=" * 60)
+        print(f"Usuarios leídos: {usuarios} ({errores_usuarios} con error)")
+        print(f"Mensajes leídos: {mensajes} ({errores_mensajes} con error)")
+        print(f"Destino: {despues['total_usuarios']} usuarios, {despues['total_mensajes']} mensajes "
+              f"(esperados {esperados_mensajes} mensajes)")
+        print("✅ Conteos verificados" if correcto else "❌ Los conteos no coinciden")
+        print("=" * 60)
+        return correcto
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migra los JSON heredados al almacenamiento actual")
+    parser.add_argument('--origen', default='datos', help="Directorio con mensajes.json y usuarios.json")
+    parser.add_argument('--destino', default='datos', help="Directorio de datos de destino")
+    parser.add_argument('--backend', choices=['json', 'sqlite'], default=None,
+                        help="Backend de destino (por defecto CHATBOT_BACKEND_DATOS)")
+    parser.add_argument('--lote', type=int, default=1000, help="Registros por escritura")
+    parser.add_argument('--reanudar', action='store_true',
+                        help="Continúa una migración interrumpida (si no, empieza de cero)")
+    args = parser.parse_args()
+
+    migracion = Migracion(args.origen, args.destino, args.backend, args.lote)
+    if not args.reanudar and migracion.progreso:
+        migracion.progreso = {}
+    sys.exit(0 if migracion.ejecutar() else 1)
@@ -0,0 +1,89 @@
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+GRANULARIDADES = ('dia', 'semana', 'mes')
+# Las claves de cada granularidad tienen largo distinto: AAAA-MM-DD, AAAA-Www y AAAA-MM
+_GRANULARIDAD_POR_LARGO = {10: 'dia', 8: 'semana', 7: 'mes'}
+
+
+def clave_periodo(fecha: str, granularidad: str) -> str:
+    """Clave del periodo al que pertenece una fecha AAAA-MM-DD (la semana es la ISO)"""
+    if granularidad == 'dia':
+        return fecha
+    if granularidad == 'mes':
+        return fecha[:7]
+    if granularidad == 'semana':
+        anio, semana, _ = date.fromisoformat(fecha).isocalendar()
+        return f"{anio}-W{semana:02d}"
+    raise ValueError(f"Granularidad desconocida: {granularidad}")
+
+
+@lru_cache(maxsize=4096)
+def claves_periodo(fecha: str) -> Tuple[Tuple[str, str], ...]:
+    """(granularidad, clave) de los periodos que contienen una fecha"""
+    return tuple((granularidad, clave_periodo(fecha, granularidad)) for granularidad in GRANULARIDADES)
+
+
+def granularidad_de(clave: str) -> str:
+    return _GRANULARIDAD_POR_LARGO[len(clave)]
+
+
+def primera_clave_abierta(granularidad: str, hoy: date) -> str:
+    """Clave del periodo anterior al actual; desde ahí los periodos siguen abiertos.
+
+    Se deja abierto también el anterior para contar bien los mensajes que llegan con
+    retraso justo después del cambio de día, semana o mes.
+    """
+    dias_atras = {'dia': 1, 'semana': 7, 'mes': hoy.day}[granularidad]
+    return clave_periodo((hoy - timedelta(days=dias_atras)).isoformat(), granularidad)
+
+
+def periodo_abierto(clave: str, hoy: date) -> bool:
+    """Si todavía hay que recordar qué teléfonos escribieron en el periodo"""
+    return clave >= primera_clave_abierta(granularidad_de(clave), hoy)
+
+
+def resumen_vacio() -> Dict:
+    return {'mensajes': 0, 'usuarios_activos': 0, 'tipos': {}}
+
+
+def seleccionar(resumenes: Dict[str, Dict], desde: date, hasta: date, granularidad: str) -> List[Dict]:
+    """Resúmenes de los periodos que se traslapan con [desde, hasta], en orden"""
+    primera = clave_periodo(desde.isoformat(), granularidad)
+    ultima = clave_periodo(hasta.isoformat(), granularidad)
+    return [
+        {'periodo': clave, **resumen, 'tipos': dict(resumen['tipos'])}
+        for clave, resumen in sorted(resumenes.items()) if primera <= clave <= ultima
+    ]
+
+
+def agrupar(mensajes: Iterable[Tuple[str, str, bool, Optional[str]]]) -> Dict[Tuple[str, str], Dict]:
+    """Agrupa (telefono, fecha, es_bot, tipo) por (granularidad, periodo).
+
+    Cada grupo lleva los mensajes, los teléfonos que escribieron y los tipos de los
+    mensajes entrantes (los del bot no se cuentan por tipo).
+    """
+    grupos: Dict[Tuple[str, str], Dict] = {}
+    for telefono, fecha, es_bot, tipo in mensajes:
+        for periodo in claves_periodo(fecha):
+            grupo = grupos.get(periodo)
+            if grupo is None:
+                grupo = grupos[periodo] = {'mensajes': 0, 'telefonos': set(), 'tipos': {}}
+            grupo['mensajes'] += 1
+            grupo['telefonos'].add(telefono)
+            if tipo and not es_bot:
+                grupo['tipos'][tipo] = grupo['tipos'].get(tipo, 0) + 1
+    return grupos
+
+
+def descontar(resumen: Dict, grupo: Dict):
+    """Resta de un resumen los mensajes de teléfonos que se borran por completo"""
+    resumen['mensajes'] -= grupo['mensajes']
+    resumen['usuarios_activos'] -= len(grupo['telefonos'])
+    for tipo, cantidad in grupo['tipos'].items():
+        restante = resumen['tipos'].get(tipo, 0) - cantidad
+        if restante > 0:
+            resumen['tipos'][tipo] = restante
+        else:
+            resumen['tipos'].pop(tipo, None)
@@ -0,0 +1,487 @@
+import heapq
+import json
+import os
+from itertools import groupby
+from typing import Optional, List, Dict, Iterator, Set, Tuple
+
+from services.bloqueo_archivo import BloqueoArchivo, reservar_numero
+from services.lectura_mmap import iterar_lineas
+
+
+class SegmentosMensajes:
+    """Historial de mensajes particionado en archivos JSONL por día o por mes.
+
+    Cada segmento se llama como su periodo (AAAA-MM-DD.jsonl o AAAA-MM.jsonl) y solo
+    recibe escrituras al final. Un índice por teléfono (indice.idx) guarda la ubicación
+    (segmento, offset) de cada mensaje para leer historiales sin recorrer todo.
+
+    Con `multiproceso=True` cada proceso reserva un número de escritor (wN) y anexa solo a
+    sus propios segmentos (AAAA-MM-DD.wN.jsonl) y a su propio índice (indices/wN.idx), con
+    el flock compartido: los workers escriben en paralelo sin turnarse. Al leer se combinan
+    los segmentos y los índices de todos. Lo que borra o reescribe segmentos toma el flock
+    exclusivo y deja el índice completo en indice.idx.
+
+    Dentro de cada segmento los mensajes quedan en orden cronológico (cada lote se escribe
+    ordenado), así que `iterar` solo intercala los segmentos de un mismo periodo.
+
+    Cada línea del índice lleva el timestamp del mensaje: si un teléfono recibe una entrada
+    anterior a la última que tenía (otro worker la escribió antes pero se leyó después),
+    sus referencias se reordenan la próxima vez que se piden.
+    """
+
+    PARTICIONES = {'dia': 10, 'mes': 7}
+
+    def __init__(self, ruta: str, particion: str = 'dia', multiproceso: bool = False):
+        if particion not in self.PARTICIONES:
+            raise ValueError(f"Partición desconocida: {particion}")
+        self.ruta = ruta
+        self.particion = particion
+        self.multiproceso = multiproceso
+        self.ruta_indice = os.path.join(ruta, "indice.idx")
+        self.ruta_indices = os.path.join(ruta, "indices")
+        self._indice: Dict[str, List[Tuple[str, int]]] = {}
+        self._conteo_segmentos: Dict[str, int] = {}
+        # Timestamp de la última referencia de cada teléfono y teléfonos por reordenar
+        self._ultimo_momento: Dict[str, str] = {}
+        self._desordenados: Set[str] = set()
+        # Por archivo de índice: (inodo, hasta dónde se leyó); el inodo cambia si se reescribe
+        self._leido: Dict[str, Tuple[int, int]] = {}
+        os.makedirs(self.ruta_indices, exist_ok=True)
+        self._lock = BloqueoArchivo(os.path.join(ruta, ".lock"), multiproceso)
+        # Sufijo de los segmentos e índice propios (solo en modo multiproceso)
+        self.escritor: Optional[str] = None
+        self._fd_escritor = None
+        if multiproceso:
+            numero, self._fd_escritor = reservar_numero(self.ruta_indices, 'w')
+            self.escritor = f"w{numero}"
+        self.ruta_indice_propio = (
+            os.path.join(self.ruta_indices, f"{self.escritor}.idx") if self.escritor else self.ruta_indice
+        )
+        with self._lock:
+            self._cargar_indice()
+
+    def cerrar(self):
+        """Libera el número de escritor reservado"""
+        if self._fd_escritor is not None:
+            os.close(self._fd_escritor)
+            self._fd_escritor = None
+
+    def exclusivo(self) -> BloqueoArchivo:
+        """Bloqueo exclusivo de los segmentos: mientras se tenga ningún proceso anexa"""
+        return self._lock
+
+    # SEGMENTOS
+    def clave_segmento(self, timestamp: str) -> str:
+        """Periodo al que pertenece un timestamp ISO"""
+        return timestamp[:self.PARTICIONES[self.particion]]
+
+    def _segmento_propio(self, timestamp: str) -> str:
+        """Segmento donde este proceso anexa los mensajes de un timestamp"""
+        periodo = self.clave_segmento(timestamp)
+        return f"{periodo}.{self.escritor}" if self.escritor else periodo
+
+    @staticmethod
+    def periodo(segmento: str) -> str:
+        """Periodo de un segmento (sin el sufijo del escritor)"""
+        return segmento.split('.', 1)[0]
+
+    def ruta_segmento(self, segmento: str) -> str:
+        return os.path.join(self.ruta, f"{segmento}.jsonl")
+
+    def segmentos(self) -> List[str]:
+        """Segmentos existentes en orden cronológico"""
+        return sorted(
+            nombre[:-len('.jsonl')] for nombre in os.listdir(self.ruta)
+            if nombre.endswith('.jsonl')
+        )
+
+    def segmentos_en_rango(self, desde: Optional[str] = None, hasta: Optional[str] = None) -> List[str]:
+        """Segmentos que pueden contener fechas entre `desde` y `hasta` (AAAA-MM-DD, inclusivos)"""
+        segmentos = []
+        for s in self.segmentos():
+            periodo = self.periodo(s)
+            if (desde is None or periodo >= desde[:len(periodo)]) and (hasta is None or periodo <= hasta[:len(periodo)]):
+                segmentos.append(s)
+        return segmentos
+
+    def segmentos_anteriores(self, fecha: str) -> List[str]:
+        """Segmentos cuyo periodo termina antes de `fecha` (AAAA-MM-DD)"""
+        return [s for s in self.segmentos() if self.periodo(s) < fecha[:len(self.periodo(s))]]
+
+    def tamano_segmento(self, segmento: str) -> int:
+        try:
+            return os.path.getsize(self.ruta_segmento(segmento))
+        except FileNotFoundError:
+            return 0
+
+    # ESCRITURA
+    def anexar(self, registro: dict) -> Tuple[str, int, int]:
+        """Agrega un mensaje a su segmento y devuelve (segmento, offset, fin)"""
+        segmento = self._segmento_propio(registro['timestamp'])
+        linea = (json.dumps(registro, ensure_ascii=False) + '\n').encode('utf-8')
+        with self._lock.compartido():
+            with open(self.ruta_segmento(segmento), 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(linea)
+            self._anexar_indice([(segmento, offset, registro['telefono'], registro['timestamp'])])
+        return segmento, offset, offset + len(linea)
+
+    def anexar_lote(self, registros: List[dict], fsync: bool = False) -> List[Tuple[str, int, int]]:
+        """Agrega varios mensajes con una sola escritura por segmento; devuelve (segmento, offset, fin) de cada uno"""
+        por_segmento: Dict[str, List[Tuple[int, bytes, dict]]] = {}
+        for i, registro in enumerate(registros):
+            linea = (json.dumps(registro, ensure_ascii=False) + '\n').encode('utf-8')
+            por_segmento.setdefault(self._segmento_propio(registro['timestamp']), []).append(
+                (i, linea, registro)
+            )
+
+        ubicaciones: List[Tuple[str, int, int]] = [None] * len(registros)
+        entradas_indice = []
+        with self._lock.compartido():
+            for segmento, lineas in por_segmento.items():
+                lineas.sort(key=lambda entrada: entrada[2]['timestamp'])
+                with open(self.ruta_segmento(segmento), 'ab') as f:
+                    offset = f.seek(0, os.SEEK_END)
+                    f.write(b''.join(linea for _, linea, _ in lineas))
+                    if fsync:
+                        f.flush()
+                        os.fsync(f.fileno())
+                for i, linea, registro in lineas:
+                    ubicaciones[i] = (segmento, offset, offset + len(linea))
+                    entradas_indice.append((segmento, offset, registro['telefono'], registro['timestamp']))
+                    offset += len(linea)
+            self._anexar_indice(entradas_indice)
+        return ubicaciones
+
+    def ordenar_segmentos(self, segmentos: List[str]) -> List[str]:
+        """Reescribe en orden cronológico los segmentos que no lo estén; devuelve cuáles cambió"""
+        reordenados = []
+        with self._lock:
+            for segmento in segmentos:
+                lineas = [(registro['timestamp'], linea) for _, linea, registro in self._lineas(segmento)]
+                if all(lineas[i][0] <= lineas[i + 1][0] for i in range(len(lineas) - 1)):
+                    continue
+                lineas.sort(key=lambda entrada: entrada[0])
+                ruta = self.ruta_segmento(segmento)
+                with open(ruta + '.tmp', 'wb') as f:
+                    f.write(b''.join(linea for _, linea in lineas))
+                os.replace(ruta + '.tmp', ruta)
+                reordenados.append(segmento)
+            if reordenados:
+                self.reconstruir_indice()
+        return reordenados
+
+    def _lineas(self, segmento: str) -> Iterator[Tuple[int, bytes, dict]]:
+        """(offset, línea en bytes, registro) de cada mensaje de un segmento"""
+        with open(self.ruta_segmento(segmento), 'rb') as f:
+            for offset, fin, registro in iterar_lineas(self.ruta_segmento(segmento)):
+                f.seek(offset)
+                yield offset, f.read(fin - offset), registro
+
+    def eliminar_segmento(self, segmento: str) -> int:
+        """Borra un segmento completo sin leerlo; devuelve cuántos mensajes tenía"""
+        return self.eliminar_segmentos([segmento])
+
+    def eliminar_segmentos(self, segmentos: List[str]) -> int:
+        """Borra varios segmentos reescribiendo indice.idx una sola vez; devuelve cuántos mensajes tenían"""
+        borrar = set(segmentos)
+        if not borrar:
+            return 0
+        with self._lock:
+            self._sincronizar_indice()
+            eliminados = sum(self._conteo_segmentos.pop(segmento, 0) for segmento in borrar)
+            for segmento in borrar:
+                if os.path.exists(self.ruta_segmento(segmento)):
+                    os.remove(self.ruta_segmento(segmento))
+            for telefono in list(self._indice):
+                refs = [r for r in self._indice[telefono] if r[0] not in borrar]
+                if refs:
+                    self._indice[telefono] = refs
+                else:
+                    self._olvidar(telefono)
+            self._guardar_indice()
+        return eliminados
+
+    def eliminar_telefonos(self, telefonos: Set[str]) -> Tuple[int, List[str]]:
+        """Quita los mensajes de varios teléfonos reescribiendo solo los segmentos donde aparecen.
+
+        Devuelve cuántos mensajes se eliminaron y qué segmentos se reescribieron.
+        """
+        with self._lock:
+            self._sincronizar_indice()
+            afectados = sorted({
+                segmento for telefono in telefonos for segmento, _ in self._indice.get(telefono, [])
+            })
+            eliminados = 0
+            # (segmento, offset anterior) -> offset en el segmento reescrito
+            nuevos_offsets: Dict[Tuple[str, int], int] = {}
+            for segmento in afectados:
+                ruta = self.ruta_segmento(segmento)
+                with open(ruta + '.tmp', 'wb') as f:
+                    for offset, _, registro in iterar_lineas(ruta):
+                        if registro['telefono'] in telefonos:
+                            eliminados += 1
+                            continue
+                        nuevos_offsets[(segmento, offset)] = f.tell()
+                        f.write((json.dumps(registro, ensure_ascii=False) + '\n').encode('utf-8'))
+                    vacio = f.tell() == 0
+                if vacio:
+                    os.remove(ruta + '.tmp')
+                    os.remove(ruta)
+                else:
+                    os.replace(ruta + '.tmp', ruta)
+            if not afectados:
+                return 0, []
+
+            # Los offsets de los segmentos reescritos cambiaron; el orden de cada teléfono se conserva
+            reescritos = set(afectados)
+            for telefono in telefonos:
+                self._olvidar(telefono)
+            for telefono, refs in self._indice.items():
+                if any(segmento in reescritos for segmento, _ in refs):
+                    self._indice[telefono] = [
+                        (segmento, nuevos_offsets[(segmento, offset)] if segmento in reescritos else offset)
+                        for segmento, offset in refs
+                    ]
+            for segmento in afectados:
+                self._conteo_segmentos.pop(segmento, None)
+            for segmento, _ in nuevos_offsets:
+                self._conteo_segmentos[segmento] = self._conteo_segmentos.get(segmento, 0) + 1
+            self._guardar_indice()
+        return eliminados, afectados
+
+    # LECTURA
+    def escanear(self, segmento: str, inicio: int = 0) -> Iterator[Tuple[int, dict]]:
+        """Recorre un segmento desde un offset (mapeado en memoria) y produce (offset, registro)"""
+        for offset, _, registro in iterar_lineas(self.ruta_segmento(segmento), inicio):
+            yield offset, registro
+
+    def leer_desde(self, segmento: str, inicio: int = 0) -> Tuple[List[dict], int]:
+        """Lee los registros completos de un segmento a partir de un offset.
+
+        Devuelve los registros y la posición donde termina el último registro completo.
+        """
+        registros = []
+        fin = inicio
+        for _, fin, registro in iterar_lineas(self.ruta_segmento(segmento), inicio):
+            registros.append(registro)
+        return registros, fin
+
+    def iterar(self, desde: Optional[str] = None, hasta: Optional[str] = None) -> Iterator[dict]:
+        """Recorre en orden cronológico los mensajes entre dos fechas abriendo solo los segmentos que las cubren.
+
+        Los segmentos de un mismo periodo (uno por escritor) se intercalan por timestamp.
+        """
+        for _, segmentos in groupby(self.segmentos_en_rango(desde, hasta), key=self.periodo):
+            fuentes = [(registro for _, registro in self.escanear(segmento)) for segmento in segmentos]
+            for registro in heapq.merge(*fuentes, key=lambda r: r['timestamp']):
+                fecha = registro['timestamp'][:10]
+                if (desde is None or fecha >= desde) and (hasta is None or fecha <= hasta):
+                    yield registro
+
+    def leer(self, referencias: List[Tuple[str, int]]) -> List[dict]:
+        """Lee los registros ubicados en las referencias (segmento, offset) indicadas"""
+        registros = []
+        archivo = None
+        actual = None
+        try:
+            for segmento, offset in referencias:
+                if segmento != actual:
+                    if archivo:
+                        archivo.close()
+                    archivo = open(self.ruta_segmento(segmento), 'rb')
+                    actual = segmento
+                archivo.seek(offset)
+                registros.append(json.loads(archivo.readline()))
+        finally:
+            if archivo:
+                archivo.close()
+        return registros
+
+    # ÍNDICE POR TELÉFONO
+    def _indexar(self, telefono: str, segmento: str, offset: int, momento: Optional[str] = None):
+        self._indice.setdefault(telefono, []).append((segmento, offset))
+        self._conteo_segmentos[segmento] = self._conteo_segmentos.get(segmento, 0) + 1
+        if momento:
+            ultimo = self._ultimo_momento.get(telefono)
+            if ultimo is not None and momento < ultimo:
+                self._desordenados.add(telefono)
+            else:
+                self._ultimo_momento[telefono] = momento
+
+    def _olvidar(self, telefono: str):
+        self._indice.pop(telefono, None)
+        self._ultimo_momento.pop(telefono, None)
+        self._desordenados.discard(telefono)
+
+    def _ordenar(self, telefono: str):
+        """Deja en orden cronológico las referencias de un teléfono que llegaron desordenadas"""
+        if telefono not in self._desordenados:
+            return
+        refs = self._indice.get(telefono, [])
+        registros = self.leer(refs)
+        orden = sorted(range(len(refs)), key=lambda i: registros[i]['timestamp'])
+        self._indice[telefono] = [refs[i] for i in orden]
+        if registros:
+            self._ultimo_momento[telefono] = registros[orden[-1]]['timestamp']
+        self._desordenados.discard(telefono)
+
+    def referencias(self, telefono: str, limite: Optional[int] = None) -> List[Tuple[str, int]]:
+        """Copia de las referencias de un teléfono (las últimas `limite` si se indica)"""
+        with self._lock.compartido():
+            self._sincronizar_indice()
+            self._ordenar(telefono)
+            refs = self._indice.get(telefono, [])
+            return list(refs[-limite:] if limite else refs)
+
+    def telefonos(self) -> List[str]:
+        """Teléfonos que tienen al menos un mensaje en los segmentos"""
+        with self._lock.compartido():
+            self._sincronizar_indice()
+            return list(self._indice)
+
+    def contar(self, telefono: str) -> int:
+        with self._lock.compartido():
+            self._sincronizar_indice()
+            return len(self._indice.get(telefono, []))
+
+    def _anexar_indice(self, entradas: List[Tuple[str, int, str, str]]):
+        """Agrega entradas (segmento, offset, telefono, timestamp) al índice propio y al índice en memoria"""
+        with open(self.ruta_indice_propio, 'a', encoding='utf-8') as f:
+            f.write(''.join(
+                f"{segmento}\t{offset}\t{telefono}\t{momento}\n" for segmento, offset, telefono, momento in entradas
+            ))
+            posicion = f.tell()
+            inodo = os.fstat(f.fileno()).st_ino
+        if self.multiproceso:
+            # Las entradas propias se leen junto con las de otros en la próxima sincronización
+            return
+        self._leido[self.ruta_indice_propio] = (inodo, posicion)
+        for segmento, offset, telefono, momento in entradas:
+            self._indexar(telefono, segmento, offset, momento)
+
+    def _rutas_indice(self) -> List[str]:
+        """indice.idx y los índices de cada escritor que existan"""
+        rutas = [self.ruta_indice] if os.path.exists(self.ruta_indice) else []
+        rutas.extend(
+            os.path.join(self.ruta_indices, nombre) for nombre in sorted(os.listdir(self.ruta_indices))
+            if nombre.endswith('.idx')
+        )
+        return rutas
+
+    def _leer_indice(self, ruta: str, ultimos: Dict[str, int]):
+        """Incorpora las líneas de un archivo de índice posteriores a la última leída.
+
+        Anota en `ultimos` el último offset leído de cada segmento.
+        """
+        _, posicion = self._leido.get(ruta, (None, 0))
+        try:
+            f = open(ruta, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            inodo = os.fstat(f.fileno()).st_ino
+            f.seek(posicion)
+            for linea in f:
+                if not linea.endswith(b'\n'):
+                    # Otro proceso está escribiendo esta línea; se leerá la próxima vez
+                    break
+                posicion += len(linea)
+                partes = linea.decode('utf-8').rstrip('\n').split('\t')
+                if len(partes) not in (3, 4):
+                    continue
+                # Las líneas de 3 campos (índices anteriores o reescritos) no traen timestamp
+                segmento, offset, telefono = partes[0], int(partes[1]), partes[2]
+                self._indexar(telefono, segmento, offset, partes[3] if len(partes) == 4 else None)
+                ultimos[segmento] = max(ultimos.get(segmento, -1), offset)
+        self._leido[ruta] = (inodo, posicion)
+
+    def _sincronizar_indice(self):
+        """En modo multiproceso, incorpora lo que otros procesos agregaron a sus índices"""
+        if not self.multiproceso:
+            return
+        estados = {}
+        for ruta in self._rutas_indice():
+            try:
+                estados[ruta] = os.stat(ruta)
+            except FileNotFoundError:
+                continue
+        if any(ruta not in estados or estados[ruta].st_ino != inodo for ruta, (inodo, _) in self._leido.items()):
+            # Otro proceso reescribió el índice (retención, archivo o reconstrucción)
+            self._reiniciar_indice()
+        for ruta, estado in estados.items():
+            if estado.st_size > self._leido.get(ruta, (None, 0))[1]:
+                self._leer_indice(ruta, {})
+
+    def _cargar_indice(self):
+        """Carga los índices y los pone al día con lo escrito después en cada segmento"""
+        rutas = self._rutas_indice()
+        if not rutas:
+            self.reconstruir_indice()
+            return
+
+        ultimos: Dict[str, int] = {}
+        for ruta in rutas:
+            self._leer_indice(ruta, ultimos)
+
+        pendientes = []
+        for segmento in self.segmentos():
+            inicio = 0
+            if segmento in ultimos:
+                with open(self.ruta_segmento(segmento), 'rb') as f:
+                    f.seek(ultimos[segmento])
+                    linea = f.readline()
+                try:
+                    valido = linea.endswith(b'\n') and json.loads(linea)['telefono'] in self._indice
+                except (json.JSONDecodeError, KeyError):
+                    valido = False
+                if not valido:
+                    # El segmento fue reescrito sin actualizar el índice
+                    self.reconstruir_indice()
+                    return
+                inicio = ultimos[segmento] + len(linea)
+            pendientes.extend(
+                (segmento, offset, m['telefono'], m['timestamp']) for offset, m in self.escanear(segmento, inicio)
+            )
+
+        if pendientes:
+            self._anexar_indice(pendientes)
+
+    def _reiniciar_indice(self):
+        self._indice = {}
+        self._conteo_segmentos = {}
+        self._ultimo_momento = {}
+        self._desordenados = set()
+        self._leido = {}
+
+    def _guardar_indice(self):
+        """Reescribe indice.idx con todo el índice en memoria y borra los índices de cada escritor.
+
+        Las referencias de cada teléfono se escriben juntas y en orden cronológico; la última
+        lleva su timestamp para seguir detectando entradas desordenadas después de recargar.
+        """
+        ruta_temporal = self.ruta_indice + '.tmp'
+        for telefono in list(self._desordenados):
+            self._ordenar(telefono)
+        with open(ruta_temporal, 'w', encoding='utf-8') as f:
+            for telefono, refs in self._indice.items():
+                for segmento, offset in refs[:-1]:
+                    f.write(f"{segmento}\t{offset}\t{telefono}\n")
+                segmento, offset = refs[-1]
+                momento = self._ultimo_momento.get(telefono)
+                f.write(f"{segmento}\t{offset}\t{telefono}" + (f"\t{momento}\n" if momento else "\n"))
+            leido = (os.fstat(f.fileno()).st_ino, f.tell())
+        os.replace(ruta_temporal, self.ruta_indice)
+        for ruta in self._rutas_indice():
+            if ruta != self.ruta_indice:
+                os.remove(ruta)
+        self._leido = {self.ruta_indice: leido}
+
+    def reconstruir_indice(self):
+        """Reconstruye indice.idx recorriendo todos los segmentos"""
+        with self._lock:
+            self._reiniciar_indice()
+            for segmento in self.segmentos():
+                for offset, m in self.escanear(segmento):
+                    self._indexar(m['telefono'], segmento, offset, m['timestamp'])
+            self._guardar_indice()
@@ -0,0 +1,472 @@
+"""
+Pruebas de comportamiento de BaseDatos sobre directorios temporales (los resúmenes se
+prueban también con BaseDatosSQLite y el rebalanceo con BaseDatosFragmentada).
+
+Uso:
+    python test_base_datos.py
+"""
+
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+import pytz
+
+sys.path.append('.')
+
+from models.usuario import Usuario
+from models.mensaje import Mensaje, TipoMensaje
+from services.base_datos import BaseDatos
+from services.base_datos_fragmentada import BaseDatosFragmentada, rebalancear
+from services.base_datos_sqlite import BaseDatosSQLite
+from services.escritor_asincrono import EscritorAsincrono
+
+ZONA = pytz.timezone('America/Tijuana')
+
+
+def crear_mensaje(telefono: str, contenido: str, momento: datetime, es_bot: bool = False) -> Mensaje:
+    mensaje = Mensaje(telefono=telefono, contenido=contenido, es_bot=es_bot)
+    mensaje.timestamp = momento
+    return mensaje
+
+
+def lineas_segmentos(ruta_datos: str) -> dict:
+    """Contenido en bytes de cada segmento de mensajes"""
+    ruta_mensajes = os.path.join(ruta_datos, "mensajes")
+    contenido = {}
+    for nombre in sorted(os.listdir(ruta_mensajes)):
+        if nombre.endswith('.jsonl'):
+            with open(os.path.join(ruta_mensajes, nombre), 'rb') as f:
+                contenido[nombre] = f.read()
+    return contenido
+
+
+def probar_log_mensajes(ruta_datos: str) -> list:
+    """Los mensajes solo se anexan como líneas JSON y se leen igual que se guardaron"""
+    errores = []
+    ahora = datetime.now(ZONA)
+
+    # Un mensajes.json heredado se pasa a segmentos al abrir la base
+    heredados = [
+        crear_mensaje("111", f"heredado {i}", ahora - timedelta(days=3, minutes=i)).to_dict()
+        for i in range(5)
+    ]
+    with open(os.path.join(ruta_datos, "mensajes.json"), 'w', encoding='utf-8') as f:
+        json.dump(heredados, f)
+
+    bd = BaseDatos(ruta_datos, intervalo_flush=0)
+    if os.path.exists(os.path.join(ruta_datos, "mensajes.json")):
+        errores.append("mensajes.json heredado sigue en su lugar después de migrarlo")
+    historial = [m.contenido for m in bd.obtener_historial_completo("111")]
+    if historial != [f"heredado {i}" for i in reversed(range(5))]:
+        errores.append(f"Historial migrado en otro orden: {historial}")
+
+    for i in range(10):
+        bd.guardar_mensaje(crear_mensaje("222", f"mensaje {i}", ahora + timedelta(seconds=i)))
+    antes = lineas_segmentos(ruta_datos)
+    bd.guardar_mensaje(crear_mensaje("222", "el último", ahora + timedelta(seconds=10)))
+    despues = lineas_segmentos(ruta_datos)
+
+    # Guardar un mensaje no reescribe nada: cada segmento conserva su contenido previo
+    for nombre, contenido in antes.items():
+        if not despues.get(nombre, b'').startswith(contenido):
+            errores.append(f"El segmento {nombre} se reescribió al guardar un mensaje")
+    nuevas = b''.join(despues[n][len(antes.get(n, b'')):] for n in despues)
+    if nuevas.count(b'\n') != 1 or json.loads(nuevas)['contenido'] != "el último":
+        errores.append(f"Se esperaba exactamente una línea nueva, se agregó: {nuevas[:120]!r}")
+
+    lineas = sum(contenido.count(b'\n') for contenido in despues.values())
+    if lineas != 16:
+        errores.append(f"Líneas en los segmentos: {lineas}, esperadas: 16")
+    ultimos = [m.contenido for m in bd.obtener_mensajes_usuario("222", limite=3)]
+    if ultimos != ["mensaje 8", "mensaje 9", "el último"]:
+        errores.append(f"Últimos mensajes: {ultimos}")
+    bd.cerrar()
+
+    # Al reabrir se lee lo mismo
+    bd = BaseDatos(ruta_datos, intervalo_flush=0)
+    if bd.contar_mensajes_usuario("222") != 11:
+        errores.append(f"Después de reabrir: {bd.contar_mensajes_usuario('222')} mensajes de 222, esperados 11")
+    bd.cerrar()
+    return errores
+
+
+def usuarios_en_disco(ruta_datos: str) -> dict:
+    with open(os.path.join(ruta_datos, "usuarios.json"), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def probar_cache_usuarios(ruta_datos: str) -> list:
+    """Los usuarios se escriben en diferido: al expulsarlos de la caché, en el flush y al cerrar"""
+    errores = []
+    bd = BaseDatos(ruta_datos, max_usuarios_cache=3, intervalo_flush=0)
+    bd.guardar_usuario(Usuario(telefono="u0", nombre="Ana"))
+    bd.guardar_usuario(Usuario(telefono="u1", nombre="Beto"))
+    if usuarios_en_disco(ruta_datos):
+        errores.append("usuarios.json se escribió al guardar, antes del flush")
+    if bd.obtener_usuario("u1") is None or bd.obtener_usuario("u1").nombre != "Beto":
+        errores.append("Un usuario pendiente de escribir no se lee desde la caché")
+
+    # Con la caché llena, el usuario expulsado se escribe antes de salir de memoria
+    for i in range(2, 5):
+        bd.guardar_usuario(Usuario(telefono=f"u{i}", nombre=f"Usuario {i}"))
+    en_disco = usuarios_en_disco(ruta_datos)
+    if "u0" not in en_disco:
+        errores.append(f"El usuario expulsado de la caché no llegó a usuarios.json: {sorted(en_disco)}")
+    if len(bd._cache_usuarios) > 3:
+        errores.append(f"La caché tiene {len(bd._cache_usuarios)} usuarios con límite 3")
+    if [bd.obtener_usuario(f"u{i}") is not None for i in range(5)] != [True] * 5:
+        errores.append("No se encuentran todos los usuarios guardados")
+
+    usuario = bd.obtener_usuario("u0")
+    usuario.nombre = "Ana María"
+    bd.guardar_usuario(usuario)
+    bd.cerrar()
+    en_disco = usuarios_en_disco(ruta_datos)
+    if sorted(en_disco) != [f"u{i}" for i in range(5)]:
+        errores.append(f"Al cerrar no se escribieron todos los usuarios: {sorted(en_disco)}")
+    elif en_disco["u0"]["nombre"] != "Ana María":
+        errores.append("Al cerrar no se escribió el último cambio de u0")
+
+    # El hilo de flush escribe sin esperar a que se cierre la base
+    bd = BaseDatos(ruta_datos, intervalo_flush=0.1)
+    bd.guardar_usuario(Usuario(telefono="u5", nombre="Caro"))
+    limite = time.monotonic() + 5
+    while "u5" not in usuarios_en_disco(ruta_datos) and time.monotonic() < limite:
+        time.sleep(0.05)
+    if "u5" not in usuarios_en_disco(ruta_datos):
+        errores.append("El flush periódico no escribió el usuario nuevo")
+    if bd.obtener_estadisticas()['total_usuarios'] != 6:
+        errores.append(f"Estadísticas: {bd.obtener_estadisticas()['total_usuarios']} usuarios, esperados 6")
+    bd.cerrar()
+    return errores
+
+
+def contadores(bd: BaseDatos) -> dict:
+    """Estadísticas en memoria sin los teléfonos por periodo (se podan al guardar)"""
+    return {clave: valor for clave, valor in bd._estadisticas.items() if clave != 'activos'}
+
+
+def probar_estadisticas_incrementales(ruta_datos: str) -> list:
+    """Los contadores mantenidos en cada escritura coinciden con recalcularlos desde cero"""
+    errores = []
+    aleatorio = random.Random(5)
+    ahora = datetime.now(ZONA)
+    tipos = [TipoMensaje.SALUDO, TipoMensaje.CONSULTA_HORARIO, TipoMensaje.CONSULTA_EVENTO, None]
+    bd = BaseDatos(ruta_datos, intervalo_flush=0)
+    lote = []
+    for i in range(600):
+        telefono = f"t{aleatorio.randrange(30)}"
+        momento = ahora - timedelta(hours=aleatorio.randrange(24 * 45))
+        mensaje = crear_mensaje(telefono, f"mensaje {i}", momento, es_bot=i % 2 == 1)
+        mensaje.tipo = aleatorio.choice(tipos)
+        if i % 3:
+            lote.append(mensaje)
+        else:
+            bd.guardar_mensaje(mensaje)
+        if i % 20 == 0:
+            bd.guardar_usuario(Usuario(telefono=telefono))
+    bd.guardar_lote([Usuario(telefono="nuevo")], lote)
+    # "Hoy" es la fecha local del servidor
+    mediodia = ZONA.localize(datetime.now().replace(hour=12, minute=0, second=0, microsecond=0))
+    for i in range(5):
+        bd.guardar_mensaje(crear_mensaje(f"t{i}", "hoy", mediodia))
+
+    incrementales = contadores(bd)
+    estadisticas = bd.obtener_estadisticas()
+    resumenes = {g: bd.obtener_resumenes(ahora.date() - timedelta(days=60), ahora.date(), g)
+                 for g in ('dia', 'semana', 'mes')}
+    bd.reconstruir_estadisticas()
+    if contadores(bd) != incrementales:
+        diferentes = [c for c in incrementales if incrementales[c] != contadores(bd).get(c)]
+        errores.append(f"Contadores incrementales distintos de la reconstrucción en: {diferentes}")
+    if estadisticas['mensajes_hoy'] < 5 or estadisticas['usuarios_activos_hoy'] < 5:
+        errores.append(f"Estadísticas de hoy incompletas: {estadisticas}")
+    bd.cerrar()
+
+    # Lo persistido se lee igual al reabrir
+    bd = BaseDatos(ruta_datos, intervalo_flush=0)
+    if bd.obtener_estadisticas() != estadisticas:
+        errores.append(f"Después de reabrir: {bd.obtener_estadisticas()} en lugar de {estadisticas}")
+    for granularidad, esperados in resumenes.items():
+        if bd.obtener_resumenes(ahora.date() - timedelta(days=60), ahora.date(), granularidad) != esperados:
+            errores.append(f"Los resúmenes por {granularidad} cambiaron al reabrir")
+
+    # Borrar teléfonos y segmentos vencidos descuenta lo mismo que recalcular
+    bd.eliminar_telefonos(["t1", "t2", "t3"])
+    bd.limpiar_mensajes_antiguos(30)
+    incrementales = contadores(bd)
+    bd.reconstruir_estadisticas()
+    for clave in ('total_usuarios', 'total_mensajes', 'por_dia', 'contabilizado'):
+        if contadores(bd)[clave] != incrementales[clave]:
+            errores.append(f"Después de borrar, '{clave}' no coincide con la reconstrucción")
+    bd.cerrar()
+    return errores
+
+
+def probar_archivo_usuarios(ruta_datos: str) -> list:
+    """Los usuarios inactivos pasan al archivo dbm intactos y vuelven al escribir de nuevo"""
+    errores = []
+    bd = BaseDatos(ruta_datos, intervalo_flush=0)
+    originales = {}
+    for i in range(10):
+        usuario = Usuario(telefono=f"u{i}", nombre=f"Usuario {i}", carrera="Sistemas", semestre=i % 8 + 1)
+        usuario.agregar_conversacion(f"c{i}")
+        if i < 6:
+            usuario.ultima_interaccion = datetime.now() - timedelta(days=40 + i)
+        bd.guardar_usuario(usuario)
+        originales[usuario.telefono] = usuario.to_dict()
+
+    archivados = bd.archivar_usuarios_inactivos(30)
+    if archivados != 6:
+        errores.append(f"Se archivaron {archivados} usuarios, esperados 6")
+    en_disco = usuarios_en_disco(ruta_datos)
+    if sorted(en_disco) != [f"u{i}" for i in range(6, 10)]:
+        errores.append(f"usuarios.json debería tener solo a los activos: {sorted(en_disco)}")
+    if sorted(bd._archivo_usuarios.telefonos()) != [f"u{i}" for i in range(6)]:
+        errores.append(f"Archivo de inactivos: {sorted(bd._archivo_usuarios.telefonos())}")
+
+    # Ida y vuelta por el archivo sin perder datos
+    for telefono, datos in originales.items():
+        usuario = bd.obtener_usuario(telefono)
+        if usuario is None or usuario.to_dict() != datos:
+            errores.append(f"{telefono} cambió al pasar por el archivo: {usuario and usuario.to_dict()}")
+    if len(bd.obtener_todos_usuarios()) != 10 or bd.obtener_estadisticas()['total_usuarios'] != 10:
+        errores.append("Los usuarios archivados dejaron de contarse")
+
+    # Un usuario archivado que vuelve a escribir regresa a usuarios.json
+    usuario = bd.obtener_usuario("u2")
+    usuario.actualizar_interaccion()
+    bd.guardar_usuario(usuario)
+    bd.cerrar()
+    bd = BaseDatos(ruta_datos, intervalo_flush=0)
+    if "u2" not in usuarios_en_disco(ruta_datos) or "u2" in bd._archivo_usuarios.telefonos():
+        errores.append("u2 no volvió a usuarios.json después de su nueva interacción")
+    if bd._archivo_usuarios.contar() != 5 or bd.obtener_estadisticas()['total_usuarios'] != 10:
+        errores.append(f"Después de reabrir: {bd._archivo_usuarios.contar()} archivados, "
+                       f"{bd.obtener_estadisticas()['total_usuarios']} usuarios")
+    if bd.archivar_usuarios_inactivos(30) != 0:
+        errores.append("Se volvió a archivar a alguien sin cambios en su actividad")
+    bd.cerrar()
+    return errores
+
+
+def probar_reintento_lote(ruta_datos: str) -> list:
+    """Si el flush de un lote falla, el escritor lo reintenta sin volver a anexar sus mensajes"""
+    errores = []
+    bd = BaseDatos(ruta_datos, intervalo_flush=0)
+    flush = bd.flush
+    fallas = []
+
+    def flush_con_fallas():
+        if len(fallas) < 3:
+            fallas.append(1)
+            raise OSError("disco lleno")
+        flush()
+
+    bd.flush = flush_con_fallas
+    ahora = datetime.now(ZONA)
+    mensajes = [crear_mensaje("r1", f"mensaje {i}", ahora + timedelta(seconds=i)) for i in range(6)]
+
+    async def escribir() -> int:
+        escritor = EscritorAsincrono(bd, durabilidad='fsync', reintento_inicial=0.01)
+        await escritor.iniciar()
+        futuros = [await escritor.guardar_usuario(Usuario(telefono="r1"))]
+        for mensaje in mensajes[:3]:
+            futuros.append(await escritor.guardar_mensaje(mensaje))
+        await asyncio.sleep(0.1)
+        for mensaje in mensajes[3:]:
+            futuros.append(await escritor.guardar_mensaje(mensaje))
+        await escritor.detener()
+        # Los futuros del primer intento fallan; lo que importa es lo que quedó escrito
+        await asyncio.gather(*futuros, return_exceptions=True)
+        return escritor.fallos
+
+    fallos = asyncio.run(escribir())
+    if fallos != 3:
+        errores.append(f"El escritor registró {fallos} lotes fallidos, esperados 3")
+    lineas = sum(contenido.count(b'\n') for contenido in lineas_segmentos(ruta_datos).values())
+    contenidos = [m.contenido for m in bd.obtener_historial_completo("r1")]
+    if lineas != len(mensajes) or contenidos != [m.contenido for m in mensajes]:
+        errores.append(f"{lineas} líneas en disco; historial: {contenidos}")
+    if bd.obtener_estadisticas()['total_mensajes'] != len(mensajes):
+        errores.append(f"Estadísticas: {bd.obtener_estadisticas()['total_mensajes']} mensajes, "
+                       f"esperados {len(mensajes)}")
+    if "r1" not in usuarios_en_disco(ruta_datos):
+        errores.append("El usuario del lote fallido no llegó a usuarios.json")
+    bd.cerrar()
+    return errores
+
+
+def probar_eliminar_telefonos(ruta_datos: str) -> list:
+    """Al borrar teléfonos, los mensajes de los demás en los mismos segmentos se siguen encontrando"""
+    errores = []
+    bd = BaseDatos(ruta_datos, intervalo_flush=0)
+    ahora = datetime.now(ZONA)
+    for i, telefono in enumerate(["A", "B", "A", "B"]):
+        bd.guardar_mensaje(crear_mensaje(telefono, f"trámite de credencial {i}", ahora + timedelta(seconds=i)))
+    encontrados = sorted(m.telefono for m, _ in bd.buscar_mensajes("credencial"))
+    if encontrados != ["A", "A", "B", "B"]:
+        errores.append(f"Antes de borrar se encontraron: {encontrados}")
+
+    bd.eliminar_telefonos({"B"})
+    encontrados = [m.contenido for m, _ in bd.buscar_mensajes("credencial")]
+    if sorted(encontrados) != ["trámite de credencial 0", "trámite de credencial 2"]:
+        errores.append(f"Después de borrar B, la búsqueda devolvió: {encontrados}")
+    bd.cerrar()
+
+    # El índice guardado al cerrar ya tiene los offsets del segmento reescrito
+    bd = BaseDatos(ruta_datos, intervalo_flush=0)
+    encontrados = [m.contenido for m, _ in bd.buscar_mensajes("credencial")]
+    if sorted(encontrados) != ["trámite de credencial 0", "trámite de credencial 2"]:
+        errores.append(f"Después de reabrir, la búsqueda devolvió: {encontrados}")
+    bd.cerrar()
+    return errores
+
+
+def probar_rebalanceo(ruta_datos: str) -> list:
+    """El historial que llega a otro fragmento al rebalancear queda en orden cronológico y se puede buscar"""
+    errores = []
+    anteriores = {nombre: os.path.join(ruta_datos, nombre) for nombre in ("a", "b")}
+    bd = BaseDatosFragmentada(anteriores)
+    # Mismos días en ambos fragmentos, con horas intercaladas
+    inicio = ZONA.localize(datetime(2026, 3, 10, 8, 0))
+    esperados = 0
+    for i in range(40):
+        telefono = f"52{i % 8:03d}"
+        bd.guardar_mensaje(crear_mensaje(telefono, f"consulta de credencial {i}", inicio + timedelta(hours=i * 1.5)))
+        esperados += 1
+    if {bd.anillo.nodo(f"52{i:03d}") for i in range(8)} != {"a", "b"}:
+        errores.append("Los teléfonos de prueba no quedaron repartidos en ambos fragmentos")
+    # Buscar carga el índice de cada fragmento, que se guarda al cerrar con los offsets de antes
+    if len(bd.buscar_mensajes("credencial", limite=100)) != esperados:
+        errores.append("Antes de rebalancear la búsqueda no encontró todos los mensajes")
+    bd.cerrar()
+
+    resumen = rebalancear(anteriores, {"b": anteriores["b"]})
+    if resumen['telefonos'] == 0:
+        errores.append("El rebalanceo no movió ningún teléfono")
+
+    destino = BaseDatos(anteriores["b"], intervalo_flush=0)
+    momentos = [m.timestamp for m in destino.iterar_mensajes()]
+    if len(momentos) != esperados:
+        errores.append(f"El destino tiene {len(momentos)} mensajes, esperados {esperados}")
+    desordenados = [(a.isoformat(), b.isoformat()) for a, b in zip(momentos, momentos[1:]) if b < a]
+    if desordenados:
+        errores.append(f"Mensajes fuera de orden después del rebalanceo: {desordenados[:3]}")
+    encontrados = destino.buscar_mensajes("credencial", limite=100)
+    if len(encontrados) != esperados:
+        errores.append(f"La búsqueda encontró {len(encontrados)} mensajes, esperados {esperados}")
+    elif any(not m.contenido.startswith("consulta de credencial") for m, _ in encontrados):
+        errores.append("La búsqueda devolvió mensajes de offsets que ya no les corresponden")
+    destino.cerrar()
+    return errores
+
+
+def resumenes_esperados(mensajes: list) -> dict:
+    """Resúmenes calculados directamente de los mensajes, sin pasar por la base"""
+    esperados = {granularidad: defaultdict(lambda: {'mensajes': 0, 'telefonos': set(), 'tipos': Counter()})
+                 for granularidad in ('dia', 'semana', 'mes')}
+    for mensaje in mensajes:
+        fecha = mensaje.timestamp.date()
+        anio, semana, _ = fecha.isocalendar()
+        for granularidad, clave in (('dia', fecha.isoformat()), ('semana', f"{anio}-W{semana:02d}"),
+                                    ('mes', fecha.isoformat()[:7])):
+            resumen = esperados[granularidad][clave]
+            resumen['mensajes'] += 1
+            resumen['telefonos'].add(mensaje.telefono)
+            if not mensaje.es_bot and mensaje.tipo:
+                resumen['tipos'][mensaje.tipo.value] += 1
+    return {
+        granularidad: [
+            {'periodo': clave, 'mensajes': r['mensajes'], 'usuarios_activos': len(r['telefonos']),
+             'tipos': dict(r['tipos'])}
+            for clave, r in sorted(resumenes.items())
+        ]
+        for granularidad, resumenes in esperados.items()
+    }
+
+
+def probar_resumenes(ruta_datos: str) -> list:
+    """Los resúmenes por día, semana y mes coinciden con contar los mensajes, en ambos backends"""
+    errores = []
+    aleatorio = random.Random(18)
+    ahora = datetime.now(ZONA)
+    tipos = [TipoMensaje.SALUDO, TipoMensaje.CONSULTA_CARRERA, TipoMensaje.OTRO, None]
+    mensajes = []
+    for i in range(800):
+        mensaje = crear_mensaje(f"t{aleatorio.randrange(25)}", f"mensaje {i}",
+                                ahora - timedelta(hours=aleatorio.randrange(24 * 90)), es_bot=i % 3 == 0)
+        mensaje.tipo = aleatorio.choice(tipos)
+        mensajes.append(mensaje)
+    # Los que llegan después de reabrir caen en periodos abiertos
+    mediodia = ZONA.localize(datetime.now().replace(hour=12, minute=0, second=0, microsecond=0))
+    despues = [crear_mensaje(f"t{i}", "después de reabrir", mediodia) for i in range(20, 30)]
+
+    esperados = resumenes_esperados(mensajes + despues)
+    desde, hasta = (ahora - timedelta(days=100)).date(), max(ahora.date(), mediodia.date())
+    for clase in (BaseDatos, BaseDatosSQLite):
+        ruta = os.path.join(ruta_datos, clase.__name__)
+        bd = clase(ruta) if clase is BaseDatosSQLite else clase(ruta, intervalo_flush=0)
+        bd.guardar_lote([], mensajes[:400])
+        for mensaje in mensajes[400:]:
+            bd.guardar_mensaje(mensaje)
+        bd.cerrar()
+        bd = clase(ruta) if clase is BaseDatosSQLite else clase(ruta, intervalo_flush=0)
+        bd.guardar_lote([], despues)
+        for granularidad, esperado in esperados.items():
+            obtenidos = bd.obtener_resumenes(desde, hasta, granularidad)
+            if obtenidos != esperado:
+                distintos = [r['periodo'] for r in obtenidos if r not in esperado]
+                errores.append(f"{clase.__name__}: resúmenes por {granularidad} distintos en {distintos[:5]}")
+            if sum(r['mensajes'] for r in obtenidos) != len(mensajes) + len(despues):
+                errores.append(f"{clase.__name__}: el total por {granularidad} no suma todos los mensajes")
+        # Un rango parcial devuelve solo los periodos que se traslapan con él
+        parcial = bd.obtener_resumenes(hasta - timedelta(days=6), hasta, 'dia')
+        if parcial != [r for r in esperados['dia'] if r['periodo'] >= (hasta - timedelta(days=6)).isoformat()]:
+            errores.append(f"{clase.__name__}: el rango de los últimos 7 días no coincide")
+        bd.cerrar()
+    return errores
+
+
+PRUEBAS = [
+    ("Log de mensajes solo de anexado", probar_log_mensajes),
+    ("Caché de usuarios con escritura diferida", probar_cache_usuarios),
+    ("Estadísticas incrementales", probar_estadisticas_incrementales),
+    ("Archivo de usuarios inactivos", probar_archivo_usuarios),
+    ("Resúmenes por periodo", probar_resumenes),
+    ("Lote reintentado sin duplicar mensajes", probar_reintento_lote),
+    ("Búsqueda después de borrar teléfonos", probar_eliminar_telefonos),
+    ("Orden cronológico después de rebalancear", probar_rebalanceo),
+]
+
+
+def main():
+    print("=" * 60)
+    print("🧪 PRUEBAS DE BaseDatos")
+    print("=" * 60)
+
+    todo_bien = True
+    for nombre, prueba in PRUEBAS:
+        ruta_datos = tempfile.mkdtemp(prefix="chatbot_prueba_")
+        try:
+            errores = prueba(ruta_datos)
+        finally:
+            shutil.rmtree(ruta_datos, ignore_errors=True)
+        print(f"\n{'✅' if not errores else '❌'} {nombre}")
+        for error in errores:
+            print(f"   ❌ {error}")
+        todo_bien = todo_bien and not errores
+
+    sys.exit(0 if todo_bien else 1)
+
+
+if __name__ == "__main__":
+    main()
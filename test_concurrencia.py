@@ -0,0 +1,138 @@
+"""
+Prueba de estrés: varios procesos escribiendo a la vez en el mismo directorio de datos
+con BaseDatos en modo multiproceso (como `uvicorn --workers N`).
+
+Uso:
+    python test_concurrencia.py --procesos 4 --mensajes 2000
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from multiprocessing import Process
+
+sys.path.append('.')
+
+from models.usuario import Usuario
+from models.mensaje import Mensaje
+from services.base_datos import BaseDatos
+
+
+def escritor(ruta_datos: str, proceso: int, mensajes: int, telefonos: int):
+    """Escribe `mensajes` mensajes repartidos entre `telefonos` usuarios propios del proceso"""
+    bd = BaseDatos(ruta_datos, intervalo_flush=1, multiproceso=True)
+    for i in range(mensajes):
+        telefono = f"p{proceso}-{i % telefonos}"
+        usuario = bd.obtener_usuario(telefono)
+        if not usuario:
+            usuario = Usuario(telefono=telefono)
+        usuario.actualizar_interaccion()
+        bd.guardar_usuario(usuario)
+        bd.guardar_mensaje(Mensaje(telefono=telefono, contenido=f"mensaje {i} del proceso {proceso}"))
+    bd.cerrar()
+
+
+def ejecutar(ruta_datos: str, procesos: int, mensajes: int, telefonos: int) -> float:
+    workers = [
+        Process(target=escritor, args=(ruta_datos, p, mensajes, telefonos))
+        for p in range(procesos)
+    ]
+    inicio = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    duracion = time.perf_counter() - inicio
+    if any(w.exitcode != 0 for w in workers):
+        raise SystemExit("❌ Algún proceso terminó con error")
+    return duracion
+
+
+def verificar(ruta_datos: str, procesos: int, mensajes: int, telefonos: int) -> list:
+    """Revisa que no se haya perdido ni corrompido nada; devuelve la lista de errores"""
+    errores = []
+    esperados = procesos * mensajes
+
+    ruta_mensajes = os.path.join(ruta_datos, "mensajes")
+    lineas = 0
+    for nombre in os.listdir(ruta_mensajes):
+        if not nombre.endswith('.jsonl'):
+            continue
+        with open(os.path.join(ruta_mensajes, nombre), 'rb') as f:
+            for linea in f:
+                try:
+                    json.loads(linea)
+                    lineas += 1
+                except json.JSONDecodeError:
+                    errores.append(f"Línea corrupta en {nombre}: {linea[:80]!r}")
+    if lineas != esperados:
+        errores.append(f"Mensajes en disco: {lineas}, esperados: {esperados}")
+
+    bd = BaseDatos(ruta_datos, intervalo_flush=0, multiproceso=True)
+    stats = bd.obtener_estadisticas()
+    if stats['total_mensajes'] != esperados:
+        errores.append(f"Estadísticas: {stats['total_mensajes']} mensajes, esperados: {esperados}")
+    if stats['total_usuarios'] != procesos * telefonos:
+        errores.append(f"Estadísticas: {stats['total_usuarios']} usuarios, esperados: {procesos * telefonos}")
+
+    usuarios = bd.obtener_todos_usuarios()
+    if len(usuarios) != procesos * telefonos:
+        errores.append(f"Usuarios guardados: {len(usuarios)}, esperados: {procesos * telefonos}")
+
+    por_telefono = mensajes // telefonos
+    for p in range(procesos):
+        for t in range(telefonos):
+            telefono = f"p{p}-{t}"
+            cuenta = bd.contar_mensajes_usuario(telefono)
+            if cuenta < por_telefono:
+                errores.append(f"Índice: {telefono} tiene {cuenta} mensajes, esperados al menos {por_telefono}")
+            momentos = [m.timestamp for m in bd.obtener_historial_completo(telefono)]
+            if momentos != sorted(momentos):
+                errores.append(f"Historial: los mensajes de {telefono} no están en orden cronológico")
+    bd.cerrar()
+
+    # Cada proceso fusionó sus contadores con los del archivo en vez de pisarlos
+    with open(os.path.join(ruta_datos, "estadisticas.json"), encoding='utf-8') as f:
+        guardadas = json.load(f)
+    if guardadas['total_mensajes'] != esperados:
+        errores.append(f"estadisticas.json: {guardadas['total_mensajes']} mensajes, esperados: {esperados}")
+    return errores
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de estrés multiproceso de BaseDatos")
+    parser.add_argument('--procesos', type=int, default=4)
+    parser.add_argument('--mensajes', type=int, default=1000, help="Mensajes por proceso")
+    parser.add_argument('--telefonos', type=int, default=20, help="Usuarios por proceso")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("🧪 PRUEBA DE CONCURRENCIA - BaseDatos multiproceso")
+    print("=" * 60)
+
+    todo_bien = True
+    for procesos in sorted({1, args.procesos}):
+        ruta_datos = tempfile.mkdtemp(prefix="chatbot_concurrencia_")
+        try:
+            duracion = ejecutar(ruta_datos, procesos, args.mensajes, args.telefonos)
+            total = procesos * args.mensajes
+            print(f"\n{procesos} proceso(s): {total} mensajes en {duracion:.2f}s "
+                  f"({total / duracion:.0f} mensajes/s)")
+            errores = verificar(ruta_datos, procesos, args.mensajes, args.telefonos)
+            for error in errores:
+                print(f"   ❌ {error}")
+            if not errores:
+                print("   ✅ Sin pérdidas ni corrupción")
+            todo_bien = todo_bien and not errores
+        finally:
+            shutil.rmtree(ruta_datos, ignore_errors=True)
+
+    sys.exit(0 if todo_bien else 1)
+
+
+if __name__ == "__main__":
+    main()
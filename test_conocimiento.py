@@ -0,0 +1,164 @@
+"""
+Pruebas de las instantáneas de conocimiento y de su carga desde filas de Google Sheets.
+
+Uso:
+    python test_conocimiento.py
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+sys.path.append('.')
+
+from models.conocimiento import AlmacenConocimiento, Carrera
+from services.cargador_conocimiento import CargadorConocimiento
+
+
+def carreras(*nombres: str) -> list:
+    return [{'Nombre': nombre, 'Duracion_Semestres': 8, 'Descripción': f"Carrera de {nombre}"} for nombre in nombres]
+
+
+def servicios(*nombres: str) -> list:
+    return [{'Nombre': nombre, 'Descripcion': f"Servicio de {nombre}", 'Lugar': "Edificio A"} for nombre in nombres]
+
+
+def probar_instantaneas(ruta: str) -> list:
+    """Cada recarga publica una instantánea nueva; las anteriores no cambian ni se pueden modificar"""
+    errores = []
+    almacen = AlmacenConocimiento()
+    cargador = CargadorConocimiento(almacen, ruta_instantanea=os.path.join(ruta, "conocimiento.pkl"))
+    cargador.cargar(None, None, carreras("Sistemas", "Civil"), servicios("Biblioteca"), None)
+    fijada = almacen.actual
+    version = fijada.version
+
+    for intento, modificar in (
+        ("agregar_carrera", lambda: fijada.agregar_carrera(Carrera("Química", 8))),
+        ("asignar en carreras", lambda: fijada.carreras.__setitem__("x", None)),
+        ("agregar a eventos", lambda: fijada.agregar_evento(None)),
+    ):
+        try:
+            modificar()
+            errores.append(f"Se pudo modificar la instantánea publicada ({intento})")
+        except (TypeError, AttributeError):
+            pass
+
+    cargador.cargar(None, None, carreras("Sistemas", "Civil", "Industrial"), servicios("Biblioteca"), None)
+    nueva = almacen.actual
+    if nueva.version != version + 1:
+        errores.append(f"Versión {nueva.version} después de recargar, esperada {version + 1}")
+    if sorted(fijada.carreras) != ["civil", "sistemas"] or fijada.version != version:
+        errores.append(f"La instantánea anterior cambió: {sorted(fijada.carreras)} v{fijada.version}")
+    if nueva.servicios is not fijada.servicios:
+        errores.append("Una pestaña sin cambios no se compartió con la instantánea anterior")
+    if nueva.carreras["sistemas"] is not fijada.carreras["sistemas"]:
+        errores.append("Una fila sin cambios se volvió a construir")
+
+    # Un lector nunca ve una instantánea a medias mientras se recarga
+    pares = {2: 1, 4: 3}
+    detener = threading.Event()
+    vistas = []
+
+    def leer():
+        while not detener.is_set():
+            actual = almacen.actual
+            vistas.append((len(actual.carreras), len(actual.servicios)))
+
+    lectores = [threading.Thread(target=leer) for _ in range(3)]
+    for lector in lectores:
+        lector.start()
+    for i in range(40):
+        if i % 2:
+            cargador.cargar(None, None, carreras("A", "B"), servicios("S1"), None)
+        else:
+            cargador.cargar(None, None, carreras("A", "B", "C", "D"), servicios("S1", "S2", "S3"), None)
+    detener.set()
+    for lector in lectores:
+        lector.join()
+    incompletas = {vista for vista in vistas if pares.get(vista[0]) != vista[1] and vista != (3, 1)}
+    if incompletas:
+        errores.append(f"Los lectores vieron instantáneas mezcladas: {sorted(incompletas)}")
+
+    # La instantánea guardada se restaura con su versión y su hash
+    restaurado = AlmacenConocimiento()
+    if not CargadorConocimiento(restaurado, ruta_instantanea=os.path.join(ruta, "conocimiento.pkl")).cargar_instantanea():
+        errores.append("No se pudo restaurar la instantánea guardada")
+    elif (restaurado.version, restaurado.actual.hash_contenido) != (almacen.version, almacen.actual.hash_contenido):
+        errores.append(f"Instantánea restaurada v{restaurado.version}, esperada v{almacen.version}")
+    return errores
+
+
+def probar_payload_repetido(ruta: str) -> list:
+    """Un payload idéntico al último aplicado no se vuelve a procesar"""
+    errores = []
+    almacen = AlmacenConocimiento()
+    cargador = CargadorConocimiento(almacen)
+    cargas = []
+    cargar = cargador.cargar
+
+    def contar_carga(*args, **kwargs):
+        cargas.append(args)
+        return cargar(*args, **kwargs)
+
+    cargador.cargar = contar_carga
+
+    if cargador.cargar_payload(None, None, carreras("Sistemas"), servicios("Biblioteca"), None) is None:
+        errores.append("El primer payload no se aplicó")
+    version = almacen.version
+    confirmado = cargador.confirmado
+    # Mismo contenido en listas nuevas, como llega en cada webhook
+    if cargador.cargar_payload(None, None, carreras("Sistemas"), servicios("Biblioteca"), None) is not None:
+        errores.append("Un payload idéntico se volvió a procesar")
+    if len(cargas) != 1 or almacen.version != version:
+        errores.append(f"Con el payload repetido hubo {len(cargas)} cargas y versión {almacen.version}")
+    if cargador.confirmado is None or cargador.confirmado < confirmado:
+        errores.append("El payload repetido no renovó la confirmación contra la fuente")
+
+    cargador.cargar_payload(None, None, carreras("Sistemas", "Civil"), servicios("Biblioteca"), None)
+    if almacen.version != version + 1 or len(almacen.actual.carreras) != 2:
+        errores.append("Un payload distinto no publicó una versión nueva")
+
+    # Si otra fuente publicó una versión, el mismo payload vuelve a aplicarse
+    cargador.cargar(None, None, carreras("Industrial"), None, None)
+    cargas.clear()
+    cargador.cargar_payload(None, None, carreras("Sistemas", "Civil"), servicios("Biblioteca"), None)
+    if len(cargas) != 1 or sorted(almacen.actual.carreras) != ["civil", "sistemas"]:
+        errores.append("El payload no se aplicó después de que otra fuente publicó una versión")
+
+    # Las pestañas que no vienen en el payload se conservan
+    cargador.cargar_payload(None, None, None, servicios("Biblioteca", "Cafetería"), None)
+    if sorted(almacen.actual.carreras) != ["civil", "sistemas"] or len(almacen.actual.servicios) != 2:
+        errores.append("Una pestaña ausente del payload se vació o el resto no se aplicó")
+    return errores
+
+
+PRUEBAS = [
+    ("Instantáneas inmutables con cambio atómico", probar_instantaneas),
+    ("Payload repetido sin recarga", probar_payload_repetido),
+]
+
+
+def main():
+    print("=" * 60)
+    print("🧪 PRUEBAS DE CONOCIMIENTO")
+    print("=" * 60)
+
+    todo_bien = True
+    for nombre, prueba in PRUEBAS:
+        ruta = tempfile.mkdtemp(prefix="chatbot_conocimiento_")
+        try:
+            errores = prueba(ruta)
+        finally:
+            shutil.rmtree(ruta, ignore_errors=True)
+        print(f"\n{'✅' if not errores else '❌'} {nombre}")
+        for error in errores:
+            print(f"   ❌ {error}")
+        todo_bien = todo_bien and not errores
+
+    sys.exit(0 if todo_bien else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Prueba de GoogleSheetsReader contra un servicio de Sheets falso en memoria (sin red ni
+credenciales): get_all_data debe traer todas las pestañas configuradas en una sola llamada
+a batchGet y dar los mismos registros que read_range pestaña por pestaña.
+
+Uso:
+    python test_google_sheets.py
+"""
+
+import asyncio
+import sys
+
+sys.path.append('.')
+
+from services.google_sheets_reader import GoogleSheetsReader, DEFAULT_TABS
+from services.actualizador_conocimiento import ActualizadorConocimiento, PESTANAS
+
+
+HOJA = {
+    'Horarios': [
+        ['Servicio', 'Dias', 'Hora_Inicio', 'Hora_Fin', 'Notas'],
+        ['Biblioteca', 'Lunes-Viernes', '08:00', '20:00', 'Cerrado en vacaciones'],
+        ['Cafetería', 'Lunes-Sábado', '07:00', '15:00'],
+    ],
+    'Eventos': [
+        ['Nombre', 'Descripcion', 'Fecha_Inicio', 'Fecha_Fin', 'Lugar', 'Categoria'],
+        ['Feria de empleo', 'Empresas de la región', '15/11/2026', '16/11/2026', 'Gimnasio', 'Académico'],
+    ],
+    'Carreras': [
+        ['Nombre', 'Duracion', 'Descripcion', 'Perfil_Egreso'],
+        ['Ingeniería en Software', '9', 'Desarrollo de sistemas', 'Ingeniero de software'],
+    ],
+    'Avisos': [
+        ['Aviso'],
+        ['Nadie debería leer esta pestaña'],
+    ],
+    'Servicios': [
+        ['Nombre', 'Descripcion', 'Pagos', 'Dias', 'Lugar'],
+        ['Constancia de estudios', 'Documento oficial', '$50', '3 días hábiles'],
+    ],
+    'Suspensiones': [
+        ['Fecha', 'Suspension'],
+    ],
+}
+
+
+class PeticionFalsa:
+    def __init__(self, respuesta=None, error=None):
+        self.respuesta = respuesta
+        self.error = error
+
+    def execute(self):
+        if self.error:
+            raise self.error
+        return self.respuesta
+
+
+class ServicioSheetsFalso:
+    """Imita spreadsheets().values().get/batchGet y cuenta las llamadas"""
+
+    def __init__(self, hoja, error=None):
+        self.hoja = hoja
+        self.error = error
+        self.llamadas = []
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def _valores(self, rango):
+        nombre = rango.split('!')[0].strip("'")
+        return {'range': rango, 'values': [list(fila) for fila in self.hoja.get(nombre, [])]}
+
+    def get(self, spreadsheetId, range):
+        self.llamadas.append(('get', [range]))
+        return PeticionFalsa(self._valores(range), self.error)
+
+    def batchGet(self, spreadsheetId, ranges):
+        self.llamadas.append(('batchGet', list(ranges)))
+        return PeticionFalsa({'valueRanges': [self._valores(rango) for rango in ranges]}, self.error)
+
+
+def probar_lectura_en_lote() -> list:
+    errores = []
+    servicio = ServicioSheetsFalso(HOJA)
+    lector = GoogleSheetsReader(None, 'hoja-falsa', service=servicio)
+    datos = lector.get_all_data()
+
+    if len(servicio.llamadas) != 1 or servicio.llamadas[0][0] != 'batchGet':
+        errores.append(f"Se esperaba una sola llamada a batchGet, hubo: {servicio.llamadas}")
+    if sorted(datos) != sorted(t.lower() for t in DEFAULT_TABS):
+        errores.append(f"Pestañas leídas: {sorted(datos)}")
+    if any('Avisos' in rango for _, rangos in servicio.llamadas for rango in rangos):
+        errores.append("Se pidió la pestaña Avisos")
+
+    for nombre in DEFAULT_TABS:
+        esperado = lector.read_range(nombre)
+        if datos[nombre.lower()] != esperado:
+            errores.append(f"{nombre}: batchGet dio {datos[nombre.lower()]}, read_range dio {esperado}")
+
+    cafeteria = datos['horarios'][1]
+    if cafeteria.get('Notas') != '':
+        errores.append(f"Las filas cortas deben completarse con '': {cafeteria}")
+    if datos['suspensiones'] != []:
+        errores.append(f"Una pestaña solo con encabezados debe quedar vacía: {datos['suspensiones']}")
+    return errores
+
+
+def probar_pestanas_configurables() -> list:
+    errores = []
+    servicio = ServicioSheetsFalso(HOJA)
+    lector = GoogleSheetsReader(None, 'hoja-falsa', tabs=['Eventos', 'Suspensiones'], service=servicio)
+    datos = lector.get_all_data()
+    if sorted(datos) != ['eventos', 'suspensiones']:
+        errores.append(f"Con tabs=['Eventos', 'Suspensiones'] se leyeron: {sorted(datos)}")
+    if servicio.llamadas != [('batchGet', ["'Eventos'!A:Z", "'Suspensiones'!A:Z"])]:
+        errores.append(f"Rangos pedidos: {servicio.llamadas}")
+    return errores
+
+
+def probar_errores() -> list:
+    """batch_read propaga los errores de la API para que no se pierdan los datos anteriores"""
+    errores = []
+    lector = GoogleSheetsReader(None, 'hoja-falsa', service=ServicioSheetsFalso(HOJA, RuntimeError("cuota agotada")))
+    try:
+        lector.get_all_data()
+        errores.append("get_all_data no propagó el error de la API")
+    except RuntimeError:
+        pass
+    return errores
+
+
+def probar_actualizador() -> list:
+    """Cada actualización del conocimiento pide todas las pestañas vencidas en una sola llamada"""
+    errores = []
+    servicio = ServicioSheetsFalso(HOJA)
+    lector = GoogleSheetsReader(None, 'hoja-falsa', service=servicio)
+    cargas = []
+
+    def leer(pestanas):
+        leidas = lector.batch_read([PESTANAS[p] for p in pestanas])
+        return {p: leidas[PESTANAS[p]] for p in pestanas}
+
+    async def correr():
+        actualizador = ActualizadorConocimiento(leer, cargas.append, ttl=60)
+        await actualizador.iniciar()
+        await asyncio.sleep(0.2)
+        await actualizador.detener()
+
+    asyncio.run(correr())
+    if len(servicio.llamadas) != 1:
+        errores.append(f"La primera actualización hizo {len(servicio.llamadas)} llamadas")
+    if not cargas or len(cargas[0]['horarios']) != 2:
+        errores.append(f"No se cargaron los horarios: {cargas}")
+    return errores
+
+
+def main():
+    print("=" * 60)
+    print("🧪 PRUEBA DE GoogleSheetsReader CON UN SERVICIO FALSO")
+    print("=" * 60)
+
+    todo_bien = True
+    for prueba in (probar_lectura_en_lote, probar_pestanas_configurables, probar_errores, probar_actualizador):
+        errores = prueba()
+        print(f"\n{prueba.__name__}")
+        for error in errores:
+            print(f"   ❌ {error}")
+        if not errores:
+            print("   ✅ OK")
+        todo_bien = todo_bien and not errores
+
+    sys.exit(0 if todo_bien else 1)
+
+
+if __name__ == "__main__":
+    main()
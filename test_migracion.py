@@ -0,0 +1,196 @@
+"""
+Pruebas de la migración de mensajes.json/usuarios.json heredados (services/migracion.py).
+
+Uso:
+    python test_migracion.py
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import pytz
+
+sys.path.append('.')
+
+from models.usuario import Usuario
+from models.mensaje import Mensaje
+import services.migracion as modulo_migracion
+from services.base_datos import crear_base_datos
+from services.base_datos_sqlite import BaseDatosSQLite
+from services.migracion import Migracion
+
+ZONA = pytz.timezone('America/Tijuana')
+MENSAJES = 250
+USUARIOS = 40
+
+
+def crear_heredados(ruta: str):
+    """mensajes.json y usuarios.json como los dejaba la versión anterior, con un registro inválido"""
+    os.makedirs(ruta, exist_ok=True)
+    ahora = datetime.now(ZONA)
+    mensajes = []
+    for i in range(MENSAJES):
+        mensaje = Mensaje(telefono=f"52{i % USUARIOS:03d}", contenido=f"mensaje {i}", es_bot=i % 2 == 1)
+        mensaje.timestamp = ahora - timedelta(minutes=MENSAJES - i)
+        mensajes.append(mensaje.to_dict())
+    mensajes.append({'contenido': "sin teléfono ni fecha"})
+    usuarios = {f"52{i:03d}": Usuario(telefono=f"52{i:03d}", nombre=f"Usuario {i}").to_dict()
+                for i in range(USUARIOS)}
+    with open(os.path.join(ruta, "mensajes.json"), 'w', encoding='utf-8') as f:
+        json.dump(mensajes, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(ruta, "usuarios.json"), 'w', encoding='utf-8') as f:
+        json.dump(usuarios, f, ensure_ascii=False, indent=2)
+
+
+def revisar_destino(backend: str, destino: str) -> list:
+    errores = []
+    bd = crear_base_datos(backend, destino)
+    estadisticas = bd.obtener_estadisticas()
+    if estadisticas['total_mensajes'] != MENSAJES:
+        errores.append(f"{backend}: {estadisticas['total_mensajes']} mensajes, esperados {MENSAJES}")
+    if estadisticas['total_usuarios'] != USUARIOS:
+        errores.append(f"{backend}: {estadisticas['total_usuarios']} usuarios, esperados {USUARIOS}")
+    historial = [m.contenido for m in bd.obtener_historial_completo("52007")]
+    esperado = [f"mensaje {i}" for i in range(7, MENSAJES, USUARIOS)]
+    if historial != esperado:
+        errores.append(f"{backend}: historial de 52007 distinto: {historial}")
+    bd.cerrar()
+    return errores
+
+
+def probar_migracion(ruta: str) -> list:
+    """Migra a cada backend en otro directorio y verifica conteos e historiales"""
+    errores = []
+    origen = os.path.join(ruta, "origen")
+    crear_heredados(origen)
+    for backend in ('json', 'sqlite'):
+        destino = os.path.join(ruta, backend)
+        if not Migracion(origen, destino, backend, tamano_lote=32).ejecutar():
+            errores.append(f"{backend}: la migración no verificó los conteos")
+        errores += revisar_destino(backend, destino)
+    if not os.path.exists(os.path.join(origen, "mensajes.json")):
+        errores.append("Se movió el mensajes.json de origen aunque el destino era otro directorio")
+    return errores
+
+
+def probar_migracion_en_sitio(ruta: str) -> list:
+    """Con el backend JSON en el mismo directorio, los mensajes se pasan a segmentos al abrir"""
+    errores = []
+    crear_heredados(ruta)
+    if not Migracion(ruta, ruta, 'json').ejecutar():
+        errores.append("La migración en sitio no verificó los conteos")
+    if os.path.exists(os.path.join(ruta, "mensajes.json")):
+        errores.append("mensajes.json sigue en su lugar después de migrar en sitio")
+    return errores + revisar_destino('json', ruta)
+
+
+def probar_reanudar(ruta: str) -> list:
+    """Una migración interrumpida a la mitad se reanuda sin perder ni duplicar registros"""
+    errores = []
+    origen = os.path.join(ruta, "origen")
+    destino = os.path.join(ruta, "destino")
+    crear_heredados(origen)
+
+    guardar_lote = BaseDatosSQLite.guardar_lote
+    llamadas = []
+
+    def falla_al_cuarto(self, *args, **kwargs):
+        llamadas.append(1)
+        if len(llamadas) == 4:
+            return False
+        return guardar_lote(self, *args, **kwargs)
+
+    BaseDatosSQLite.guardar_lote = falla_al_cuarto
+    try:
+        Migracion(origen, destino, 'sqlite', tamano_lote=32).ejecutar()
+        errores.append("La migración no se detuvo cuando falló un lote")
+    except RuntimeError:
+        pass
+    finally:
+        BaseDatosSQLite.guardar_lote = guardar_lote
+
+    migracion = Migracion(origen, destino, 'sqlite', tamano_lote=32)
+    if not migracion.progreso.get('mensajes.json', {}).get('bytes'):
+        errores.append(f"No quedó registrado el progreso de la primera corrida: {migracion.progreso}")
+    if not migracion.ejecutar():
+        errores.append("La migración reanudada no verificó los conteos")
+    return errores + revisar_destino('sqlite', destino)
+
+
+def probar_caida_antes_del_progreso(ruta: str) -> list:
+    """Si el proceso muere con un lote escrito pero sin anotarlo en el progreso, al reanudar no se duplica"""
+    errores = []
+    origen = os.path.join(ruta, "origen")
+    crear_heredados(origen)
+    guardar_progreso = Migracion._guardar_progreso
+    crear = modulo_migracion.crear_base_datos
+    for backend in ('json', 'sqlite'):
+        destino = os.path.join(ruta, backend)
+        abiertas = []
+
+        def abrir(*args, **kwargs):
+            abiertas.append(crear(*args, **kwargs))
+            return abiertas[-1]
+
+        def muere_en_el_cuarto_lote(self):
+            # El cuarto lote de mensajes ya está escrito con fsync cuando se anotaría
+            if self.progreso.get('mensajes.json', {}).get('registros') == 4 * 32:
+                raise KeyboardInterrupt
+            guardar_progreso(self)
+
+        modulo_migracion.crear_base_datos = abrir
+        Migracion._guardar_progreso = muere_en_el_cuarto_lote
+        try:
+            Migracion(origen, destino, backend, tamano_lote=32).ejecutar()
+            errores.append(f"{backend}: la migración no se interrumpió")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            Migracion._guardar_progreso = guardar_progreso
+            modulo_migracion.crear_base_datos = crear
+            for bd in abiertas:
+                bd.cerrar()
+
+        migracion = Migracion(origen, destino, backend, tamano_lote=32)
+        if migracion.progreso.get('mensajes.json', {}).get('registros') != 3 * 32:
+            errores.append(f"{backend}: progreso antes de reanudar: {migracion.progreso.get('mensajes.json')}")
+        if not migracion.ejecutar():
+            errores.append(f"{backend}: la migración reanudada no verificó los conteos")
+        errores += revisar_destino(backend, destino)
+    return errores
+
+
+PRUEBAS = [
+    ("Migración a JSON y SQLite", probar_migracion),
+    ("Migración en sitio", probar_migracion_en_sitio),
+    ("Migración reanudada", probar_reanudar),
+    ("Reanudar tras morir antes de anotar el progreso", probar_caida_antes_del_progreso),
+]
+
+
+def main():
+    print("=" * 60)
+    print("🧪 PRUEBAS DE MIGRACIÓN")
+    print("=" * 60)
+
+    todo_bien = True
+    for nombre, prueba in PRUEBAS:
+        ruta = tempfile.mkdtemp(prefix="chatbot_migracion_")
+        try:
+            errores = prueba(ruta)
+        finally:
+            shutil.rmtree(ruta, ignore_errors=True)
+        print(f"\n{'✅' if not errores else '❌'} {nombre}")
+        for error in errores:
+            print(f"   ❌ {error}")
+        todo_bien = todo_bien and not errores
+
+    sys.exit(0 if todo_bien else 1)
+
+
+if __name__ == "__main__":
+    main()